@@ -0,0 +1,284 @@
+"""
+Agrégats de marché tenus à jour à l'écriture, pour les tableaux de bord.
+
+- ``market_listings`` : une ligne par annonce et par mois où elle a été vue
+  (premier prix du mois) ; c'est la table de faits, source des agrégats ;
+- ``market_aggregates`` : par mois, ville, type de bien et statut (vente /
+  location) : nombre d'annonces, sommes (prix moyen, prix/m² moyen) et
+  esquisses de quantiles ; chaque lot écrit n'y ajoute que les annonces
+  nouvelles du mois, dans la même transaction ;
+- ``market_stats`` : vue lisible (médianes, moyennes) pour les tableaux de
+  bord, qui ne lisent plus la table des annonces.
+
+Esquisses : histogrammes à seuils logarithmiques (erreur relative
+SKETCH_ALPHA sur chaque quantile), en JSONB ``{"seuil": effectif}``. Elles
+s'additionnent : ``sketch_merge`` (deux esquisses), ``sketch_union``
+(agrégat SQL) et ``sketch_quantile`` permettent une médiane sur plusieurs
+mois ou villes sans revenir aux annonces :
+
+    SELECT sketch_quantile(sketch_union(price_sketch), 0.5)
+    FROM market_aggregates WHERE city = 'Almadies' AND month >= '2025-01-01';
+
+``scrapy aggregates --rebuild`` recalcule tout depuis ``market_listings``
+en une requête ensembliste (``--backfill`` la remplit d'abord depuis
+``listings`` et l'historique des prix).
+"""
+import math
+
+from scrapping_immobli.db import BulkWriter
+
+SKETCH_ALPHA = 0.01
+SKETCH_GAMMA = (1 + SKETCH_ALPHA) / (1 - SKETCH_ALPHA)
+
+FACT_COLUMNS = ("id", "city", "property_type", "statut", "price", "surface_area", "scraped_at")
+DIMENSIONS = "month, city, property_type, statut"
+# colonnes de market_listings depuis une source ayant les colonnes des items
+FACT_INSERT = "INSERT INTO market_listings (month, id, city, property_type, statut, price, surface_area, scraped_at)"
+FACT_SELECT = (
+    "date_trunc('month', scraped_at)::date, id, COALESCE(city, ''),"
+    " COALESCE(property_type, ''), COALESCE(statut, ''), price, surface_area, scraped_at"
+)
+
+AGGREGATES_DDL = f"""
+    -- plusieurs spiders ouvrent en même temps (crawlall) : CREATE OR REPLACE
+    -- FUNCTION concurrents échouent (« tuple concurrently updated »)
+    SELECT pg_advisory_xact_lock(hashtext('market_aggregates'));
+    CREATE TABLE IF NOT EXISTS market_listings(
+        month DATE NOT NULL,
+        id VARCHAR(32) NOT NULL,
+        city VARCHAR(100) NOT NULL,
+        property_type VARCHAR(100) NOT NULL,
+        statut VARCHAR(50) NOT NULL,
+        price INTEGER,
+        surface_area REAL,
+        scraped_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (month, id)
+    );
+    CREATE TABLE IF NOT EXISTS market_aggregates(
+        month DATE NOT NULL,
+        city VARCHAR(100) NOT NULL,
+        property_type VARCHAR(100) NOT NULL,
+        statut VARCHAR(50) NOT NULL,
+        listings INTEGER NOT NULL,
+        price_count INTEGER NOT NULL,
+        price_sum BIGINT NOT NULL,
+        ppsm_count INTEGER NOT NULL,
+        ppsm_sum DOUBLE PRECISION NOT NULL,
+        price_sketch JSONB NOT NULL,
+        ppsm_sketch JSONB NOT NULL,
+        updated_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (month, city, property_type, statut)
+    );
+
+    CREATE OR REPLACE FUNCTION sketch_merge(a JSONB, b JSONB) RETURNS JSONB
+    LANGUAGE sql IMMUTABLE AS $$
+        SELECT COALESCE(jsonb_object_agg(key, n), '{{}}'::jsonb) FROM (
+            SELECT key, SUM(value::bigint) AS n FROM (
+                SELECT * FROM jsonb_each_text(COALESCE(a, '{{}}'::jsonb))
+                UNION ALL
+                SELECT * FROM jsonb_each_text(COALESCE(b, '{{}}'::jsonb))
+            ) kv GROUP BY key
+        ) s
+    $$;
+    CREATE OR REPLACE AGGREGATE sketch_union(JSONB) (SFUNC = sketch_merge, STYPE = JSONB);
+    -- seuil k = ]gamma^(k-1), gamma^k] ; estimation 2 gamma^k / (gamma + 1)
+    CREATE OR REPLACE FUNCTION sketch_quantile(sketch JSONB, q DOUBLE PRECISION)
+    RETURNS DOUBLE PRECISION LANGUAGE sql IMMUTABLE AS $$
+        SELECT 2 * power({SKETCH_GAMMA!r}, k) / ({SKETCH_GAMMA!r} + 1) FROM (
+            SELECT key::int AS k,
+                   SUM(value::bigint) OVER (ORDER BY key::int) AS cumulative,
+                   SUM(value::bigint) OVER () AS total
+            FROM jsonb_each_text(sketch)
+        ) s
+        WHERE cumulative >= q * total ORDER BY k LIMIT 1
+    $$;
+
+    CREATE OR REPLACE VIEW market_stats AS
+        SELECT month,
+               NULLIF(city, '') AS city,
+               NULLIF(property_type, '') AS property_type,
+               NULLIF(statut, '') AS statut,
+               listings,
+               round(sketch_quantile(price_sketch, 0.5)) AS median_price,
+               round(price_sum::numeric / NULLIF(price_count, 0)) AS avg_price,
+               round(sketch_quantile(ppsm_sketch, 0.5)) AS median_price_m2,
+               round((ppsm_sum / NULLIF(ppsm_count, 0))::numeric) AS avg_price_m2,
+               updated_at
+        FROM market_aggregates;
+"""
+
+
+def _bucket(expr):
+    return f"ceil(ln({expr}) / ln({SKETCH_GAMMA!r}))::int"
+
+
+def aggregate_sql(facts):
+    """
+    Fusion dans ``market_aggregates`` des faits de la CTE ``facts``
+    (colonnes : month, city, property_type, statut, price, surface_area).
+    À placer après ``WITH`` et d'éventuelles CTE précédentes.
+    """
+    return f"""
+        facts AS ({facts}),
+        measures AS (
+            SELECT {DIMENSIONS}, price,
+                   CASE WHEN price > 0 AND surface_area > 0 THEN price / surface_area END AS ppsm
+            FROM facts
+        ), totals AS (
+            SELECT {DIMENSIONS}, COUNT(*) AS listings,
+                   COUNT(price) AS price_count, COALESCE(SUM(price), 0) AS price_sum,
+                   COUNT(ppsm) AS ppsm_count, COALESCE(SUM(ppsm), 0) AS ppsm_sum
+            FROM measures GROUP BY {DIMENSIONS}
+        ), price_sketches AS (
+            SELECT {DIMENSIONS}, jsonb_object_agg(bucket, n) AS sketch FROM (
+                SELECT {DIMENSIONS}, {_bucket("price")} AS bucket, COUNT(*) AS n
+                FROM measures WHERE price > 0 GROUP BY {DIMENSIONS}, bucket
+            ) b GROUP BY {DIMENSIONS}
+        ), ppsm_sketches AS (
+            SELECT {DIMENSIONS}, jsonb_object_agg(bucket, n) AS sketch FROM (
+                SELECT {DIMENSIONS}, {_bucket("ppsm")} AS bucket, COUNT(*) AS n
+                FROM measures WHERE ppsm > 0 GROUP BY {DIMENSIONS}, bucket
+            ) b GROUP BY {DIMENSIONS}
+        )
+        INSERT INTO market_aggregates AS a
+            ({DIMENSIONS}, listings, price_count, price_sum, ppsm_count, ppsm_sum,
+             price_sketch, ppsm_sketch, updated_at)
+        SELECT t.month, t.city, t.property_type, t.statut, t.listings,
+               t.price_count, t.price_sum, t.ppsm_count, t.ppsm_sum,
+               COALESCE(p.sketch, '{{}}'::jsonb), COALESCE(s.sketch, '{{}}'::jsonb),
+               now() AT TIME ZONE 'utc'
+        FROM totals t
+        LEFT JOIN price_sketches p USING ({DIMENSIONS})
+        LEFT JOIN ppsm_sketches s USING ({DIMENSIONS})
+        -- ordre fixe : deux lots concurrents verrouillent les lignes dans le même ordre
+        ORDER BY t.month, t.city, t.property_type, t.statut
+        ON CONFLICT ({DIMENSIONS}) DO UPDATE SET
+            listings = a.listings + EXCLUDED.listings,
+            price_count = a.price_count + EXCLUDED.price_count,
+            price_sum = a.price_sum + EXCLUDED.price_sum,
+            ppsm_count = a.ppsm_count + EXCLUDED.ppsm_count,
+            ppsm_sum = a.ppsm_sum + EXCLUDED.ppsm_sum,
+            price_sketch = sketch_merge(a.price_sketch, EXCLUDED.price_sketch),
+            ppsm_sketch = sketch_merge(a.ppsm_sketch, EXCLUDED.ppsm_sketch),
+            updated_at = EXCLUDED.updated_at;
+    """
+
+
+def create_tables(conn):
+    with conn.cursor() as cur:
+        cur.execute(AGGREGATES_DDL)
+    conn.commit()
+
+
+def backfill(conn, tables):
+    """
+    Remplit ``market_listings`` depuis l'historique des prix (un fait par
+    mois où le prix a été observé) puis depuis les tables d'annonces ``tables``.
+    Retourne le nombre de faits ajoutés.
+    """
+    added = 0
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('listing_observations')")
+        has_history = cur.fetchone()[0] is not None
+        for table in tables:
+            cur.execute("SELECT to_regclass(%s)", (table,))
+            if cur.fetchone()[0] is None:
+                continue
+            if has_history:
+                cur.execute(f"""
+                    {FACT_INSERT}
+                    SELECT date_trunc('month', o.scraped_at)::date, o.id, COALESCE(t.city, ''),
+                           COALESCE(t.property_type, ''), COALESCE(o.statut, ''),
+                           o.price, t.surface_area, o.scraped_at
+                    FROM listing_observations o JOIN {table} t ON t.id = o.id
+                    ORDER BY o.scraped_at
+                    ON CONFLICT DO NOTHING
+                """)
+                added += cur.rowcount
+            cur.execute(f"""
+                {FACT_INSERT}
+                SELECT {FACT_SELECT} FROM {table}
+                WHERE scraped_at IS NOT NULL
+                ON CONFLICT DO NOTHING
+            """)
+            added += cur.rowcount
+    conn.commit()
+    return added
+
+
+def rebuild(conn):
+    """Recalcule ``market_aggregates`` depuis ``market_listings``, d'un bloc."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('market_aggregates'))")
+        cur.execute("TRUNCATE market_aggregates")
+        cur.execute("WITH " + aggregate_sql(
+            f"SELECT {DIMENSIONS}, price, surface_area FROM market_listings"
+        ))
+        cur.execute("SELECT COUNT(*) FROM market_aggregates")
+        groups = cur.fetchone()[0]
+    conn.commit()
+    return groups
+
+
+# ----------------------------------------------------------------------
+# Lecture côté Python (esquisses chargées depuis JSONB)
+# ----------------------------------------------------------------------
+def merge_sketches(*sketches):
+    merged = {}
+    for sketch in sketches:
+        for bucket, count in sketch.items():
+            merged[int(bucket)] = merged.get(int(bucket), 0) + count
+    return merged
+
+
+def sketch_quantile(sketch, q):
+    """Même estimation que la fonction SQL ``sketch_quantile``."""
+    total = sum(sketch.values())
+    if not total:
+        return None
+    cumulative = 0
+    for bucket in sorted(sketch, key=int):
+        cumulative += sketch[bucket]
+        if cumulative >= q * total:
+            return 2 * math.pow(SKETCH_GAMMA, int(bucket)) / (SKETCH_GAMMA + 1)
+
+
+# ----------------------------------------------------------------------
+# Mise à jour à l'écriture
+# ----------------------------------------------------------------------
+class AggregateWriter(BulkWriter):
+    """
+    BulkWriter pour ``market_listings`` : les annonces nouvelles du mois
+    (ON CONFLICT DO NOTHING ... RETURNING) sont agrégées et fusionnées dans
+    ``market_aggregates`` par la même requête. Une annonce revue dans le
+    mois ne compte donc qu'une fois, avec son premier prix.
+    """
+
+    def __init__(self, pool, **kwargs):
+        super().__init__(pool, "market_listings", FACT_COLUMNS, conflict_column="id", **kwargs)
+
+    def _aggregate_sql(self, source):
+        return f"""
+            WITH new AS (
+                {FACT_INSERT}
+                SELECT {FACT_SELECT} FROM {source}
+                ORDER BY scraped_at
+                ON CONFLICT DO NOTHING
+                RETURNING {DIMENSIONS}, price, surface_area
+            ),
+        """ + aggregate_sql("SELECT * FROM new")
+
+    def _merge_sql(self):
+        return self._aggregate_sql(self.staging)
+
+    def _upsert_sql(self):
+        placeholders = ", ".join(["%s"] * len(self.columns))
+        return self._aggregate_sql(f"(VALUES ({placeholders})) AS v ({self._column_list})")
+
+    def _staging_sql(self):
+        # month est calculé à la fusion : la table de transit ne reprend que
+        # les colonnes des items, sans contrainte
+        return f"""
+            CREATE TEMP TABLE IF NOT EXISTS {self.staging} ON COMMIT DELETE ROWS
+            AS SELECT {self._column_list} FROM market_listings WITH NO DATA;
+        """
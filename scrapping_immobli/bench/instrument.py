@@ -0,0 +1,134 @@
+"""
+Composants Scrapy du benchmark hors ligne :
+
+- ``FixtureRedirectMiddleware`` : envoie chaque requête vers le serveur de
+  fixtures local, puis rend à la réponse son URL d'origine (les spiders ne
+  voient aucune différence) ;
+- ``CallbackTimingMiddleware`` : temps CPU passé dans chaque callback
+  (``parse``, ``parse_detail``), appel et itération du résultat compris ;
+- ``TimedItemPipelineManager`` : temps CPU passé dans chaque pipeline.
+
+Les temps sont cumulés dans ``STAGE_CPU[(spider, étape)] = [secondes, appels]``
+par la méthode ``record`` (redéfinie par scrapping_immobli.metrics pour
+alimenter les histogrammes).
+"""
+import inspect
+import time
+from collections import defaultdict
+from functools import wraps
+from urllib.parse import urlsplit
+
+from scrapy.pipelines import ItemPipelineManager
+
+STAGE_CPU = defaultdict(lambda: [0.0, 0])
+
+
+def _record(spider_name, stage, seconds, calls=1):
+    entry = STAGE_CPU[(spider_name, stage)]
+    entry[0] += seconds
+    entry[1] += calls
+
+
+class FixtureRedirectMiddleware:
+
+    def __init__(self, port):
+        self.base = f"http://127.0.0.1:{port}"
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings.getint("FIXTURE_SERVER_PORT"))
+
+    def process_request(self, request, spider):
+        if "fixture_origin" in request.meta:
+            return None
+        parts = urlsplit(request.url)
+        local = f"{self.base}/{parts.netloc}{parts.path or '/'}"
+        if parts.query:
+            local += f"?{parts.query}"
+        meta = dict(request.meta, fixture_origin=request.url, allow_offsite=True)
+        return request.replace(url=local, meta=meta, dont_filter=True)
+
+    def process_response(self, request, response, spider):
+        origin = request.meta.get("fixture_origin")
+        if origin is None:
+            return response
+        return response.replace(url=origin)
+
+
+class CallbackTimingMiddleware:
+    """
+    Temps CPU de chaque callback : l'appel lui-même (un callback peut tout
+    faire avant de rendre une liste, cf. ``ImmoSpider.parse_detail``) puis
+    l'itération de son résultat (générateur). Le callback de la requête est
+    enveloppé dans ``process_spider_input``, juste avant que Scrapy l'appelle.
+    """
+
+    def record(self, spider, stage, seconds):
+        _record(spider.name, stage, seconds)
+
+    def process_spider_input(self, response, spider):
+        request = response.request
+        stage = getattr(request.callback, "__name__", None) or "parse"
+        request.callback = self._timed(request.callback or spider._parse, spider, stage)
+        return None
+
+    def _timed(self, callback, spider, stage):
+        @wraps(callback)
+        def timed(*args, **kwargs):
+            start = time.process_time()
+            output = callback(*args, **kwargs)
+            elapsed = time.process_time() - start
+            if hasattr(output, "__aiter__"):
+                return self._timed_async(output, spider, stage, elapsed)
+            if output is None or inspect.isawaitable(output):
+                # coroutine (pool de parsing) : l'extraction tourne hors du processus
+                self.record(spider, stage, elapsed)
+                return output
+            return self._timed_iter(output, spider, stage, elapsed)
+        timed.__name__ = stage  # « parse » quand la requête n'a pas de callback
+        return timed
+
+    def _timed_iter(self, result, spider, stage, elapsed):
+        iterator = iter(result)
+        while True:
+            start = time.process_time()
+            try:
+                obj = next(iterator)
+            except StopIteration:
+                self.record(spider, stage, elapsed + time.process_time() - start)
+                return
+            elapsed += time.process_time() - start
+            yield obj
+
+    async def _timed_async(self, result, spider, stage, elapsed):
+        iterator = result.__aiter__()
+        while True:
+            start = time.process_time()
+            try:
+                obj = await iterator.__anext__()
+            except StopAsyncIteration:
+                self.record(spider, stage, elapsed + time.process_time() - start)
+                return
+            elapsed += time.process_time() - start
+            yield obj
+
+
+class TimedItemPipelineManager(ItemPipelineManager):
+
+    def _add_middleware(self, pipe):
+        if hasattr(pipe, "process_item"):
+            pipe.process_item = self._timed(pipe.process_item, type(pipe).__name__)
+        super()._add_middleware(pipe)
+
+    def record(self, spider, stage, seconds):
+        _record(spider.name, stage, seconds)
+
+    def _timed(self, method, name):
+        @wraps(method)
+        def process_item(item, spider):
+            start = time.process_time()
+            try:
+                return method(item, spider)
+            finally:
+                self.record(spider, name, time.process_time() - start)
+        return process_item
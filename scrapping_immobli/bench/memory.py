@@ -0,0 +1,138 @@
+"""
+Mémoire par URL vue, par item en cours et par réponse gardée.
+
+- URL vues : ``--urls`` empreintes MD5 dans l'ancien ``set`` de chaînes
+  hexadécimales, dans un ``set`` de ``bytes`` et dans seen.DigestSet ;
+- items : fiches des fixtures extraites comme dans ``parse_detail``, puis
+  rangées en ``scrapy.Item`` ou en item compact (items.record_class) ; le
+  conteneur est mesuré à part des valeurs (chaînes, nombres), communes aux
+  deux ;
+- réponses : RSS d'une réponse seule, puis avec son arbre lxml en cache
+  (``response.selector``), tel qu'il restait attaché pendant les pipelines.
+
+Python (tracemalloc) pour les deux premiers ; RSS, dans un processus neuf
+par site, pour le troisième (lxml alloue hors de l'allocateur Python, et
+la mémoire rendue par un site serait réutilisée par le suivant).
+
+Usage ::
+
+    python -m scrapping_immobli.bench.memory --urls 1000000 --items 2000
+"""
+import argparse
+import gc
+import hashlib
+import sys
+import tracemalloc
+
+from scrapy.http import HtmlResponse, Request
+from scrapy.spiderloader import SpiderLoader
+from scrapy.utils.project import get_project_settings
+
+from scrapping_immobli.bench import server
+from scrapping_immobli.items import record_class
+from scrapping_immobli.memory import rss_bytes
+from scrapping_immobli.parsepool import create_executor
+from scrapping_immobli.seen import DigestSet
+
+
+def _retained(build):
+    """(résultat, octets Python encore alloués après ``build()``)."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def _digests(count):
+    for n in range(count):
+        yield hashlib.md5(f"https://bench.invalid/annonce/{n}".encode()).digest()
+
+
+def _fill(container, values):
+    for value in values:
+        container.add(value)
+    return container
+
+
+def seen_urls(count):
+    print(f"URL vues ({count:,})")
+    variants = [
+        ("set de str hexa (avant)", lambda: _fill(set(), (d.hex() for d in _digests(count)))),
+        ("set de bytes", lambda: _fill(set(), _digests(count))),
+        ("DigestSet", lambda: _fill(DigestSet(), _digests(count))),
+    ]
+    for label, build in variants:
+        result, size = _retained(build)
+        print(f"  {label:<26} {size / count:8.1f} octets/URL")
+        del result
+
+
+def _responses(host, count):
+    site = server.SITES[host]
+    responses = []
+    for n in range(count):
+        url = f"https://{host}{site.detail_path.format(id=1000 + n)}"
+        request = Request(url, meta={"title": f"Annonce {n}"})
+        responses.append(HtmlResponse(url, body=server.render_detail(host, 1000 + n),
+                                      encoding="utf-8", request=request))
+    return responses
+
+
+def items_in_flight(spidercls, host, count):
+    spider = spidercls()
+    responses = _responses(host, count)
+    values = []
+    for response in responses:
+        fields, _ = spider.detail_schema.extract_html(response.body, response.encoding)
+        fields["url"], fields["source"] = response.url, spider.name
+        spider.complete_item(fields, response)
+        values.append(fields)
+    payload = sum(sum(sys.getsizeof(v) for v in fields.values()) for fields in values)
+
+    record = record_class(spider.item_class)
+    items, item_bytes = _retained(lambda: [spider.item_class(fields) for fields in values])
+    del items
+    records, record_bytes = _retained(lambda: [record(fields) for fields in values])
+    del records
+    print(f"  item Scrapy {item_bytes / count:8.0f}  item compact {record_bytes / count:6.0f}"
+          f"  valeurs {payload / count:6.0f} octets/item")
+
+    executor = create_executor(1)
+    try:
+        body, tree = executor.submit(response_trees, host, count).result()
+    finally:
+        executor.shutdown()
+    print(f"  réponse : corps {body:8.0f}  arbre lxml en cache {tree:8.0f} octets/réponse")
+
+
+def response_trees(host, count):
+    """(corps, arbre lxml) en octets par réponse ; exécuté dans un processus neuf."""
+    responses = _responses(host, count)
+    gc.collect()
+    before = rss_bytes()
+    selectors = [response.selector for response in responses]
+    tree = (rss_bytes() - before) / count
+    del selectors
+    return sum(len(response.body) for response in responses) / count, tree
+
+
+def main(args):
+    seen_urls(args.urls)
+    loader = SpiderLoader.from_settings(get_project_settings())
+    for host, site in server.SITES.items():
+        print(f"\n{site.spider} ({args.items} fiches)")
+        items_in_flight(loader.load(site.spider), host, args.items)
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--urls", type=int, default=1_000_000)
+    parser.add_argument("--items", type=int, default=2000)
+    main(parser.parse_args())
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,157 @@
+"""
+Latence de la recherche plein texte selon le nombre d'annonces.
+
+Des annonces synthétiques (mêmes valeurs que le serveur de fixtures) sont
+indexées dans un schéma jetable ``bench_search`` par paliers (``--sizes``) ;
+à chaque palier, chaque requête est chronométrée de deux façons :
+
+- ``tsvector`` : ``listing_search`` (index GIN, classement ts_rank_cd) ;
+- ``ILIKE``    : ``description ILIKE '%…%'`` sur une table de même forme
+  que les tables des sites (parcours complet), l'ancienne méthode.
+
+L'ILIKE ne classe pas : il s'arrête aux 20 premières lignes trouvées, ce
+qui l'avantage sur les mots fréquents ; il n'a ni racinisation, ni
+tolérance aux accents, ni « R+2 » = « R + 2 ».
+
+Usage ::
+
+    python -m scrapping_immobli.bench.search --sizes 1000 10000 100000
+"""
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import psycopg2
+from scrapy.utils.project import get_project_settings
+
+from scrapping_immobli.bench.server import listing_values
+from scrapping_immobli.db import copy_rows
+from scrapping_immobli.search import (
+    SEARCH_COLUMNS, create_tables, merge_sql, search, search_row, staging_sql,
+)
+
+SCHEMA = "bench_search"
+# (requête websearch, motifs ILIKE équivalents, filtres) : mots fréquents
+# (un quart des annonces), combinaisons rares, filtres
+QUERIES = [
+    ("piscine", ["%piscine%"], {}),
+    ('"vue mer"', ["%vue mer%"], {}),
+    ("R+2 gardien", ["%R+2%", "%gardien%"], {}),
+    ("villa 6 chambres somone", ["%villa%", "%6 chambres%", "%somone%"], {}),
+    ("piscine terrasse jardin", ["%piscine%", "%terrasse%", "%jardin%"], {}),
+    ("meublé climatisation", ["%meublé%", "%climatisation%"], {"city": "Almadies"}),
+    ("piscine", ["%piscine%"], {"max_price": 20_000_000}),
+]
+EPOCH = datetime(2025, 1, 1)
+
+
+def _item(n):
+    values = listing_values(n)
+    return {
+        "id": f"{n:032x}",
+        "source": ("coinafrique_html", "expat_dakar", "loger_dakar")[n % 3],
+        "url": f"https://bench.invalid/annonce/{n}",
+        "title": values["title"],
+        "description": values["description"],
+        "price": values["price"],
+        "surface_area": values["surface"],
+        "bedrooms": values["bedrooms"],
+        "city": values["city"],
+        "adresse": values["adresse"],
+        "property_type": values["property_type"],
+        "statut": values["statut"],
+        "content_hash": n,
+        "scraped_at": EPOCH + timedelta(minutes=n),
+    }
+
+
+def _load(conn, start, stop, chunk=5000):
+    for first in range(start, stop, chunk):
+        items = [_item(n) for n in range(first, min(first + chunk, stop))]
+        rows = [search_row(item) for item in items]
+        with conn.cursor() as cur:
+            copy_rows(cur, "_bench_staging", SEARCH_COLUMNS,
+                      [tuple(row[col] for col in SEARCH_COLUMNS) for row in rows])
+            cur.execute(merge_sql("_bench_staging"))
+            copy_rows(cur, "ads", ("id", "title", "description", "city", "price"),
+                      [(i["id"], i["title"], i["description"], i["city"], i["price"]) for i in items])
+        conn.commit()
+
+
+def _ilike(conn, patterns, filters):
+    where = ["description ILIKE %s"] * len(patterns)
+    params = list(patterns)
+    if filters.get("city"):
+        where.append("city = %s")
+        params.append(filters["city"])
+    if filters.get("max_price"):
+        where.append("price <= %s")
+        params.append(filters["max_price"])
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT id, title, price FROM ads WHERE {' AND '.join(where)} LIMIT 20", params)
+        rows = cur.fetchall()
+    conn.commit()
+    return rows
+
+
+def _timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000, len(result)
+
+
+def main(args):
+    db = json.loads(args.database) if args.database else get_project_settings().getdict("DATABASE")
+    conn = psycopg2.connect(**db)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}")
+            cur.execute(f"SET search_path = {SCHEMA}, public")
+            cur.execute("CREATE TABLE ads (id VARCHAR(32) PRIMARY KEY, title TEXT,"
+                        " description TEXT, city VARCHAR(100), price INTEGER)")
+        conn.commit()
+        create_tables(conn)
+        with conn.cursor() as cur:
+            cur.execute(staging_sql("_bench_staging"))
+        conn.commit()
+
+        print(f"{'annonces':>9}  {'requête':<32} {'tsvector':>10} {'ILIKE':>10} {'résultats':>9}")
+        loaded = 0
+        for size in sorted(args.sizes):
+            start = time.perf_counter()
+            _load(conn, loaded, size)
+            load_seconds = time.perf_counter() - start
+            loaded = size
+            with conn.cursor() as cur:
+                cur.execute("ANALYZE listing_search; ANALYZE ads")
+            conn.commit()
+            for text, patterns, filters in QUERIES:
+                label = text + "".join(f" {key}={value}" for key, value in filters.items())
+                fts_ms, found = _timed(lambda: search(conn, text, **filters), args.repeat)
+                ilike_ms, _ = _timed(lambda: _ilike(conn, patterns, filters), args.repeat)
+                print(f"{size:>9}  {label[:32]:<32} {fts_ms:>8.2f}ms {ilike_ms:>8.2f}ms {found:>9}")
+            print(f"{'':>9}  (indexation : {size / max(load_seconds, 1e-9):,.0f} annonces/s)")
+    finally:
+        if not args.keep:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+            conn.commit()
+        conn.close()
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=15)
+    parser.add_argument("--database", help="paramètres psycopg2 en JSON (défaut : DATABASE)")
+    parser.add_argument("--keep", action="store_true", help="garder le schéma bench_search")
+    main(parser.parse_args())
+
+
+if __name__ == "__main__":
+    run()
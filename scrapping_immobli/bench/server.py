@@ -0,0 +1,204 @@
+"""
+Serveur HTTP local qui remplace les trois sites pour les benchmarks.
+
+Les pages sont générées à partir des gabarits de ``fixtures/<spider>/``
+(listing, vignette, pagination, fiche) : chaque fiche reçoit des valeurs
+déterministes (prix, pièces, surface, quartier…) tirées de son identifiant.
+Les URL servies sont de la forme ``http://127.0.0.1:<port>/<hôte d'origine>/<chemin>``
+(cf. FixtureRedirectMiddleware).
+
+Usage ::
+
+    python -m scrapping_immobli.bench.server --port 8765 --depth 20 --latency 0.05
+"""
+import argparse
+import random
+import re
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from string import Template
+from urllib.parse import urlsplit
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+CITIES = [
+    ("Almadies", "Dakar"), ("Ngor", "Dakar"), ("Ouakam", "Dakar"), ("Mermoz", "Dakar"),
+    ("Sacré-Coeur", "Dakar"), ("Point E", "Dakar"), ("Fann", "Dakar"), ("Yoff", "Dakar"),
+    ("Plateau", "Dakar"), ("Liberté 6", "Dakar"), ("Grand Yoff", "Dakar"),
+    ("Parcelles Assainies", "Dakar"), ("Guédiawaye", "Dakar"), ("Pikine", "Dakar"),
+    ("Keur Massar", "Dakar"), ("Rufisque", "Dakar"), ("Diamniadio", "Dakar"),
+    ("Saly", "Thiès"), ("Mbour", "Thiès"), ("Somone", "Thiès"),
+]
+PROPERTY_TYPES = ["Appartement", "Villa", "Maison", "Studio", "Terrain", "Immeuble"]
+FEATURES = [
+    "piscine", "vue mer", "gardien", "parking", "climatisation", "jardin",
+    "terrasse", "R+2", "meublé", "cuisine équipée", "groupe électrogène",
+]
+POSTED = ["il y a 2 heures", "il y a 5 heures", "hier", "il y a 3 jours", "il y a 2 semaines"]
+
+
+@dataclass(frozen=True)
+class FixtureSite:
+    spider: str
+    listing_path: str
+    page_re: str
+    detail_path: str
+    detail_re: str
+
+
+SITES = {
+    "sn.coinafrique.com": FixtureSite(
+        "coinafrique_html", "/categorie/immobilier", r"[?&]page=(\d+)",
+        "/annonce/immobilier/bien-{id}", r"/annonce/.*-(\d+)$",
+    ),
+    "www.expat-dakar.com": FixtureSite(
+        "expat_dakar", "/immobilier", r"[?&]page=(\d+)",
+        "/annonce/bien-{id}", r"/annonce/.*-(\d+)$",
+    ),
+    "www.loger-dakar.com": FixtureSite(
+        "loger_dakar", "/Bien/", r"/page/(\d+)/",
+        "/property/bien-{id}/", r"/property/.*-(\d+)/$",
+    ),
+}
+
+
+@lru_cache(maxsize=None)
+def _template(spider, name):
+    return Template((FIXTURES_DIR / spider / f"{name}.html").read_text(encoding="utf-8"))
+
+
+@lru_cache(maxsize=None)
+def _chrome(links=150):
+    """En-tête / menu : donne aux pages un DOM de taille réaliste."""
+    items = "\n".join(
+        f'<li class="menu-item"><a href="/rubrique/{i}">Rubrique {i}</a></li>' for i in range(links)
+    )
+    return f'<header class="site-header"><nav><ul class="menu">{items}</ul></nav></header>'
+
+
+def listing_values(listing_id):
+    """Valeurs déterministes d'une annonce à partir de son identifiant."""
+    rng = random.Random(listing_id)
+    city, region = rng.choice(CITIES)
+    property_type = rng.choice(PROPERTY_TYPES)
+    bedrooms = rng.randint(1, 6)
+    price = rng.randrange(15, 900) * 1_000_000 // 10
+    features = ", ".join(rng.sample(FEATURES, 3))
+    title = f"{property_type} {bedrooms} chambres à {city}"
+    return {
+        "id": listing_id,
+        "title": title,
+        "price": price,
+        "price_text": f"{price:,}".replace(",", " ") + " CFA",
+        "city": city,
+        "region": region,
+        "adresse": f"Rue {rng.randint(1, 120)}, {city}",
+        "property_type": property_type,
+        "statut": rng.choice(["Vente", "Location"]),
+        "bedrooms": bedrooms,
+        "bathrooms": rng.randint(1, bedrooms),
+        "surface": rng.randint(40, 600),
+        "lat": round(14.65 + rng.random() * 0.12, 6),
+        "lng": round(-17.52 + rng.random() * 0.15, 6),
+        "posted_time": rng.choice(POSTED),
+        "seller": f"agence-{rng.randint(1, 40)}",
+        "pro_icon": '<img class="icon-pro" src="/static/pro.svg" alt="pro">' if rng.random() < 0.4 else "",
+        "nb_annonces": rng.randint(1, 300),
+        "member_since": rng.randint(2012, 2024),
+        "description": (
+            f"{title}. {features.capitalize()}. Quartier calme, proche commerces et écoles. "
+            "Documents en règle, visite sur rendez-vous. " * 3
+        ),
+    }
+
+
+def render_listing(host, page, depth, per_page):
+    site = SITES[host]
+    cards = []
+    for i in range(per_page):
+        listing_id = page * 1000 + i
+        values = listing_values(listing_id)
+        values["url"] = site.detail_path.format(id=listing_id)
+        cards.append(_template(site.spider, "card").substitute(values))
+    pagination = []
+    if page > 1:
+        pagination.append(_template(site.spider, "previous").substitute(page=page - 1))
+    if page < depth:
+        pagination.append(_template(site.spider, "next").substitute(page=page + 1))
+    return _template(site.spider, "listing").substitute(
+        chrome=_chrome(), cards="\n".join(cards), pagination="\n".join(pagination),
+    ).encode("utf-8")
+
+
+def render_detail(host, listing_id):
+    site = SITES[host]
+    return _template(site.spider, "detail").substitute(
+        listing_values(listing_id), chrome=_chrome(),
+    ).encode("utf-8")
+
+
+def render(host, path_and_query, depth, per_page):
+    """Renvoie le corps HTML pour ``path_and_query`` sur ``host`` (None = 404)."""
+    site = SITES.get(host)
+    if site is None:
+        return None
+    match = re.search(site.detail_re, urlsplit(path_and_query).path)
+    if match:
+        return render_detail(host, int(match.group(1)))
+    match = re.search(site.page_re, path_and_query)
+    page = int(match.group(1)) if match else 1
+    if page > depth:
+        return None
+    return render_listing(host, page, depth, per_page)
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    depth = 5
+    per_page = 20
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        _, host, rest = self.path.split("/", 2) if self.path.count("/") >= 2 else ("", "", "")
+        body = render(host, "/" + rest, self.depth, self.per_page)
+        if body is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, latency=0.0, depth=5, per_page=20):
+    handler = type("Handler", (FixtureHandler,), {
+        "latency": latency, "depth": depth, "per_page": per_page,
+    })
+    httpd = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    httpd.daemon_threads = True
+    httpd.serve_forever()
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Serveur local des fixtures")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="secondes par réponse")
+    parser.add_argument("--depth", type=int, default=5, help="pages de listing par site")
+    parser.add_argument("--per-page", type=int, default=20, help="annonces par page")
+    args = parser.parse_args()
+    serve(args.port, args.latency, args.depth, args.per_page)
+
+
+if __name__ == "__main__":
+    run()
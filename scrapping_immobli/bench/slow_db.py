@@ -0,0 +1,127 @@
+"""
+Débit de téléchargement quand la base est lente.
+
+Un serveur HTTP local et un client à N requêtes simultanées tournent dans le
+même reactor ; chaque réponse produit une ligne envoyée au BulkWriter, dont
+l'écriture est remplacée par un ``time.sleep`` (latence de COMMIT simulée).
+
+Trois scénarios sont comparés :
+
+- ``sans base``  : référence, aucune écriture ;
+- ``reactor``    : écriture dans le reactor (``DB_WRITE_THREADS = 0``) ;
+- ``threads``    : écriture dans le pool de threads (réglage par défaut).
+
+Usage ::
+
+    python -m scrapping_immobli.bench.slow_db --db-latency 0.5 --duration 10
+"""
+import argparse
+import time
+
+from twisted.internet import defer, task
+from twisted.web import resource, server
+from twisted.web.client import Agent, HTTPConnectionPool, readBody
+
+from scrapping_immobli.db import BulkWriter, ConnectionPool
+
+
+class _Page(resource.Resource):
+    isLeaf = True
+
+    def render_GET(self, request):
+        return b"<html><body>" + b"x" * 2048 + b"</body></html>"
+
+
+class _SleepPool(ConnectionPool):
+    """Pool sans PostgreSQL : seuls les threads sont utilisés."""
+
+    def __init__(self, threads):
+        self.threads = threads
+        self.threadpool = None
+        if threads:
+            from twisted.python.threadpool import ThreadPool
+            self.threadpool = ThreadPool(minthreads=1, maxthreads=threads, name="bench-db")
+            self.threadpool.start()
+
+    def close(self):
+        if self.threadpool is not None:
+            self.threadpool.stop()
+            self.threadpool = None
+
+
+class _SlowWriter(BulkWriter):
+    def __init__(self, pool, db_latency, **kwargs):
+        super().__init__(pool, "bench", ("url", "scraped_at"), **kwargs)
+        self.db_latency = db_latency
+
+    def _write(self, rows):
+        time.sleep(self.db_latency)
+        return self.db_latency
+
+
+@defer.inlineCallbacks
+def _scenario(reactor, url, writer, concurrency, duration):
+    agent = Agent(reactor, pool=HTTPConnectionPool(reactor))
+    deadline = time.monotonic() + duration
+    done = [0]
+
+    @defer.inlineCallbacks
+    def worker():
+        while time.monotonic() < deadline:
+            response = yield agent.request(b"GET", url)
+            yield readBody(response)
+            done[0] += 1
+            if writer is not None:
+                waiter = writer.add({"url": url, "scraped_at": None})
+                if waiter is not None:
+                    yield waiter
+
+    start = time.monotonic()
+    yield defer.DeferredList([worker() for _ in range(concurrency)])
+    elapsed = time.monotonic() - start
+    if writer is not None:
+        yield writer.close()
+        writer.pool.close()
+    return done[0] / elapsed
+
+
+@defer.inlineCallbacks
+def main(reactor, args):
+    port = reactor.listenTCP(0, server.Site(_Page()), interface="127.0.0.1")
+    url = f"http://127.0.0.1:{port.getHost().port}/".encode()
+
+    def writer(threads):
+        w = _SlowWriter(
+            _SleepPool(threads), args.db_latency,
+            batch_size=args.batch_size, flush_interval=args.flush_interval,
+            max_pending_rows=args.max_pending_rows,
+        )
+        w.start()
+        return w
+
+    results = [
+        ("sans base", (yield _scenario(reactor, url, None, args.concurrency, args.duration))),
+        ("reactor", (yield _scenario(reactor, url, writer(0), args.concurrency, args.duration))),
+        ("threads", (yield _scenario(reactor, url, writer(args.threads), args.concurrency, args.duration))),
+    ]
+    yield port.stopListening()
+
+    print(f"latence base simulée : {args.db_latency:.3f}s / lot de {args.batch_size}")
+    for label, rate in results:
+        print(f"{label:<10} {rate:8.1f} requêtes/s")
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--db-latency", type=float, default=0.5)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--flush-interval", type=float, default=1.0)
+    parser.add_argument("--threads", type=int, default=2)
+    parser.add_argument("--max-pending-rows", type=int, default=5000)
+    task.react(main, [parser.parse_args()])
+
+
+if __name__ == "__main__":
+    run()
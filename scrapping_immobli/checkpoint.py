@@ -0,0 +1,321 @@
+"""
+Points de reprise d'un crawl (``scrapy resume``).
+
+Le scheduler CheckpointScheduler tient, pour chaque spider, un journal en
+ajout seul (``.scrapy/checkpoints/<spider>.journal``) :
+
+- ``enq``   : requête acceptée par le scheduler (empreinte + requête
+  sérialisée, comme dans la frontière PostgreSQL) ;
+- ``done``  : empreintes des requêtes dont la réponse est arrivée ;
+- ``seen``  : empreintes des URL retenues par DuplicatesPipeline ;
+- ``state`` : position de la pagination du spider (``checkpoint_state``) ;
+- ``end``   : fin normale du crawl.
+
+Toutes les CHECKPOINT_INTERVAL secondes, les enregistrements accumulés en
+mémoire sont ajoutés au fichier en une écriture suivie d'un fsync : un
+point de reprise ne réécrit jamais le journal. Les ``done`` et ``seen``
+attendent un intervalle de plus : d'ici là, le callback a fini (ses
+requêtes filles sont au journal) et ses items ont quitté le tampon
+PostgreSQL (DB_FLUSH_INTERVAL). Si des lignes ont été refusées par la base
+entre-temps (stats ``postgres/…/errors``), ces pages ne sont pas marquées
+faites et seront retéléchargées à la reprise.
+
+Reprise (``scrapy resume``, ou ``-s CHECKPOINT_RESUME=1``) : le journal est
+relu (un dernier enregistrement tronqué par le crash est ignoré) ; les
+requêtes ``enq`` sans ``done`` sont remises en file, celles déjà faites
+sont filtrées comme des doublons, DuplicatesPipeline retrouve ses
+empreintes, le spider sa pagination, et ``start_urls`` n'est pas relu. Le
+journal est alors compacté, une seule fois, au démarrage.
+"""
+import os
+import pickle
+import struct
+from datetime import datetime
+
+from scrapy import signals
+from scrapy.core.scheduler import Scheduler
+from scrapy.utils.project import data_path
+from scrapy.utils.request import request_from_dict
+from twisted.internet.task import LoopingCall
+
+CHECKPOINT_FP = "checkpoint_fingerprint"
+_LENGTH = struct.Struct("<I")
+
+
+def journal_path(settings, spider_name):
+    return data_path(os.path.join(settings.get("CHECKPOINT_DIR", "checkpoints"),
+                                  f"{spider_name}.journal"))
+
+
+def interrupted_path(path):
+    """Journal d'un crawl interrompu, mis de côté par un crawl lancé sans reprise."""
+    return path + ".interrupted"
+
+
+# ----------------------------------------------------------------------
+# Fichier
+# ----------------------------------------------------------------------
+def encode_records(records):
+    """Enregistrements ``(type, données)`` préfixés par leur longueur."""
+    chunks = []
+    for record in records:
+        data = pickle.dumps(record, protocol=4)
+        chunks.append(_LENGTH.pack(len(data)))
+        chunks.append(data)
+    return b"".join(chunks)
+
+
+def read_records(path):
+    """Itère sur les enregistrements ; s'arrête au premier incomplet (crash)."""
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(_LENGTH.size)
+            if len(header) < _LENGTH.size:
+                return
+            data = f.read(_LENGTH.unpack(header)[0])
+            try:
+                yield pickle.loads(data)
+            except (pickle.UnpicklingError, EOFError, ValueError):
+                return
+
+
+class Replay:
+    """État d'un crawl reconstruit depuis son journal."""
+
+    def __init__(self):
+        self.pending = {}     # empreinte -> requête sérialisée, pas encore faite
+        self.known = set()    # empreintes de toutes les requêtes mises en file
+        self.seen = bytearray()
+        self.state = None
+        self.started_at = None
+        self.finished = None  # raison de fin ; None si le crawl a été interrompu
+
+    @classmethod
+    def load(cls, path):
+        replay = cls()
+        for kind, data in read_records(path):
+            if kind == "enq":
+                fp, request = data
+                replay.pending[fp] = request
+                replay.known.add(fp)
+            elif kind == "done":
+                for fp in data:
+                    replay.pending.pop(fp, None)
+            elif kind == "known":
+                replay.known.update(data)
+            elif kind == "seen":
+                replay.seen += data
+            elif kind == "state":
+                replay.state = data
+            elif kind == "start":
+                replay.started_at = data["started_at"]
+            elif kind == "end":
+                replay.finished = data
+        return replay
+
+    @property
+    def resumable(self):
+        return self.finished is None and bool(self.pending)
+
+
+def load_resumable(path):
+    """
+    Journal à reprendre : celui du dernier crawl s'il a été interrompu,
+    sinon celui mis de côté ; ``(chemin, Replay)``, ou ``(None, None)``.
+    """
+    for candidate in (path, interrupted_path(path)):
+        if os.path.exists(candidate):
+            replay = Replay.load(candidate)
+            if replay.resumable:
+                return candidate, replay
+    return None, None
+
+
+# ----------------------------------------------------------------------
+# Scheduler
+# ----------------------------------------------------------------------
+class CheckpointScheduler(Scheduler):
+    """
+    Scheduler Scrapy (files en mémoire) qui journalise sa frontière ;
+    CHECKPOINT_INTERVAL = 0 le ramène au scheduler par défaut.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        settings = self.crawler.settings
+        self.interval = settings.getfloat("CHECKPOINT_INTERVAL", 30.0)
+        self.resume = settings.getbool("CHECKPOINT_RESUME")
+        self.path = journal_path(settings, self.crawler.spidercls.name)
+        self.file = None
+        self.timer = None
+        self.records = []
+        # (empreintes faites, empreintes d'URL retenues) : courant, puis prêt
+        self.done_now, self.done_ready = [], []
+        self.seen_now, self.seen_ready = bytearray(), bytearray()
+        self.db_errors = 0
+        self.last_state = None
+        # empreintes des requêtes faites avant la reprise (filtre de doublons)
+        self.restored = set()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        scheduler = super().from_crawler(crawler)
+        crawler.signals.connect(scheduler.response_received, signal=signals.response_received)
+        crawler.signals.connect(scheduler.item_scraped, signal=signals.item_scraped)
+        return scheduler
+
+    # ------------------------------------------------------------------
+    # Cycle de vie
+    # ------------------------------------------------------------------
+    def open(self, spider):
+        result = super().open(spider)
+        if self.interval <= 0:
+            return result
+        if self.resume:
+            source, replay = load_resumable(self.path)
+        else:
+            source, replay = None, None
+            self._set_aside(spider)
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.file = open(self.path + ".new", "wb")
+        self.records.append(("start", {"spider": spider.name, "resumed": replay is not None,
+                                       "started_at": datetime.utcnow().isoformat()}))
+        if replay is not None:
+            self._restore(spider, replay)
+        self._write()
+        # compaction faite : le nouveau journal remplace l'ancien
+        os.replace(self.path + ".new", self.path)
+        if source is not None and source != self.path:
+            os.remove(source)
+        self.timer = LoopingCall(self.checkpoint)
+        self.timer.start(self.interval, now=False)
+        return result
+
+    def _set_aside(self, spider):
+        # un crawl lancé sans reprise ne détruit pas un journal interrompu :
+        # « scrapy resume » le relit tant que le journal courant est terminé
+        if not os.path.exists(self.path):
+            return
+        replay = Replay.load(self.path)
+        if not replay.resumable:
+            return
+        os.replace(self.path, interrupted_path(self.path))
+        spider.logger.warning("[CHECKPOINT] crawl interrompu mis de côté (%d requêtes en attente)"
+                              " : « scrapy resume » pour le reprendre", len(replay.pending))
+
+    def _restore(self, spider, replay):
+        done = replay.known - replay.pending.keys()
+        self.records.append(("known", done))
+        if replay.seen:
+            self.records.append(("seen", bytes(replay.seen)))
+            digests = getattr(self.crawler, "_seen_digests", None)
+            if digests is not None:
+                for start in range(0, len(replay.seen), 16):
+                    digests.add(bytes(replay.seen[start:start + 16]))
+        if replay.state is not None and hasattr(spider, "restore_checkpoint"):
+            spider.restore_checkpoint(replay.state)
+        spider.resumed = True
+
+        for blob in replay.pending.values():
+            self.enqueue_request(request_from_dict(pickle.loads(blob), spider=spider))
+        self.restored = done
+        self.stats.set_value("checkpoint/resumed_requests", len(replay.pending))
+        spider.logger.info("[CHECKPOINT] reprise : %d requêtes en attente, %d déjà faites",
+                           len(replay.pending), len(done))
+
+    def close(self, reason):
+        if self.timer is not None and self.timer.running:
+            self.timer.stop()
+        if self.file is not None:
+            # arrêt propre : les pipelines ont déjà vidé leurs tampons
+            if self._db_errors() > self.db_errors:
+                self.stats.inc_value("checkpoint/done_discarded",
+                                     len(self.done_ready) + len(self.done_now))
+            else:
+                self._mark(self.done_ready + self.done_now, self.seen_ready + self.seen_now)
+            if reason == "finished":
+                self.records.append(("end", reason))
+            self._write()
+            self.file.close()
+            self.file = None
+        return super().close(reason)
+
+    # ------------------------------------------------------------------
+    # Journalisation
+    # ------------------------------------------------------------------
+    def enqueue_request(self, request):
+        fp = self.crawler.request_fingerprinter.fingerprint(request)
+        if self.restored and not request.dont_filter and fp in self.restored:
+            self.df.log(request, self.spider)
+            return False
+        if not super().enqueue_request(request):
+            return False
+        if self.file is None:
+            return True
+        try:
+            blob = pickle.dumps(request.to_dict(spider=self.spider), protocol=4)
+        except (ValueError, TypeError, AttributeError, pickle.PicklingError) as exc:
+            self.stats.inc_value("checkpoint/unserializable")
+            self.spider.logger.debug("[CHECKPOINT] requête non journalisée %s : %r", request, exc)
+            return True
+        self.records.append(("enq", (fp, blob)))
+        origin = request.meta.get(CHECKPOINT_FP)
+        if origin is not None and origin != fp:
+            # redirection : la requête d'origine est remplacée par celle-ci
+            self.records.append(("done", [origin]))
+        request.meta[CHECKPOINT_FP] = fp
+        return True
+
+    def response_received(self, response, request, spider):
+        fp = request.meta.get(CHECKPOINT_FP)
+        if fp is not None and self.file is not None:
+            self.done_now.append(fp)
+
+    def item_scraped(self, item, response, spider):
+        listing_id = item.get("id")
+        if listing_id and self.file is not None:
+            self.seen_now += bytes.fromhex(listing_id)
+
+    def _db_errors(self):
+        return sum(value for key, value in self.stats.get_stats().items()
+                   if key.startswith("postgres/") and key.endswith("/errors"))
+
+    def _mark(self, done, seen):
+        if done:
+            self.records.append(("done", done))
+        if seen:
+            self.records.append(("seen", bytes(seen)))
+
+    def checkpoint(self):
+        """
+        Point de reprise : marques de l'intervalle précédent (celles de
+        l'intervalle courant attendront le prochain), puis ajout au journal.
+        """
+        if self.file is None:
+            return
+        errors = self._db_errors()
+        if errors > self.db_errors:
+            # lignes refusées par PostgreSQL : les pages concernées seront refaites
+            self.stats.inc_value("checkpoint/done_discarded", len(self.done_ready))
+        else:
+            self._mark(self.done_ready, self.seen_ready)
+        self.db_errors = errors
+        self.done_ready, self.done_now = self.done_now, []
+        self.seen_ready, self.seen_now = self.seen_now, bytearray()
+        self._write()
+
+    def _write(self):
+        state = self.spider.checkpoint_state() if hasattr(self.spider, "checkpoint_state") else None
+        if state is not None and state != self.last_state:
+            self.records.append(("state", state))
+            self.last_state = state
+        if not self.records:
+            return
+        data = encode_records(self.records)
+        self.records = []
+        self.file.write(data)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.stats.inc_value("checkpoint/written")
+        self.stats.inc_value("checkpoint/bytes", len(data))
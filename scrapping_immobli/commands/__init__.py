@@ -0,0 +1 @@
+# Commandes Scrapy propres au projet (COMMANDS_MODULE) : scrapy <commande> -h
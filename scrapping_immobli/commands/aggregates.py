@@ -0,0 +1,82 @@
+"""
+scrapy aggregates                       # dernier mois, par ville / type / statut
+scrapy aggregates --month 2025-06
+scrapy aggregates --rebuild             # tout recalculer depuis market_listings
+scrapy aggregates --backfill --rebuild  # remplir d'abord depuis listings
+
+Agrégats de marché (scrapping_immobli.aggregates). Le recalcul est une
+seule requête ensembliste (GROUP BY sur tous les faits), pas une boucle
+sur les annonces ; il remplace les agrégats sous verrou consultatif, les
+écritures des pipelines attendent la fin du recalcul.
+"""
+from datetime import datetime
+
+import psycopg2
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from scrapping_immobli.aggregates import backfill, create_tables, rebuild
+from scrapping_immobli.listings import LISTINGS_TABLE
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+    default_settings = {"LOG_ENABLED": False}
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "Agrégats de marché : affichage, remplissage, recalcul"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--month", metavar="AAAA-MM",
+                            help="mois affiché (défaut : le plus récent)")
+        parser.add_argument("--backfill", action="store_true",
+                            help="remplir market_listings depuis listings et l'historique")
+        parser.add_argument("--rebuild", action="store_true",
+                            help="recalculer market_aggregates depuis market_listings")
+
+    def run(self, args, opts):
+        month = None
+        if opts.month:
+            try:
+                month = datetime.strptime(opts.month, "%Y-%m").date()
+            except ValueError:
+                raise UsageError("--month attend AAAA-MM")
+
+        conn = psycopg2.connect(**self.settings.getdict("DATABASE"))
+        try:
+            create_tables(conn)
+            if opts.backfill:
+                print(f"{backfill(conn, [LISTINGS_TABLE])} faits ajoutés à market_listings")
+            if opts.rebuild:
+                print(f"{rebuild(conn)} groupes recalculés")
+            self._print(conn, month)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _print(conn, month):
+        with conn.cursor() as cur:
+            if month is None:
+                cur.execute("SELECT max(month) FROM market_aggregates")
+                month = cur.fetchone()[0]
+            if month is None:
+                print("aucun agrégat")
+                return
+            cur.execute(
+                "SELECT city, property_type, statut, listings, median_price, avg_price,"
+                " median_price_m2 FROM market_stats WHERE month = %s"
+                " ORDER BY listings DESC, city LIMIT 30",
+                (month,),
+            )
+            rows = cur.fetchall()
+        conn.commit()
+        print(f"\n{month:%Y-%m}")
+        print(f"{'ville':<22} {'type':<14} {'statut':<12} {'annonces':>8} "
+              f"{'médiane':>12} {'moyenne':>12} {'médiane/m²':>11}")
+        for city, ptype, statut, listings, median, avg, median_m2 in rows:
+            print(f"{(city or '-')[:22]:<22} {(ptype or '-')[:14]:<14} {(statut or '-')[:12]:<12} "
+                  f"{listings:>8} {median or 0:>12,.0f} {avg or 0:>12,.0f} {median_m2 or 0:>11,.0f}")
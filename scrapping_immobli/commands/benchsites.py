@@ -0,0 +1,254 @@
+"""
+scrapy benchsites [options] [spider ...]
+
+Benchmark hors ligne : les spiders crawlent le serveur de fixtures local
+(scrapping_immobli.bench.server) de bout en bout, sans réseau ni base, puis
+le débit (pages/s, items/s) et le temps CPU par étape sont affichés.
+
+Avec ``--parse-only``, seuls ``parse`` et ``parse_detail`` sont exécutés en
+boucle sur des pages générées en mémoire (pas de reactor, pas de HTTP) ;
+``--workers 0 1 2 4`` mesure en plus l'extraction des fiches par un pool de
+N processus (0 = dans le processus courant), comme PARSE_POOL_ENABLED.
+"""
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+from scrapy.http import HtmlResponse, Request
+
+from scrapping_immobli.bench import instrument, server
+from scrapping_immobli.parsepool import create_executor, extract_detail, spider_path
+
+# en dessous, le temps de parse_detail n'est plus mesuré (le travail du
+# callback échappe à CallbackTimingMiddleware) : le benchmark échoue
+MIN_DETAIL_CPU_MS = 0.1
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"le serveur de fixtures n'écoute pas sur le port {port}")
+
+
+def fixture_responses(host, spider, count):
+    """Pages détail générées en mémoire, telles que le spider les recevrait."""
+    site = server.SITES[host]
+    responses = []
+    for i in range(count):
+        listing_id = 1000 + i
+        url = f"https://{host}{site.detail_path.format(id=listing_id)}"
+        meta = {"title": server.listing_values(listing_id)["title"]}
+        request = Request(url, callback=spider.parse_detail, meta=meta)
+        responses.append(HtmlResponse(url, body=server.render_detail(host, listing_id),
+                                      encoding="utf-8", request=request))
+    return responses
+
+
+def parse_benchmark(spider, host, repeat, per_page):
+    """Temps CPU de ``parse`` (listing) et ``parse_detail`` sur les fixtures."""
+    details = fixture_responses(host, spider, repeat)
+    listing_url = f"https://{host}{server.SITES[host].listing_path}"
+    listing = HtmlResponse(listing_url, body=server.render_listing(host, 2, 10, per_page),
+                           encoding="utf-8", request=Request(listing_url))
+
+    start = time.process_time()
+    for _ in range(max(repeat // per_page, 1)):
+        list(spider.parse(listing))
+    listing_cpu = (time.process_time() - start) / max(repeat // per_page, 1)
+
+    start = time.process_time()
+    items = 0
+    for response in details:
+        items += sum(1 for _ in spider.parse_detail(response))
+    detail_cpu = time.process_time() - start
+    return listing_cpu, detail_cpu, items
+
+
+def pool_benchmark(spidercls, host, repeat, workers):
+    """
+    Fiches/s (temps réel) : extraction de ``repeat`` fiches (octets -> dicts)
+    par ``workers`` processus, au plus 4 x workers en cours ; 0 = sans pool.
+    """
+    path = spider_path(spidercls())
+    bodies = [server.render_detail(host, 1000 + i) for i in range(repeat)]
+    if not workers:
+        start = time.perf_counter()
+        for body in bodies:
+            extract_detail(path, body, "utf-8")
+        return repeat / (time.perf_counter() - start)
+
+    executor = create_executor(workers)
+    try:
+        # démarrage des processus et chargement des schémas hors mesure
+        list(executor.map(extract_detail, [path] * workers * 2, bodies[:workers * 2],
+                          ["utf-8"] * workers * 2))
+        pending = set()
+        start = time.perf_counter()
+        for body in bodies:
+            if len(pending) >= 4 * workers:
+                _, pending = wait(pending, return_when=FIRST_COMPLETED)
+            pending.add(executor.submit(extract_detail, path, body, "utf-8"))
+        wait(pending)
+        return repeat / (time.perf_counter() - start)
+    finally:
+        executor.shutdown()
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+    default_settings = {"LOG_LEVEL": "WARNING"}
+
+    def syntax(self):
+        return "[options] [spider ...]"
+
+    def short_desc(self):
+        return "Benchmark hors ligne des spiders sur le corpus de fixtures"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--depth", type=int, default=5,
+                            help="pages de listing par site (défaut : 5)")
+        parser.add_argument("--per-page", type=int, default=20,
+                            help="annonces par page de listing (défaut : 20)")
+        parser.add_argument("--latency", type=float, default=0.0,
+                            help="latence du serveur local, en secondes")
+        parser.add_argument("--parse-only", action="store_true",
+                            help="mesurer seulement parse/parse_detail, sans crawl")
+        parser.add_argument("--repeat", type=int, default=500,
+                            help="pages détail parsées par spider avec --parse-only")
+        parser.add_argument("--workers", type=int, nargs="+", metavar="N",
+                            help="avec --parse-only : processus du pool de parsing à comparer")
+
+    def process_options(self, args, opts):
+        self.port = _free_port()
+        downloader_mws = self.settings.getdict("DOWNLOADER_MIDDLEWARES")
+        downloader_mws["scrapping_immobli.bench.instrument.FixtureRedirectMiddleware"] = 1
+        spider_mws = self.settings.getdict("SPIDER_MIDDLEWARES")
+        spider_mws["scrapping_immobli.bench.instrument.CallbackTimingMiddleware"] = 1000
+        self.settings.setdict({
+            "FIXTURE_SERVER_PORT": self.port,
+            "DOWNLOADER_MIDDLEWARES": downloader_mws,
+            "SPIDER_MIDDLEWARES": spider_mws,
+            "ITEM_PROCESSOR": "scrapping_immobli.bench.instrument.TimedItemPipelineManager",
+            "ITEM_PIPELINES": {
+                "scrapping_immobli.pipelines.ValidationPipeline": 100,
+                "scrapping_immobli.pipelines.DuplicatesPipeline": 200,
+            },
+            "SEEN_INDEX_ENABLED": False,
+            "HTTPCACHE_ENABLED": False,
+            "DOWNLOAD_DELAY": 0,
+            "AUTOTHROTTLE_ENABLED": False,
+            "ADAPTIVE_THROTTLE_ENABLED": False,
+            "METRICS_ENABLED": False,
+            # pas de journal : un benchmark ne touche pas aux points de reprise
+            "CHECKPOINT_INTERVAL": 0,
+            "CONCURRENT_REQUESTS": 16,
+            "CONCURRENT_REQUESTS_PER_DOMAIN": 16,
+        }, priority="cmdline")
+        # -s reste prioritaire sur les réglages du benchmark
+        super().process_options(args, opts)
+
+    def run(self, args, opts):
+        hosts = {site.spider: host for host, site in server.SITES.items()}
+        names = args or sorted(hosts)
+        unknown = [name for name in names if name not in hosts]
+        if unknown:
+            raise UsageError(f"pas de fixtures pour : {', '.join(unknown)}")
+
+        if opts.parse_only:
+            self._run_parse_only(names, hosts, opts)
+        else:
+            self._run_crawl(names, opts)
+
+    # ------------------------------------------------------------------
+    # Crawl complet contre le serveur local
+    # ------------------------------------------------------------------
+    def _run_crawl(self, names, opts):
+        proc = subprocess.Popen([
+            sys.executable, "-m", "scrapping_immobli.bench.server",
+            "--port", str(self.port), "--latency", str(opts.latency),
+            "--depth", str(opts.depth), "--per-page", str(opts.per_page),
+        ])
+        try:
+            _wait_for_port(self.port)
+            crawlers = []
+            for name in names:
+                crawler = self.crawler_process.create_crawler(name)
+                crawlers.append(crawler)
+                self.crawler_process.crawl(crawler)
+            self.crawler_process.start()
+        finally:
+            proc.terminate()
+            proc.wait()
+
+        print(f"\nprofondeur {opts.depth} pages x {opts.per_page} annonces, "
+              f"latence serveur {opts.latency:.3f}s")
+        for crawler in crawlers:
+            self._report(crawler)
+            self._check_timing(crawler)
+
+    def _report(self, crawler):
+        stats = crawler.stats.get_stats()
+        name = crawler.spider.name
+        elapsed = stats.get("elapsed_time_seconds") or 0.0
+        pages = stats.get("response_received_count", 0)
+        items = stats.get("item_scraped_count", 0)
+        print(f"\n{name}")
+        print(f"  durée        {elapsed:8.2f} s")
+        print(f"  pages        {pages:8d}   {pages / elapsed if elapsed else 0:8.1f} pages/s")
+        print(f"  items        {items:8d}   {items / elapsed if elapsed else 0:8.1f} items/s")
+        for (spider_name, stage), (seconds, calls) in sorted(instrument.STAGE_CPU.items()):
+            if spider_name != name:
+                continue
+            per_call = seconds / calls * 1000 if calls else 0.0
+            print(f"  cpu {stage:<28} {seconds:8.3f} s  {per_call:7.3f} ms/appel  ({calls})")
+
+    def _check_timing(self, crawler):
+        if crawler.settings.getbool("PARSE_POOL_ENABLED"):
+            return  # extraction dans le pool : hors du temps CPU du reactor
+        seconds, calls = instrument.STAGE_CPU.get((crawler.spider.name, "parse_detail"), (0.0, 0))
+        if calls and seconds / calls * 1000 < MIN_DETAIL_CPU_MS:
+            print(f"  ERREUR : parse_detail à {seconds / calls * 1000:.3f} ms/appel"
+                  f" (< {MIN_DETAIL_CPU_MS} ms) : temps du callback non mesuré")
+            self.exitcode = 1
+
+    # ------------------------------------------------------------------
+    # Parsing seul
+    # ------------------------------------------------------------------
+    def _run_parse_only(self, names, hosts, opts):
+        loader = self.crawler_process.spider_loader
+        print(f"\nparsing seul : {opts.repeat} fiches par spider")
+        for name in names:
+            # spider configuré par ses réglages (pagination, priorités), sans crawl
+            spidercls = loader.load(name)
+            spider = spidercls.from_crawler(self.crawler_process.create_crawler(spidercls))
+            listing_cpu, detail_cpu, items = parse_benchmark(
+                spider, hosts[name], opts.repeat, opts.per_page,
+            )
+            print(f"\n{name}")
+            print(f"  parse         {listing_cpu * 1000:8.3f} ms/page listing")
+            print(f"  parse_detail  {detail_cpu / opts.repeat * 1000:8.3f} ms/fiche"
+                  f"   {opts.repeat / detail_cpu if detail_cpu else 0:8.1f} fiches/s ({items} items)")
+            if not opts.workers:
+                continue
+            baseline = None
+            for workers in opts.workers:
+                rate = pool_benchmark(loader.load(name), hosts[name], opts.repeat, workers)
+                baseline = baseline or rate
+                label = f"{workers} processus" if workers else "sans pool"
+                print(f"  {label:<13} {rate:8.1f} fiches/s   x{rate / baseline:.2f}")
@@ -0,0 +1,92 @@
+"""
+scrapy crawlall [-a NAME=VALUE ...] [--stats-file FICHIER] [spider ...]
+
+Crawle tous les sites (ou ceux indiqués) en même temps, dans un seul
+processus et un seul reactor, au lieu d'un ``scrapy crawl`` par site :
+
+- un seul pool de connexions PostgreSQL (ConnectionPool.acquire) ;
+- un seul index des annonces vues (SeenIndex, partagé par fichier) ;
+- des stats réunies en fin de run : totaux, puis détail par site.
+
+Les arguments ``-a`` sont transmis à chaque spider (ex. ``-a incremental=1``).
+"""
+import json
+import os
+
+from scrapy.commands import BaseRunSpiderCommand
+from scrapy.exceptions import UsageError
+
+# compteurs additionnés sur tous les sites dans le résumé
+TOTAL_KEYS = (
+    "item_scraped_count",
+    "item_dropped_count",
+    "response_received_count",
+    "downloader/request_count",
+    "seen/skipped",
+    "log_count/ERROR",
+)
+
+
+def merged_stats(crawlers):
+    """Stats de plusieurs crawlers : ``total/<clé>`` puis ``<spider>/<clé>``."""
+    merged = {}
+    for crawler in crawlers:
+        name = crawler.spider.name if crawler.spider else crawler.spidercls.name
+        for key, value in crawler.stats.get_stats().items():
+            merged[f"{name}/{key}"] = value
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                if key in TOTAL_KEYS or key.startswith("postgres/"):
+                    merged[f"total/{key}"] = merged.get(f"total/{key}", 0) + value
+    return merged
+
+
+class Command(BaseRunSpiderCommand):
+    requires_project = True
+
+    def syntax(self):
+        return "[options] [spider ...]"
+
+    def short_desc(self):
+        return "Crawle tous les sites dans un seul processus (ressources partagées)"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--stats-file", metavar="FICHIER",
+                            help="écrire les stats réunies en JSON")
+
+    def run(self, args, opts):
+        loader = self.crawler_process.spider_loader
+        names = args or loader.list()
+        unknown = [name for name in names if name not in loader.list()]
+        if unknown:
+            raise UsageError(f"spider inconnu : {', '.join(unknown)}")
+
+        crawlers = []
+        for name in names:
+            crawler = self.crawler_process.create_crawler(name)
+            crawlers.append(crawler)
+            self.crawler_process.crawl(crawler, **opts.spargs)
+        self.crawler_process.start()
+        if self.crawler_process.bootstrap_failed:
+            self.exitcode = 1
+
+        stats = merged_stats(crawlers)
+        self._report(names, stats)
+        if opts.stats_file:
+            os.makedirs(os.path.dirname(opts.stats_file) or ".", exist_ok=True)
+            with open(opts.stats_file, "w", encoding="utf-8") as f:
+                json.dump(stats, f, indent=2, default=str, sort_keys=True)
+
+    @staticmethod
+    def _report(names, stats):
+        print()
+        print(f"{'site':<20} {'items':>8} {'pages':>8} {'écartés':>8} {'erreurs':>8} {'durée (s)':>10}")
+        for name in names + ["total"]:
+            print(
+                f"{name:<20}"
+                f" {stats.get(f'{name}/item_scraped_count', 0):>8}"
+                f" {stats.get(f'{name}/response_received_count', 0):>8}"
+                f" {stats.get(f'{name}/item_dropped_count', 0):>8}"
+                f" {stats.get(f'{name}/log_count/ERROR', 0):>8}"
+                f" {stats.get(f'{name}/elapsed_time_seconds', 0) or 0:>10.1f}"
+            )
@@ -0,0 +1,62 @@
+"""
+scrapy export                       # lignes nouvelles depuis le dernier export
+scrapy export --full                # tout réexporter (dossier vide conseillé)
+scrapy export --out DIR --table listings_loger_dakar
+
+Export Parquet de la table ``listings`` (scrapping_immobli.export) dans
+EXPORT_DIR, partition PostgreSQL par partition (un filigrane par site),
+partitionné par source et par jour de scraping :
+
+    exports/source=loger_dakar/scraped_date=2025-06-01/<table>-<horodatage>-0000.parquet
+
+Lecture côté analyse : ``pd.read_parquet("exports/source=loger_dakar")``
+ou ``pyarrow.dataset.dataset("exports", partitioning="hive")``.
+"""
+import psycopg2
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from scrapping_immobli.export import export_all, pa
+from scrapping_immobli.listings import listing_tables
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+    default_settings = {"LOG_ENABLED": False}
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "Export Parquet incrémental des tables d'annonces"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--out", metavar="DIR", help="dossier d'export (défaut : EXPORT_DIR)")
+        parser.add_argument("--table", action="append", default=[], metavar="TABLE",
+                            help="n'exporter que cette table (répétable)")
+        parser.add_argument("--full", action="store_true",
+                            help="ignorer les filigranes et tout exporter")
+
+    def run(self, args, opts):
+        if pa is None:
+            raise UsageError("l'export Parquet demande pyarrow : pip install pyarrow")
+        sources = listing_tables()
+        if opts.table:
+            unknown = set(opts.table) - {table for table, _ in sources}
+            if unknown:
+                raise UsageError(f"table(s) inconnue(s) : {', '.join(sorted(unknown))}")
+            sources = [(table, columns) for table, columns in sources if table in opts.table]
+
+        out_dir = opts.out or self.settings.get("EXPORT_DIR", "exports")
+        conn = psycopg2.connect(**self.settings.getdict("DATABASE"))
+        try:
+            total = export_all(
+                conn, sources, out_dir,
+                full=opts.full,
+                lag=self.settings.getint("EXPORT_LAG", 60),
+                chunk_rows=self.settings.getint("EXPORT_CHUNK_ROWS", 50000),
+            )
+        finally:
+            conn.close()
+        print(f"\n{total} lignes exportées dans {out_dir}")
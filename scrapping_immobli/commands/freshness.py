@@ -0,0 +1,73 @@
+"""
+scrapy freshness                        # annonces suivies, échues, disparues, par site
+scrapy freshness --queue loger_dakar    # file de revisite du site, dans son budget
+
+Revisite selon la fraîcheur (scrapping_immobli.freshness) : état de la
+file et intervalles de revisite donnés par les réglages FRESHNESS_*.
+"""
+import psycopg2
+from scrapy.commands import ScrapyCommand
+
+from scrapping_immobli.freshness import FreshnessPolicy, due_listings, freshness_summary
+from scrapping_immobli.migrations import ensure_schema
+
+# grille affichée : âge de l'annonce (jours) x changements observés
+AGES = (0, 1, 3, 7, 14, 30, 60)
+CHANGES = (0, 1, 3)
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+    default_settings = {"LOG_ENABLED": False}
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "File de revisite des annonces selon leur fraîcheur"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--queue", metavar="SPIDER",
+                            help="afficher la file de revisite de ce site")
+        parser.add_argument("--limit", type=int, metavar="N",
+                            help="avec --queue : N premières fiches (défaut : budget du site)")
+
+    def run(self, args, opts):
+        settings = self.settings
+        policy = FreshnessPolicy.from_settings(settings)
+        conn = psycopg2.connect(**settings.getdict("DATABASE"))
+        try:
+            ensure_schema(conn, settings.getbool("DB_AUTO_MIGRATE", True))
+            if opts.queue:
+                budget = settings.getdict("FRESHNESS_SITE_BUDGETS").get(
+                    opts.queue, settings.getint("FRESHNESS_BUDGET", 200))
+                self._print_queue(due_listings(conn, policy, opts.queue, opts.limit or int(budget)))
+            else:
+                self._print_summary(freshness_summary(conn, policy))
+                self._print_policy(policy)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _print_summary(rows):
+        print(f"{'source':<20} {'suivies':>9} {'échues':>9} {'disparues':>9} {'intervalle médian':>18}")
+        for source, tracked, due, gone, median in rows:
+            print(f"{source or '-':<20} {tracked:>9,} {due:>9,} {gone:>9,} {median:>16.1f} j")
+
+    @staticmethod
+    def _print_policy(policy):
+        print("\nintervalle de revisite (jours) selon l'âge et les changements observés")
+        print(f"{'âge':>12}" + "".join(f"{f'{n} chgt':>10}" for n in CHANGES))
+        for age in AGES:
+            print(f"{f'{age} j':>12}" + "".join(f"{policy.interval_days(n, age):>10.1f}" for n in CHANGES))
+
+    @staticmethod
+    def _print_queue(rows):
+        if not rows:
+            print("aucune annonce échue")
+            return
+        print(f"{len(rows)} fiches sur {rows[0][3]} échues\n")
+        print(f"{'retard':>7}  url")
+        for _, url, urgency, *_ in rows:
+            print(f"{urgency:>6.1f}x  {url}")
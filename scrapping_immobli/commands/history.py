@@ -0,0 +1,97 @@
+"""
+scrapy history                                  # partitions et volumes
+scrapy history --ahead 3                        # créer les 3 prochains mois
+scrapy history --before 2025-01 --archive DIR   # archiver puis supprimer
+scrapy history --before 2025-01 --drop          # supprimer sans archive
+
+Entretien de ``listing_observations`` (scrapping_immobli.history). Une
+partition retirée est d'abord détachée (``DETACH PARTITION``), puis copiée
+en CSV compressé (``DIR/listing_observations_AAAA_MM.csv.gz``) et
+supprimée : pas de DELETE ligne à ligne, pas de VACUUM.
+"""
+import gzip
+import os
+from datetime import datetime
+
+import psycopg2
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from scrapping_immobli.history import (
+    create_partitions, create_tables, list_partitions, month_start, next_month,
+)
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+    default_settings = {"LOG_ENABLED": False}
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "Partitions de l'historique des prix : création, archivage, suppression"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--ahead", type=int, metavar="N",
+                            help="créer les partitions du mois courant et des N suivants")
+        parser.add_argument("--before", metavar="AAAA-MM",
+                            help="partitions antérieures à ce mois (exclu)")
+        parser.add_argument("--archive", metavar="DIR",
+                            help="avec --before : exporter en CSV compressé puis supprimer")
+        parser.add_argument("--drop", action="store_true",
+                            help="avec --before : supprimer sans archiver")
+
+    def run(self, args, opts):
+        before = None
+        if opts.before:
+            try:
+                before = datetime.strptime(opts.before, "%Y-%m")
+            except ValueError:
+                raise UsageError("--before attend AAAA-MM")
+            if not (opts.archive or opts.drop):
+                raise UsageError("--before demande --archive DIR ou --drop")
+
+        conn = psycopg2.connect(**self.settings.getdict("DATABASE"))
+        try:
+            create_tables(conn)
+            if opts.ahead is not None:
+                month = month_start(datetime.utcnow())
+                months = [month]
+                for _ in range(opts.ahead):
+                    month = next_month(month)
+                    months.append(month)
+                create_partitions(conn, months)
+            if before is not None:
+                for month, name, _ in list_partitions(conn):
+                    if month < before:
+                        self._retire(conn, name, opts.archive)
+            self._print(conn)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _retire(conn, name, archive_dir):
+        with conn.cursor() as cur:
+            cur.execute(f"ALTER TABLE listing_observations DETACH PARTITION {name}")
+            conn.commit()
+            if archive_dir:
+                os.makedirs(archive_dir, exist_ok=True)
+                path = os.path.join(archive_dir, f"{name}.csv.gz")
+                with gzip.open(path, "wt", encoding="utf-8") as f:
+                    cur.copy_expert(f"COPY {name} TO STDOUT WITH CSV HEADER", f)
+                print(f"{name} archivée dans {path}")
+            cur.execute(f"DROP TABLE {name}")
+        conn.commit()
+        print(f"{name} supprimée")
+
+    @staticmethod
+    def _print(conn):
+        print(f"\n{'partition':<34} {'lignes (estim.)':>16}")
+        for _, name, estimate in list_partitions(conn):
+            print(f"{name:<34} {estimate:>16}")
+        with conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM listing_state")
+            print(f"\nannonces suivies : {cur.fetchone()[0]}")
+        conn.commit()
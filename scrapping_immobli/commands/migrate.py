@@ -0,0 +1,49 @@
+"""
+scrapy migrate                 # appliquer les migrations en attente
+scrapy migrate --status        # migrations passées / en attente
+scrapy migrate --target 1      # s'arrêter à la version 1
+
+Migrations versionnées du schéma PostgreSQL (scrapping_immobli.migrations).
+La première crée la table ``listings`` partitionnée par source et y
+déplace les lignes des anciennes tables par site, remplacées par des vues.
+"""
+import psycopg2
+from scrapy.commands import ScrapyCommand
+
+from scrapping_immobli.migrations import MIGRATIONS, applied_versions, migrate
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+    default_settings = {"LOG_ENABLED": False}
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "Migrations du schéma PostgreSQL"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--status", action="store_true",
+                            help="afficher l'état sans rien appliquer")
+        parser.add_argument("--target", type=int, metavar="VERSION",
+                            help="dernière version à appliquer")
+
+    def run(self, args, opts):
+        conn = psycopg2.connect(**self.settings.getdict("DATABASE"))
+        try:
+            if not opts.status:
+                done = migrate(conn, target=opts.target)
+                print(f"{len(done)} migration(s) appliquée(s)")
+            self._print(conn)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _print(conn):
+        applied = applied_versions(conn)
+        print(f"\n{'version':>7}  {'migration':<42} appliquée le")
+        for version, name, _ in MIGRATIONS:
+            when = applied.get(version, (None, None))[1]
+            print(f"{version:>7}  {name:<42} {f'{when:%Y-%m-%d %H:%M}' if when else 'en attente'}")
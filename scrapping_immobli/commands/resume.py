@@ -0,0 +1,66 @@
+"""
+scrapy resume [-a NAME=VALUE ...] [spider ...]   # reprendre les crawls interrompus
+scrapy resume --status                           # état des journaux
+
+Reprend chaque spider au dernier point de reprise de son journal
+(scrapping_immobli.checkpoint) : requêtes en attente, pagination, empreintes
+déjà vues. Les spiders dont le dernier crawl s'est terminé normalement, ou
+sans journal, sont ignorés. Comme ``scrapy crawlall``, tout tourne dans un
+seul processus.
+"""
+from scrapping_immobli.checkpoint import Replay, journal_path, load_resumable
+from scrapping_immobli.commands.crawlall import Command as CrawlAllCommand
+
+
+class Command(CrawlAllCommand):
+
+    def short_desc(self):
+        return "Reprend les crawls interrompus depuis leur dernier point de reprise"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--status", action="store_true",
+                            help="afficher l'état des journaux sans rien reprendre")
+
+    def process_options(self, args, opts):
+        super().process_options(args, opts)
+        self.settings.set("CHECKPOINT_RESUME", True, priority="cmdline")
+        if opts.status:
+            self.settings.set("LOG_ENABLED", False, priority="cmdline")
+
+    def run(self, args, opts):
+        loader = self.crawler_process.spider_loader
+        replays = self._replays(args or loader.list())
+        if opts.status:
+            self._print_status(replays)
+            return
+        names = [name for name, replay in replays.items() if replay is not None and replay.resumable]
+        if not names:
+            print("rien à reprendre")
+            return
+        super().run(names, opts)
+
+    def _replays(self, names):
+        replays = {}
+        for name in names:
+            path = journal_path(self.settings, name)
+            # journal courant, ou celui mis de côté par un crawl sans reprise
+            _, replays[name] = load_resumable(path)
+            if replays[name] is None:
+                try:
+                    replays[name] = Replay.load(path)
+                except FileNotFoundError:
+                    replays[name] = None
+        return replays
+
+    @staticmethod
+    def _print_status(replays):
+        print(f"{'spider':<20} {'démarré (UTC)':<20} {'en attente':>10} {'faites':>8}  état")
+        for name, replay in replays.items():
+            if replay is None:
+                print(f"{name:<20} {'-':<20} {'-':>10} {'-':>8}  pas de journal")
+                continue
+            started = (replay.started_at or "")[:19].replace("T", " ")
+            done = len(replay.known) - len(replay.pending)
+            state = f"terminé ({replay.finished})" if replay.finished else "interrompu"
+            print(f"{name:<20} {started:<20} {len(replay.pending):>10} {done:>8}  {state}")
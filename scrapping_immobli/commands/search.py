@@ -0,0 +1,66 @@
+"""
+scrapy search piscine "vue mer"
+scrapy search "R+2" --city Almadies --max-price 150000000 --type Villa
+scrapy search --reindex                 # indexer les annonces déjà en base
+
+Recherche plein texte dans ``listing_search`` (scrapping_immobli.search) :
+racinisation française, accents ignorés, résultats classés par pertinence.
+"""
+import time
+
+import psycopg2
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from scrapping_immobli.listings import LISTINGS_TABLE
+from scrapping_immobli.search import create_tables, reindex, search
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+    default_settings = {"LOG_ENABLED": False}
+
+    def syntax(self):
+        return "[options] <mots>"
+
+    def short_desc(self):
+        return "Recherche plein texte dans les annonces des trois sites"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--city", help="ville (accents ignorés)")
+        parser.add_argument("--type", dest="property_type", help="type de bien")
+        parser.add_argument("--statut", help="Vente, Location…")
+        parser.add_argument("--source", help="spider d'origine")
+        parser.add_argument("--min-price", type=int)
+        parser.add_argument("--max-price", type=int)
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument("--reindex", action="store_true",
+                            help="indexer les annonces de listings")
+
+    def run(self, args, opts):
+        if not args and not opts.reindex:
+            raise UsageError("mots recherchés manquants")
+
+        conn = psycopg2.connect(**self.settings.getdict("DATABASE"))
+        try:
+            create_tables(conn)
+            if opts.reindex:
+                reindex(conn, [LISTINGS_TABLE])
+            if not args:
+                return
+            start = time.perf_counter()
+            rows = search(
+                conn, " ".join(args),
+                city=opts.city, property_type=opts.property_type, statut=opts.statut,
+                source=opts.source, min_price=opts.min_price, max_price=opts.max_price,
+                limit=opts.limit, window=self.settings.getint("SEARCH_RANK_WINDOW", 1000),
+            )
+            elapsed = time.perf_counter() - start
+        finally:
+            conn.close()
+
+        for rank, _, source, title, price, city, url in rows:
+            print(f"{rank:6.3f}  {price or 0:>13,}  {(city or '-')[:18]:<18} {(title or '')[:50]:<50} "
+                  f"[{source}] {url}")
+        print(f"\n{len(rows)} résultat(s) en {elapsed * 1000:.1f} ms")
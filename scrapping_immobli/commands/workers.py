@@ -0,0 +1,93 @@
+"""
+scrapy workers <spider> [-n N] [-a NAME=VALUE ...]
+scrapy workers --status [spider]
+scrapy workers --reset <spider>
+
+Lance N processus ``scrapy crawl <spider>`` qui se partagent la frontière
+PostgreSQL (scrapping_immobli.frontier) ; sur d'autres machines, lancer la
+même commande (ou ``scrapy crawl <spider> -s SCHEDULER=…PostgresScheduler``)
+avec la même base. ``--status`` affiche l'état de la frontière, ``--reset``
+la vide pour un spider.
+"""
+import socket
+import subprocess
+import sys
+
+import psycopg2
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from scrapping_immobli.frontier import create_tables, frontier_status
+
+SCHEDULER = "scrapping_immobli.frontier.PostgresScheduler"
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+    default_settings = {"LOG_LEVEL": "INFO"}
+
+    def syntax(self):
+        return "[options] <spider>"
+
+    def short_desc(self):
+        return "Lance N workers sur la frontière PostgreSQL partagée"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("-n", "--workers", type=int, default=2,
+                            help="nombre de processus (défaut : 2)")
+        parser.add_argument("-a", dest="spargs", action="append", default=[], metavar="NAME=VALUE",
+                            help="argument transmis au spider (répétable)")
+        parser.add_argument("--status", action="store_true", help="état de la frontière")
+        parser.add_argument("--reset", action="store_true", help="vider la frontière du spider")
+
+    def run(self, args, opts):
+        spider = args[0] if args else None
+        if opts.status:
+            self._print_status(spider)
+            return
+        if spider is None:
+            raise UsageError("indiquer un spider")
+        if spider not in self.crawler_process.spider_loader.list():
+            raise UsageError(f"spider inconnu : {spider}")
+        if opts.reset:
+            self._reset(spider)
+            return
+
+        command = [sys.executable, "-m", "scrapy", "crawl", spider, "-s", f"SCHEDULER={SCHEDULER}"]
+        for arg in opts.spargs:
+            command += ["-a", arg]
+        for setting in opts.set:
+            command += ["-s", setting]
+        procs = [
+            subprocess.Popen(command + ["-s", f"FRONTIER_WORKER_ID={socket.gethostname()}:{spider}-{i}"])
+            for i in range(opts.workers)
+        ]
+        codes = [proc.wait() for proc in procs]
+        self.exitcode = max(codes)
+        self._print_status(spider)
+
+    def _connect(self):
+        conn = psycopg2.connect(**self.settings.getdict("DATABASE"))
+        create_tables(conn)
+        return conn
+
+    def _print_status(self, spider):
+        conn = self._connect()
+        try:
+            status = frontier_status(conn, spider)
+        finally:
+            conn.close()
+        print(f"\n{'spider':<20} {'état':<8} {'requêtes':>10}")
+        for (name, state), count in status.items():
+            print(f"{name:<20} {state:<8} {count:>10}")
+
+    def _reset(self, spider):
+        conn = self._connect()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM crawl_frontier WHERE spider = %s", (spider,))
+                print(f"{cur.rowcount} requête(s) supprimée(s) pour {spider}")
+            conn.commit()
+        finally:
+            conn.close()
@@ -0,0 +1,404 @@
+"""
+Écriture groupée vers PostgreSQL.
+
+Les items sont mis en tampon puis envoyés par lots : ``COPY`` dans une table
+temporaire de staging, puis une seule fusion ensembliste
+``INSERT ... SELECT ... ON CONFLICT (url) DO UPDATE`` dans la table cible.
+Un lot = un aller-retour réseau et un seul COMMIT, au lieu d'un par annonce.
+
+Les lots sont écrits hors du thread du reactor, dans un pool de threads
+borné : un COMMIT lent ne bloque plus les téléchargements en cours.
+"""
+import io
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from psycopg2.pool import ThreadedConnectionPool
+from twisted.internet import defer, task
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+
+
+def db_route(crawler):
+    """Pipeline PostgreSQL du spider selon DB_PIPELINE_ROUTES (None : pas d'écriture en base)."""
+    return crawler.settings.getdict("DB_PIPELINE_ROUTES").get(crawler.spidercls.name) or None
+
+
+def _copy_value(value):
+    """Sérialise une valeur au format texte de COPY (NULL = \\N)."""
+    if value is None:
+        return r"\N"
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    text = str(value)
+    return (
+        text.replace("\\", "\\\\")
+            .replace("\t", "\\t")
+            .replace("\n", "\\n")
+            .replace("\r", "\\r")
+    )
+
+
+def copy_rows(cur, table, columns, rows):
+    """``COPY table (columns) FROM STDIN`` des tuples ``rows``."""
+    buf = io.StringIO()
+    for row in rows:
+        buf.write("\t".join(_copy_value(v) for v in row))
+        buf.write("\n")
+    buf.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buf)
+
+
+class ConnectionPool:
+    """
+    Pool de connexions psycopg2 partagé par les threads d'écriture, et le
+    pool de threads qui va avec (``threads=0`` : écriture dans le reactor).
+
+    ``acquire`` / ``release`` : un seul pool par base et par processus,
+    partagé par tous les pipelines (plusieurs spiders dans le même reactor,
+    cf. ``scrapy crawlall``) ; il est fermé au dernier ``release``.
+    """
+
+    _shared = {}
+
+    def __init__(self, db_params, threads=2):
+        self.threads = threads
+        self.key = None
+        self.users = 0
+        # une connexion par thread d'écriture, plus une pour le reactor
+        # (schéma, empreintes à l'ouverture d'un pipeline) : getconn ne lève
+        # pas PoolError quand les écritures tiennent toutes les autres
+        self.pool = ThreadedConnectionPool(1, threads + 1, **db_params)
+        self.threadpool = None
+        if threads:
+            self.threadpool = ThreadPool(minthreads=1, maxthreads=threads, name="immo-db")
+            self.threadpool.start()
+
+    @contextmanager
+    def connection(self):
+        conn = self.pool.getconn()
+        try:
+            yield conn
+        finally:
+            # une connexion cassée n'est pas remise dans le pool
+            self.pool.putconn(conn, close=bool(conn.closed))
+
+    def run(self, func, *args):
+        """Exécute ``func`` dans le pool de threads ; renvoie un Deferred."""
+        if self.threadpool is None:
+            return defer.maybeDeferred(func, *args)
+        from twisted.internet import reactor
+        return deferToThreadPool(reactor, self.threadpool, func, *args)
+
+    @classmethod
+    def acquire(cls, db_params, threads=2):
+        key = tuple(sorted(db_params.items()))
+        pool = cls._shared.get(key)
+        if pool is None:
+            pool = cls._shared[key] = cls(db_params, threads=threads)
+            pool.key = key
+        pool.users += 1
+        return pool
+
+    def release(self):
+        """Rend le pool ; renvoie True s'il a été fermé (dernier utilisateur)."""
+        self.users -= 1
+        if self.users > 0:
+            return False
+        self._shared.pop(self.key, None)
+        self.close()
+        return True
+
+    def close(self):
+        if self.threadpool is not None:
+            self.threadpool.stop()
+            self.threadpool = None
+        if not self.pool.closed:
+            self.pool.closeall()
+
+
+class BulkWriter:
+    """
+    Tampon d'écriture pour une table : un lot part dès que ``batch_size``
+    lignes sont en attente ou que la plus ancienne attend depuis
+    ``flush_interval`` secondes, et systématiquement par ``close()``.
+
+    Au plus ``pool.threads`` lots s'écrivent en parallèle. Au-delà de
+    ``max_pending_rows`` lignes non encore commitées, ``add()`` renvoie un
+    Deferred qui ne se déclenche qu'une fois la file redescendue : le
+    pipeline le renvoie à Scrapy, qui cesse alors d'alimenter le scraper.
+
+    La sémantique d'upsert est celle des anciens pipelines : conflit sur
+    ``conflict_column`` (une colonne ou un tuple, ex. ``("source", "url")``)
+    -> mise à jour des seules colonnes ``update_columns``.
+    Avec ``unchanged_column`` (ex. ``content_hash``), une ligne dont cette
+    colonne est identique en base n'est pas réécrite.
+    ``on_written(rows)`` reçoit, dans le reactor, les lignes (tuples dans
+    l'ordre de ``columns``) de chaque lot commité.
+    """
+
+    def __init__(self, pool, table, columns, conflict_column="url",
+                 update_columns=("price", "scraped_at"), order_column="scraped_at",
+                 unchanged_column=None,
+                 batch_size=500, flush_interval=5.0, max_pending_rows=5000,
+                 logger=None, stats=None, metrics=None, tag="POSTGRES", on_written=None):
+        self.pool = pool
+        self.table = table
+        self.columns = tuple(columns)
+        self.conflict_columns = (
+            (conflict_column,) if isinstance(conflict_column, str) else tuple(conflict_column)
+        )
+        self.update_columns = tuple(update_columns)
+        self.order_column = order_column
+        self.unchanged_column = unchanged_column
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending_rows = max_pending_rows
+        self.logger = logger
+        self.stats = stats
+        self.metrics = metrics
+        self.tag = tag
+        self.on_written = on_written
+
+        self.buffer = []
+        self.first_buffered_at = None
+        self.inflight_rows = 0
+        self.rows_written = 0
+        self.seconds_spent = 0.0
+        self.staging = f"_staging_{table}"
+        self._staging_pids = set()
+        self._semaphore = defer.DeferredSemaphore(max(pool.threads, 1))
+        self._inflight = set()
+        self._waiters = []
+        self._timer = None
+        self._rejected = set()
+
+    # ------------------------------------------------------------------
+    # SQL
+    # ------------------------------------------------------------------
+    @property
+    def _column_list(self):
+        return ", ".join(self.columns)
+
+    @property
+    def _conflict_list(self):
+        return ", ".join(self.conflict_columns)
+
+    @property
+    def _update_clause(self):
+        clause = ", ".join(f"{col} = EXCLUDED.{col}" for col in self.update_columns)
+        if self.unchanged_column:
+            col = self.unchanged_column
+            clause += f" WHERE {self.table}.{col} IS DISTINCT FROM EXCLUDED.{col}"
+        return clause
+
+    def _merge_sql(self):
+        # DISTINCT ON : une même URL deux fois dans un lot ferait échouer
+        # ON CONFLICT (« cannot affect row a second time ») -> on garde la
+        # version la plus récente.
+        return f"""
+            INSERT INTO {self.table} ({self._column_list})
+            SELECT DISTINCT ON ({self._conflict_list}) {self._column_list}
+            FROM {self.staging}
+            ORDER BY {self._conflict_list}, {self.order_column} DESC
+            ON CONFLICT ({self._conflict_list}) DO UPDATE SET {self._update_clause};
+        """
+
+    def _upsert_sql(self):
+        placeholders = ", ".join(["%s"] * len(self.columns))
+        return f"""
+            INSERT INTO {self.table} ({self._column_list})
+            VALUES ({placeholders})
+            ON CONFLICT ({self._conflict_list}) DO UPDATE SET {self._update_clause};
+        """
+
+    def _staging_sql(self):
+        return f"""
+            CREATE TEMP TABLE IF NOT EXISTS {self.staging}
+            (LIKE {self.table} INCLUDING DEFAULTS)
+            ON COMMIT DELETE ROWS;
+        """
+
+    def _ensure_staging(self, conn, cur):
+        # Table de session, vidée à chaque COMMIT : créée une fois par connexion.
+        pid = conn.info.backend_pid
+        if pid in self._staging_pids:
+            return
+        cur.execute(self._staging_sql())
+        self._staging_pids.add(pid)
+
+    # ------------------------------------------------------------------
+    # API (thread du reactor)
+    # ------------------------------------------------------------------
+    def start(self):
+        """Démarre le déclencheur périodique des lots « trop vieux »."""
+        self._timer = task.LoopingCall(self._tick)
+        self._timer.start(max(self.flush_interval / 2, 0.1), now=False)
+
+    def add(self, row):
+        """
+        Ajoute une ligne (dict ou item). Renvoie None, ou un Deferred si la
+        file d'écriture est pleine (contre-pression).
+        """
+        self.buffer.append(tuple(row.get(col) for col in self.columns))
+        if self.first_buffered_at is None:
+            self.first_buffered_at = time.monotonic()
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+        if self.pending_rows > self.max_pending_rows:
+            self._inc_stat("backpressure")
+            waiter = defer.Deferred()
+            self._waiters.append(waiter)
+            return waiter
+        return None
+
+    @property
+    def pending_rows(self):
+        return len(self.buffer) + self.inflight_rows
+
+    def flush(self):
+        """Envoie le tampon courant ; renvoie le Deferred de ce lot."""
+        rows, self.buffer = self.buffer, []
+        self.first_buffered_at = None
+        if not rows:
+            return defer.succeed(0)
+
+        self.inflight_rows += len(rows)
+        d = self._semaphore.run(self.pool.run, self._write, rows)
+        d.addCallback(self._written, rows)
+        d.addErrback(self._failed, rows)
+        self._inflight.add(d)
+        d.addBoth(self._done, d, rows)
+        return d
+
+    def close(self):
+        """Vide le tampon et attend la fin de tous les lots en cours."""
+        if self._timer is not None and self._timer.running:
+            self._timer.stop()
+        self.flush()
+        d = defer.DeferredList(list(self._inflight))
+        d.addCallback(lambda _: self._report())
+        return d
+
+    @property
+    def rows_per_second(self):
+        if not self.seconds_spent:
+            return 0.0
+        return self.rows_written / self.seconds_spent
+
+    # ------------------------------------------------------------------
+    # Callbacks (thread du reactor)
+    # ------------------------------------------------------------------
+    def _tick(self):
+        if (
+            self.first_buffered_at is not None
+            and time.monotonic() - self.first_buffered_at >= self.flush_interval
+        ):
+            self.flush()
+
+    def _written(self, elapsed, rows):
+        self.rows_written += len(rows)
+        self.seconds_spent += elapsed
+        self._inc_stat("rows", len(rows))
+        self._inc_stat("flushes")
+        if self.metrics is not None:
+            self.metrics.observe("db_flush_seconds", elapsed, table=self.table)
+            self.metrics.observe("db_batch_rows", len(rows), table=self.table)
+        self._log("debug", "[%s] %d lignes écrites en %.3fs", self.tag, len(rows), elapsed)
+        if self.on_written is not None:
+            # lignes réellement en base : sans celles refusées au repli
+            self.on_written([row for row in rows if id(row) not in self._rejected])
+        return len(rows)
+
+    def _failed(self, failure, rows):
+        self._inc_stat("errors", len(rows))
+        self._log("error", "[%s] lot de %d perdu : %s", self.tag, len(rows),
+                  failure.getErrorMessage())
+        return 0
+
+    def _done(self, result, d, rows):
+        self._inflight.discard(d)
+        self._rejected.difference_update(map(id, rows))
+        self.inflight_rows -= len(rows)
+        while self._waiters and self.pending_rows <= self.max_pending_rows:
+            self._waiters.pop(0).callback(None)
+        return result
+
+    def _report(self):
+        rate = self.rows_per_second
+        if self.stats is not None:
+            self.stats.set_value(f"{self._stat_prefix}/rows_per_sec", round(rate, 1))
+        self._log("info", "[%s] %d lignes écrites en %.2fs (%.0f lignes/s)",
+                  self.tag, self.rows_written, self.seconds_spent, rate)
+
+    # ------------------------------------------------------------------
+    # Écriture (pool de threads)
+    # ------------------------------------------------------------------
+    def _write(self, rows):
+        start = time.monotonic()
+        with self.pool.connection() as conn:
+            try:
+                self._copy_and_merge(conn, rows)
+            except Exception as exc:
+                conn.rollback()
+                self._staging_pids.discard(conn.info.backend_pid)
+                self._log("warning", "[%s] lot de %d refusé (%s), repli ligne à ligne",
+                          self.tag, len(rows), exc)
+                failed = self._fallback(conn, rows)
+                if failed:
+                    self._reject(failed)
+        return time.monotonic() - start
+
+    def _copy_and_merge(self, conn, rows):
+        with conn.cursor() as cur:
+            self._ensure_staging(conn, cur)
+            copy_rows(cur, self.staging, self.columns, rows)
+            cur.execute(self._merge_sql())
+        conn.commit()
+
+    def _reject(self, rows):
+        # tenu dans le reactor, avant l'annonce du lot écrit : les points de
+        # reprise lisent la stat (cf. scrapping_immobli.checkpoint), on_written
+        # écarte ces lignes
+        if self.pool.threadpool is None:  # DB_WRITE_THREADS = 0 : écriture dans le reactor
+            self._rejected_rows(rows)
+        else:
+            from twisted.internet import reactor
+            reactor.callFromThread(self._rejected_rows, rows)
+
+    def _rejected_rows(self, rows):
+        self._rejected.update(map(id, rows))
+        self._inc_stat("errors", len(rows))
+
+    def _fallback(self, conn, rows):
+        """Isole les lignes invalides : une transaction par ligne ; renvoie les lignes refusées."""
+        sql = self._upsert_sql()
+        failed = []
+        for row in rows:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(sql, row)
+                conn.commit()
+            except Exception as exc:
+                conn.rollback()
+                failed.append(row)
+                url = row[self.columns.index(self.conflict_columns[-1])]
+                self._log("error", "[%s] ERREUR %s : %s", self.tag, url, exc)
+        return failed
+
+    # ------------------------------------------------------------------
+    # Divers
+    # ------------------------------------------------------------------
+    @property
+    def _stat_prefix(self):
+        return f"postgres/{self.table}"
+
+    def _inc_stat(self, key, count=1):
+        if self.stats is not None:
+            self.stats.inc_value(f"{self._stat_prefix}/{key}", count)
+
+    def _log(self, level, msg, *args):
+        if self.logger is not None:
+            getattr(self.logger, level)(msg, *args)
@@ -0,0 +1,274 @@
+"""
+Export colonnaire (Parquet) des tables d'annonces, pour l'analyse.
+
+- colonnes typées (entiers, réels, horodatage) au lieu du tout-texte JSON ;
+  ``source``, ``city``, ``region``, ``property_type``, ``statut`` et
+  ``geo_level`` sont encodées en dictionnaire (catégories côté pandas) ;
+- lecture en flux : curseur serveur PostgreSQL, paquets de
+  EXPORT_CHUNK_ROWS lignes, un row group Parquet par paquet ; la mémoire
+  ne dépend pas de la taille de la table ;
+- partitions Hive ``source=<source>/scraped_date=<AAAA-MM-JJ>/``, même
+  schéma pour toutes les tables (colonnes absentes d'un site à NULL) ;
+- incrémental : seules les lignes dont ``scraped_at`` dépasse le filigrane
+  du dernier export (``_watermarks.json`` dans le dossier) sont écrites,
+  dans de nouveaux fichiers ; une annonce modifiée y reparaît avec son
+  nouveau ``scraped_at`` (garder la ligne la plus récente par ``id``).
+
+pyarrow est optionnel : seul l'export en a besoin (``pip install pyarrow``).
+"""
+import json
+import os
+from datetime import datetime, timedelta
+from itertools import groupby
+
+from scrapy.exporters import BaseItemExporter
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    pa = pq = None
+
+WATERMARKS_FILE = "_watermarks.json"
+DICTIONARY_COLUMNS = ("source", "city", "region", "property_type", "statut", "geo_level")
+
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError("l'export Parquet demande pyarrow : pip install pyarrow")
+
+
+def arrow_type(column):
+    """Type Arrow d'une colonne des tables d'annonces (texte par défaut)."""
+    if column in DICTIONARY_COLUMNS:
+        return pa.dictionary(pa.int32(), pa.string())
+    return {
+        "price": pa.int64(),
+        "bedrooms": pa.int32(),
+        "bathrooms": pa.int32(),
+        "nb_annonces": pa.int32(),
+        "surface_area": pa.float32(),
+        "latitude": pa.float32(),
+        "longitude": pa.float32(),
+        "scraped_at": pa.timestamp("us"),
+        "content_hash": pa.int64(),
+    }.get(column, pa.string())
+
+
+def arrow_schema(columns):
+    require_pyarrow()
+    return pa.schema([pa.field(column, arrow_type(column)) for column in columns])
+
+
+def _to_array(values, type_):
+    if pa.types.is_dictionary(type_):
+        return pa.array(_as_text(values), type=pa.string()).dictionary_encode()
+    if pa.types.is_string(type_):
+        values = _as_text(values)
+    return pa.array(values, type=type_)
+
+
+def _as_text(values):
+    return [
+        value if value is None or isinstance(value, str)
+        else json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list))
+        else str(value)
+        for value in values
+    ]
+
+
+def record_batch(schema, columns_values):
+    """RecordBatch depuis une liste de colonnes (listes de valeurs Python)."""
+    return pa.RecordBatch.from_arrays(
+        [_to_array(values, field.type) for values, field in zip(columns_values, schema)],
+        schema=schema,
+    )
+
+
+# ----------------------------------------------------------------------
+# Export depuis PostgreSQL (scrapy export)
+# ----------------------------------------------------------------------
+def load_watermarks(out_dir):
+    path = os.path.join(out_dir, WATERMARKS_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return {table: datetime.fromisoformat(value) for table, value in json.load(f).items()}
+
+
+def save_watermarks(out_dir, watermarks):
+    path = os.path.join(out_dir, WATERMARKS_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({table: value.isoformat() for table, value in watermarks.items()}, f, indent=2)
+    os.replace(tmp, path)
+
+
+class PartitionedParquetWriter:
+    """
+    Un fichier Parquet par partition (source, jour) et par export. Les lignes
+    arrivant triées sur ``scraped_at``, un seul fichier est ouvert à la fois.
+    Chaque fichier est écrit sous un nom caché puis renommé une fois fermé :
+    un export interrompu ne laisse pas de fichier tronqué visible.
+    """
+
+    def __init__(self, out_dir, schema, run_name, compression="zstd"):
+        self.out_dir = out_dir
+        self.schema = schema
+        self.run_name = run_name
+        self.compression = compression
+        self.partition = None
+        self.writer = None
+        self.name = self.tmp_path = None
+        self.files = []
+        self.rows = 0
+
+    def write(self, partition, batch):
+        if partition != self.partition:
+            self._close_file()
+            self._open_file(partition)
+        self.writer.write_batch(batch)
+        self.rows += batch.num_rows
+
+    def close(self):
+        self._close_file()
+        return self.files
+
+    def _open_file(self, partition):
+        source, day = partition
+        directory = os.path.join(self.out_dir, f"source={source}", f"scraped_date={day}")
+        os.makedirs(directory, exist_ok=True)
+        self.partition = partition
+        # plusieurs sources mêlées : une partition peut être rouverte
+        self.name = f"{self.run_name}-{len(self.files):04d}.parquet"
+        self.tmp_path = os.path.join(directory, f".{self.name}.tmp")
+        self.writer = pq.ParquetWriter(self.tmp_path, self.schema, compression=self.compression)
+
+    def _close_file(self):
+        if self.writer is None:
+            return
+        self.writer.close()
+        path = os.path.join(os.path.dirname(self.tmp_path), self.name)
+        os.replace(self.tmp_path, path)
+        self.files.append(path)
+        self.writer = self.tmp_path = self.partition = None
+
+
+def export_table(conn, table, columns, out_dir, since=None, until=None, chunk_rows=50000,
+                 schema_columns=None):
+    """
+    Lignes de ``table`` avec ``since < scraped_at <= until``, en flux.
+    ``schema_columns`` : colonnes des fichiers (toutes tables confondues,
+    NULL pour celles que ``table`` n'a pas) ; ``source`` n'est pas écrite
+    dans les fichiers, elle vient du chemin de la partition.
+    Retourne (lignes écrites, fichiers).
+    """
+    file_columns = [col for col in (schema_columns or columns) if col != "source"]
+    schema = arrow_schema(file_columns)
+    where, params = ["scraped_at IS NOT NULL"], []
+    if since is not None:
+        where.append("scraped_at > %s")
+        params.append(since)
+    if until is not None:
+        where.append("scraped_at <= %s")
+        params.append(until)
+
+    run_name = f"{table}-{(until or datetime.utcnow()):%Y%m%dT%H%M%S}"
+    writer = PartitionedParquetWriter(out_dir, schema, run_name)
+    select = ["source"] + [col if col in columns else f"NULL AS {col}" for col in file_columns]
+    date_index = 1 + file_columns.index("scraped_at")
+
+    def partition(row):
+        return (row[0] or "inconnue", row[date_index].date().isoformat())
+
+    with conn.cursor(name=f"export_{table}") as cur:
+        cur.itersize = chunk_rows
+        cur.execute(
+            f"SELECT {', '.join(select)} FROM {table}"
+            f" WHERE {' AND '.join(where)} ORDER BY scraped_at",
+            params,
+        )
+        while True:
+            rows = cur.fetchmany(chunk_rows)
+            if not rows:
+                break
+            # lignes triées par date : un paquet couvre une ou deux partitions
+            for key, group in groupby(rows, key=partition):
+                writer.write(key, record_batch(schema, list(zip(*group))[1:]))
+    conn.commit()
+    return writer.rows, writer.close()
+
+
+def export_all(conn, sources, out_dir, full=False, lag=60, chunk_rows=50000, log=print):
+    """
+    Export de chaque table de ``sources`` ; le filigrane d'une table n'avance
+    qu'une fois ses fichiers écrits. Les ``lag`` dernières secondes sont
+    laissées au prochain export : les lignes encore en file d'écriture
+    (BulkWriter) ont un ``scraped_at`` un peu antérieur à leur COMMIT.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    watermarks = {} if full else load_watermarks(out_dir)
+    until = datetime.utcnow() - timedelta(seconds=lag)
+    # schéma commun : ``pd.read_parquet(out_dir)`` lit toutes les sources d'un coup
+    schema_columns = list(dict.fromkeys(col for _, columns in sources for col in columns))
+    total = 0
+    for table, columns in sources:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass(%s)", (table,))
+            exists = cur.fetchone()[0] is not None
+        conn.commit()
+        if not exists:
+            log(f"{table} : table absente, ignorée")
+            continue
+        since = watermarks.get(table)
+        rows, files = export_table(conn, table, columns, out_dir, since, until, chunk_rows,
+                                   schema_columns)
+        watermarks[table] = until
+        save_watermarks(out_dir, watermarks)
+        total += rows
+        log(f"{table} : {rows} lignes, {len(files)} fichiers"
+            f" (depuis {since.isoformat() if since else 'le début'})")
+    return total
+
+
+# ----------------------------------------------------------------------
+# Feed exporter (FEEDS = {...: {"format": "parquet"}})
+# ----------------------------------------------------------------------
+class ParquetItemExporter(BaseItemExporter):
+    """
+    Exporter Scrapy : items mis en tampon puis écrits par row groups de
+    ``chunk_rows`` lignes. Colonnes : ``fields_to_export``, sinon les champs
+    déclarés de la classe du premier item.
+    """
+
+    def __init__(self, file, **kwargs):
+        require_pyarrow()
+        self.chunk_rows = int(kwargs.pop("chunk_rows", 10000))
+        super().__init__(dont_fail=True, **kwargs)
+        self.file = file
+        self.columns = None
+        self.schema = None
+        self.writer = None
+        self.buffer = []
+
+    def export_item(self, item):
+        fields = dict(self.get_serialized_fields(item, include_empty=True))
+        if self.schema is None:
+            self.columns = list(fields)
+            self.schema = arrow_schema(self.columns)
+        self.buffer.append(tuple(fields.get(column) for column in self.columns))
+        if len(self.buffer) >= self.chunk_rows:
+            self._flush()
+
+    def finish_exporting(self):
+        self._flush()
+        if self.writer is not None:
+            self.writer.close()
+
+    def _flush(self):
+        if not self.buffer:
+            return
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.file, self.schema, compression="zstd")
+        self.writer.write_batch(record_batch(self.schema, list(zip(*self.buffer))))
+        self.buffer = []
@@ -0,0 +1,135 @@
+"""
+Moteur d'extraction déclaratif, partagé par les trois spiders.
+
+Chaque site décrit sa fiche annonce par un ``Schema`` : une liste de
+``Field(nom, sélecteur CSS ou XPath, post-traitements, required)``. Le
+schéma est compilé une seule fois, au chargement du module du spider :
+CSS -> XPath (parsel) -> ``lxml.etree.XPath``, et les expressions régulières
+des post-traitements sont précompilées. ``Schema.extract`` évalue ensuite
+tous les champs sur l'arbre lxml déjà construit par la réponse, sans
+ItemLoader ni re-traduction des sélecteurs.
+"""
+import re
+
+from lxml import etree
+from parsel.csstranslator import HTMLTranslator
+
+from scrapping_immobli.normalize import text as normalize_text
+
+_translator = HTMLTranslator()
+
+
+# ----------------------------------------------------------------------
+# Post-traitements usuels (fabriques : la regex est compilée une fois)
+# ----------------------------------------------------------------------
+def regex(pattern, group=1, convert=None):
+    """Premier groupe capturé par ``pattern`` (converti si demandé), sinon None."""
+    compiled = re.compile(pattern)
+
+    def _regex(value):
+        match = compiled.search(value)
+        if not match:
+            return None
+        result = match.group(group)
+        return convert(result) if convert else result
+    return _regex
+
+
+def remove(*fragments):
+    """Retire des libellés fixes (« Membre depuis », « Référence… »)."""
+    def _remove(value):
+        for fragment in fragments:
+            value = value.replace(fragment, "")
+        return value.strip() or None
+    return _remove
+
+
+def constant(if_true, if_false=None):
+    """Pour ``mode="exists"`` : valeur selon la présence du nœud."""
+    def _constant(present):
+        return if_true if present else if_false
+    return _constant
+
+
+# ----------------------------------------------------------------------
+# Champs et schémas
+# ----------------------------------------------------------------------
+def _texts(nodes):
+    """Textes non vides, espaces normalisés (les nœuds élément sont ignorés)."""
+    for node in nodes:
+        if isinstance(node, str):
+            text = normalize_text(node)
+            if text:
+                yield text
+
+
+class Field:
+    """
+    Un champ d'item.
+
+    ``mode`` :
+      - ``first``  : première valeur texte non vide (strippée) ;
+      - ``join``   : tous les textes non vides, joints par un espace ;
+      - ``all``    : liste des textes non vides ;
+      - ``exists`` : True/False selon la présence d'au moins un nœud.
+    """
+    __slots__ = ("name", "query", "post", "required", "mode", "xpath")
+
+    def __init__(self, name, css=None, xpath=None, post=(), required=False, mode="first"):
+        if (css is None) == (xpath is None):
+            raise ValueError(f"{name} : indiquer css= ou xpath=")
+        self.name = name
+        self.query = css or xpath
+        self.post = tuple(post) if isinstance(post, (list, tuple)) else (post,)
+        self.required = required
+        self.mode = mode
+        source = _translator.css_to_xpath(css) if css is not None else xpath
+        self.xpath = etree.XPath(source, smart_strings=False)
+
+    def extract(self, root):
+        nodes = self.xpath(root)
+        if self.mode == "exists":
+            value = bool(nodes)
+        elif self.mode == "first":
+            value = next(_texts(nodes), None)
+        else:
+            texts = list(_texts(nodes))
+            if self.mode == "join":
+                value = " ".join(texts) or None
+            else:
+                value = texts or None
+        for func in self.post:
+            if value is None:
+                break
+            value = func(value)
+        return value
+
+
+class Schema:
+    """Ensemble de champs compilés ; ``extract`` renvoie (valeurs, champs requis manquants)."""
+
+    def __init__(self, *fields):
+        self.fields = fields
+
+    def extract(self, root):
+        values = {}
+        missing = []
+        for field in self.fields:
+            value = field.extract(root)
+            if value is None:
+                if field.required:
+                    missing.append(field.name)
+                continue
+            values[field.name] = value
+        return values, missing
+
+    def extract_response(self, response):
+        return self.extract(response.selector.root)
+
+    def extract_html(self, body, encoding="utf-8"):
+        """Extraction depuis des octets bruts (sans objet Response)."""
+        parser = etree.HTMLParser(encoding=encoding)
+        root = etree.fromstring(body, parser=parser)
+        if root is None:
+            return {}, [f.name for f in self.fields if f.required]
+        return self.extract(root)
@@ -0,0 +1,290 @@
+"""
+Revisite des annonces selon leur fraîcheur (FRESHNESS_ENABLED).
+
+Une annonce récente change souvent de prix dans ses premiers jours, une
+annonce ancienne presque jamais : plutôt que de tout retélécharger à
+chaque run, chaque annonce a sa propre date de prochaine visite.
+
+- ``listing_state`` (scrapping_immobli.history) compte les passages
+  (``visits``) et les changements de prix / statut (``changes``) de chaque
+  annonce, à côté de ``first_seen`` / ``last_seen`` ;
+- taux de changement estimé, en changements par jour (processus de
+  Poisson, a priori FRESHNESS_PRIOR_CHANGES changements sur
+  FRESHNESS_PRIOR_DAYS jours) ::
+
+      taux = (changes + PRIOR_CHANGES) / (âge en jours + PRIOR_DAYS)
+
+  avec âge = ``last_seen - first_seen`` : une annonce neuve part du taux a
+  priori, chaque jour sans changement le fait baisser, chaque changement
+  le remonte ;
+- prochaine visite : quand la probabilité d'un changement depuis
+  ``last_seen`` atteint FRESHNESS_TARGET, soit ``-ln(1 - cible) / taux``
+  jours après, borné par FRESHNESS_MIN_INTERVAL et FRESHNESS_MAX_INTERVAL ;
+- au démarrage de chaque spider, FreshnessMiddleware prend les annonces
+  échues de son site, les plus en retard d'abord (temps écoulé /
+  intervalle), dans la limite de FRESHNESS_BUDGET requêtes
+  (FRESHNESS_SITE_BUDGETS par site), et les envoie droit aux fiches, après
+  les requêtes de départ, avec la priorité FRESHNESS_PRIORITY : les fiches
+  découvertes sur les listings passent devant ;
+- une fiche revisitée qui répond 404 / 410 marque l'annonce disparue
+  (``gone_at``) : elle sort de la file, et y revient si un listing la
+  montre de nouveau.
+
+``scrapy freshness`` affiche la file par site et les intervalles obtenus.
+"""
+import math
+from datetime import datetime
+
+import psycopg2
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.spidermiddlewares.httperror import HttpError
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet.threads import deferToThread
+
+from scrapping_immobli.db import db_route
+from scrapping_immobli.listings import LISTING_COLUMNS
+
+FRESHNESS_DDL = """
+    ALTER TABLE listing_state
+        ADD COLUMN IF NOT EXISTS visits INTEGER NOT NULL DEFAULT 1,
+        ADD COLUMN IF NOT EXISTS changes INTEGER NOT NULL DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS gone_at TIMESTAMP;
+    -- bases existantes : chaque observation après la première est un changement
+    UPDATE listing_state s SET visits = o.n, changes = o.n - 1
+    FROM (SELECT id, count(*) AS n FROM listing_observations GROUP BY id) o
+    WHERE o.id = s.id AND o.n > 1;
+    CREATE INDEX IF NOT EXISTS listing_state_due
+        ON listing_state (source, last_seen) WHERE gone_at IS NULL;
+"""
+
+FRESHNESS_ID = "freshness_id"
+GONE_STATUSES = (404, 410)
+
+# intervalle de revisite (jours) et temps écoulé (jours) d'une ligne ``s``
+# de listing_state ; mêmes formules que FreshnessPolicy.interval_days
+_INTERVAL = """LEAST(GREATEST(
+    %(expected)s * (EXTRACT(EPOCH FROM s.last_seen - s.first_seen) / 86400.0 + %(prior_days)s)
+    / (s.changes + %(prior_changes)s), %(min_days)s), %(max_days)s)"""
+_ELAPSED = "EXTRACT(EPOCH FROM %(now)s - s.last_seen) / 86400.0"
+
+
+class FreshnessPolicy:
+    """Intervalle de revisite d'une annonce d'après ses changements et son âge."""
+
+    def __init__(self, prior_changes=1.0, prior_days=2.0, target=0.5,
+                 min_interval=12 * 3600, max_interval=30 * 24 * 3600):
+        self.prior_changes = prior_changes
+        self.prior_days = prior_days
+        # P(changement en t jours) = 1 - exp(-taux * t) : changements attendus à la cible
+        self.expected = -math.log(1.0 - target)
+        self.min_days = min_interval / 86400
+        self.max_days = max_interval / 86400
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            prior_changes=settings.getfloat("FRESHNESS_PRIOR_CHANGES", 1.0),
+            prior_days=settings.getfloat("FRESHNESS_PRIOR_DAYS", 2.0),
+            target=min(max(settings.getfloat("FRESHNESS_TARGET", 0.5), 0.01), 0.99),
+            min_interval=settings.getfloat("FRESHNESS_MIN_INTERVAL", 12 * 3600),
+            max_interval=settings.getfloat("FRESHNESS_MAX_INTERVAL", 30 * 24 * 3600),
+        )
+
+    def rate(self, changes, age_days):
+        """Changements par jour estimés."""
+        return (changes + self.prior_changes) / (age_days + self.prior_days)
+
+    def interval_days(self, changes, age_days):
+        days = self.expected / self.rate(changes, age_days)
+        return min(max(days, self.min_days), self.max_days)
+
+    def sql_params(self, **params):
+        params.setdefault("now", datetime.utcnow())
+        return dict(params, expected=self.expected, prior_days=self.prior_days,
+                    prior_changes=self.prior_changes, min_days=self.min_days,
+                    max_days=self.max_days)
+
+
+# ----------------------------------------------------------------------
+# File de revisite
+# ----------------------------------------------------------------------
+def due_listings(conn, policy, source, budget, columns=()):
+    """
+    Annonces échues d'une source, les plus en retard d'abord :
+    ``[(id, url, retard, échues en tout, *colonnes de listings)]``, où
+    retard = temps écoulé / intervalle (>= 1).
+    """
+    extra = "".join(f", l.{col}" for col in columns)
+    join = " LEFT JOIN listings l ON l.source = s.source AND l.id = s.id" if columns else ""
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT s.id, s.url, q.urgency, count(*) OVER (){extra}
+            FROM listing_state s
+            CROSS JOIN LATERAL (SELECT {_ELAPSED} / {_INTERVAL} AS urgency) q{join}
+            WHERE s.source = %(source)s AND s.gone_at IS NULL
+              AND s.last_seen <= %(now)s - %(min_days)s * interval '1 day'
+              AND q.urgency >= 1
+            ORDER BY q.urgency DESC
+            LIMIT %(budget)s
+        """, policy.sql_params(source=source, budget=budget))
+        rows = cur.fetchall()
+    conn.commit()
+    return rows
+
+
+def freshness_summary(conn, policy):
+    """Par source : (suivies, échues, disparues, intervalle médian en jours)."""
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT s.source, count(*),
+                   count(*) FILTER (WHERE s.gone_at IS NULL AND {_ELAPSED} >= q.days),
+                   count(s.gone_at),
+                   percentile_cont(0.5) WITHIN GROUP (ORDER BY q.days)
+            FROM listing_state s
+            CROSS JOIN LATERAL (SELECT {_INTERVAL} AS days) q
+            GROUP BY s.source ORDER BY s.source
+        """, policy.sql_params())
+        rows = cur.fetchall()
+    conn.commit()
+    return rows
+
+
+def mark_gone(conn, ids, when=None):
+    with conn.cursor() as cur:
+        cur.execute("UPDATE listing_state SET gone_at = %s WHERE id = ANY(%s) AND gone_at IS NULL",
+                    (when or datetime.utcnow(), list(ids)))
+        count = cur.rowcount
+    conn.commit()
+    return count
+
+
+# ----------------------------------------------------------------------
+# Middleware
+# ----------------------------------------------------------------------
+class FreshnessMiddleware:
+    """
+    Middleware spider : la file de revisite suit les requêtes de départ du
+    spider ; les annonces disparues (404 / 410) sont notées à la fermeture.
+    Le spider fabrique les requêtes (``recrawl_request``) et peut demander
+    des colonnes de ``listings`` en meta (``RECRAWL_META``).
+    """
+
+    def __init__(self, crawler, policy, db_params, budget, priority):
+        self.crawler = crawler
+        self.policy = policy
+        self.db_params = db_params
+        self.budget = budget
+        self.priority = priority
+        self.gone = []
+        self.started = False
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("FRESHNESS_ENABLED") or db_route(crawler) is None:
+            raise NotConfigured
+        budgets = settings.getdict("FRESHNESS_SITE_BUDGETS")
+        mw = cls(
+            crawler,
+            FreshnessPolicy.from_settings(settings),
+            settings.getdict("DATABASE"),
+            int(budgets.get(crawler.spidercls.name, settings.getint("FRESHNESS_BUDGET", 200))),
+            settings.getint("FRESHNESS_PRIORITY", -20),
+        )
+        crawler.signals.connect(mw.spider_closed, signal=signals.spider_closed)
+        return mw
+
+    async def process_start(self, start):
+        # Scrapy >= 2.13. Les premières requêtes de départ partent au
+        # téléchargeur sans passer par les priorités du scheduler : les pages
+        # de listing d'abord, la file de revisite ensuite
+        self.started = True
+        async for request in start:
+            yield request
+        spider = self.crawler.spider
+        if self._wanted(spider):
+            columns = self._columns(spider)
+            try:
+                rows = await maybe_deferred_to_future(deferToThread(self._load, spider.name, columns))
+            except psycopg2.Error as exc:
+                rows = self._unavailable(spider, exc)
+            for request in self._requests(spider, columns, rows):
+                yield request
+
+    def process_start_requests(self, start_requests, spider):
+        # Scrapy < 2.13 : itérateur synchrone, la file est lue dans le
+        # reactor (une requête SQL, une fois, après les requêtes de départ)
+        self.started = True
+        yield from start_requests
+        if self._wanted(spider):
+            columns = self._columns(spider)
+            try:
+                rows = self._load(spider.name, columns)
+            except psycopg2.Error as exc:
+                rows = self._unavailable(spider, exc)
+            yield from self._requests(spider, columns, rows)
+
+    def _wanted(self, spider):
+        # spider repris : ses revisites en attente sont déjà dans le journal
+        return self.budget > 0 and hasattr(spider, "recrawl_request") and not getattr(spider, "resumed", False)
+
+    @staticmethod
+    def _columns(spider):
+        return [col for col in getattr(spider, "RECRAWL_META", ()) if col in LISTING_COLUMNS]
+
+    @staticmethod
+    def _unavailable(spider, exc):
+        spider.logger.warning("[FRESHNESS] file de revisite indisponible : %s", exc)
+        return []
+
+    def _requests(self, spider, columns, rows):
+        due = rows[0][3] if rows else 0
+        self.crawler.stats.set_value("freshness/due", due)
+        self.crawler.stats.set_value("freshness/queued", len(rows))
+        spider.logger.info("[FRESHNESS] %d fiches à revisiter (%d échues, budget %d)",
+                           len(rows), due, self.budget)
+        requests = []
+        for listing_id, url, urgency, _, *values in rows:
+            meta = dict(zip(columns, values))
+            meta[FRESHNESS_ID] = listing_id
+            # les plus en retard d'abord, même dans une file LIFO
+            priority = self.priority + min(int(urgency) - 1, 9)
+            requests.append(spider.recrawl_request(url, meta, priority))
+        return requests
+
+    def _load(self, source, columns):
+        conn = psycopg2.connect(**self.db_params)
+        try:
+            return due_listings(conn, self.policy, source, self.budget, columns)
+        finally:
+            conn.close()
+
+    def process_spider_exception(self, response, exception, spider):
+        if not isinstance(exception, HttpError) or response.status not in GONE_STATUSES:
+            return None
+        listing_id = response.meta.get(FRESHNESS_ID)
+        if listing_id is None:
+            return None
+        self.gone.append(listing_id)
+        self.crawler.stats.inc_value("freshness/gone")
+        return []
+
+    def spider_closed(self, spider):
+        if not self.started and self._wanted(spider):
+            spider.logger.warning(
+                "[FRESHNESS] file de revisite jamais envoyée : ni process_start ni "
+                "process_start_requests n'ont été appelés (version de Scrapy ?)")
+        if not self.gone:
+            return None
+        d = deferToThread(self._mark_gone, self.gone)
+        d.addErrback(lambda failure: spider.logger.warning(
+            "[FRESHNESS] annonces disparues non notées : %s", failure.value))
+        return d
+
+    def _mark_gone(self, ids):
+        conn = psycopg2.connect(**self.db_params)
+        try:
+            return mark_gone(conn, ids)
+        finally:
+            conn.close()
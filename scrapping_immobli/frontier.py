@@ -0,0 +1,392 @@
+"""
+Frontière de crawl partagée dans PostgreSQL (même base que les pipelines).
+
+Plusieurs processus ``scrapy crawl <spider>`` — sur une ou plusieurs
+machines — se répartissent les requêtes d'un même spider :
+
+- ``crawl_frontier`` : une ligne par requête, clé = empreinte Scrapy de la
+  requête ; une requête déjà connue n'est pas ré-enfilée (dédoublonnage
+  commun à tous les workers), sauf si elle est terminée depuis plus de
+  FRONTIER_REVISIT_AFTER secondes ;
+- un worker prend des requêtes par lots avec ``FOR UPDATE SKIP LOCKED``
+  et un bail (``lease_until``) ; un bail expiré (worker tombé) remet la
+  requête en file, jusqu'à FRONTIER_MAX_ATTEMPTS tentatives, puis « failed » ;
+  de même, sans attendre l'expiration, pour une requête sortie du moteur
+  sans réponse (DNS, délai dépassé après les nouveaux essais, IgnoreRequest
+  de l'offsite ou de robots.txt) ;
+- ``crawl_domains`` : prochaine date de requête autorisée par domaine, pour
+  tous les workers ensemble (FRONTIER_DOMAIN_DELAY secondes par requête).
+
+Activation : ``-s SCHEDULER=scrapping_immobli.frontier.PostgresScheduler``
+(ou ``scrapy workers <spider> -n 4``). Les appels à la base sont faits
+depuis le reactor, par lots (insertions groupées, baux de plusieurs
+requêtes) pour rester brefs.
+"""
+import os
+import pickle
+import socket
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2.extras import execute_values
+from scrapy import signals
+from scrapy.core.scheduler import BaseScheduler
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.request import request_from_dict
+from twisted.internet.task import LoopingCall
+
+FRONTIER_DDL = """
+    CREATE TABLE IF NOT EXISTS crawl_frontier(
+        fingerprint BYTEA PRIMARY KEY,
+        spider VARCHAR(50) NOT NULL,
+        domain VARCHAR(255) NOT NULL,
+        priority INTEGER NOT NULL DEFAULT 0,
+        request BYTEA NOT NULL,
+        state VARCHAR(10) NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        leased_by VARCHAR(100),
+        lease_until TIMESTAMPTZ,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        done_at TIMESTAMPTZ
+    );
+    CREATE INDEX IF NOT EXISTS crawl_frontier_queued
+        ON crawl_frontier (spider, domain, priority DESC, created_at) WHERE state = 'queued';
+    CREATE INDEX IF NOT EXISTS crawl_frontier_leased
+        ON crawl_frontier (lease_until) WHERE state = 'leased';
+    CREATE TABLE IF NOT EXISTS crawl_domains(
+        domain VARCHAR(255) PRIMARY KEY,
+        next_fetch_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+"""
+
+FP_META = "frontier_fingerprint"
+
+# bail rendu après un essai : remis en file, ou « failed » au dernier essai
+_RELEASE = (
+    "state = CASE WHEN attempts >= %(max)s THEN 'failed' ELSE 'queued' END,"
+    " done_at = CASE WHEN attempts >= %(max)s THEN now() END,"
+    " leased_by = NULL, lease_until = NULL"
+)
+
+
+def create_tables(conn):
+    """DDL sous verrou consultatif : plusieurs workers peuvent démarrer ensemble."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('crawl_frontier'))")
+        cur.execute(FRONTIER_DDL)
+    conn.commit()
+
+
+def frontier_status(conn, spider=None):
+    """{(spider, état): nombre} ; pour ``scrapy workers --status``."""
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT spider, state, COUNT(*) FROM crawl_frontier"
+            " WHERE %(spider)s IS NULL OR spider = %(spider)s"
+            " GROUP BY spider, state ORDER BY spider, state",
+            {"spider": spider},
+        )
+        return {(name, state): count for name, state, count in cur.fetchall()}
+
+
+class PostgresScheduler(BaseScheduler):
+
+    def __init__(self, crawler, db_params, worker_id, lease_seconds=300, lease_batch=16,
+                 insert_batch=100, domain_delay=1.0, max_attempts=3, revisit_after=12 * 3600):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.db_params = db_params
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.lease_batch = lease_batch
+        self.insert_batch = insert_batch
+        self.domain_delay = domain_delay
+        self.max_attempts = max_attempts
+        self.revisit_after = revisit_after
+
+        self.spider = None
+        self.conn = None
+        self.local = deque()         # requêtes sous bail, pas encore rendues au moteur
+        self.leased = set()          # empreintes sous bail détenues par ce worker
+        self.sent = set()            # empreintes sous bail rendues au moteur
+        self.to_enqueue = {}         # empreinte -> (requête, domaine), en attente d'insertion
+        self.done = []               # empreintes terminées, à marquer en base
+        self.known_domains = set()
+        self.next_lease_at = 0.0
+        self.next_reclaim_at = 0.0
+        self.pending_checked_at = 0.0
+        self.pending_in_db = True
+        self.flusher = None
+        self.wakeup = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        scheduler = cls(
+            crawler,
+            settings.getdict("DATABASE"),
+            settings.get("FRONTIER_WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}",
+            lease_seconds=settings.getint("FRONTIER_LEASE_SECONDS", 300),
+            lease_batch=settings.getint("FRONTIER_LEASE_BATCH", 16),
+            insert_batch=settings.getint("FRONTIER_INSERT_BATCH", 100),
+            domain_delay=settings.getfloat("FRONTIER_DOMAIN_DELAY", settings.getfloat("DOWNLOAD_DELAY")),
+            max_attempts=settings.getint("FRONTIER_MAX_ATTEMPTS", 3),
+            revisit_after=settings.getint("FRONTIER_REVISIT_AFTER", 12 * 3600),
+        )
+        crawler.signals.connect(scheduler.response_received, signal=signals.response_received)
+        return scheduler
+
+    # ------------------------------------------------------------------
+    # Cycle de vie
+    # ------------------------------------------------------------------
+    def open(self, spider):
+        self.spider = spider
+        self.conn = psycopg2.connect(**self.db_params)
+        create_tables(self.conn)
+        self.flusher = LoopingCall(self._flush)
+        self.flusher.start(2.0, now=False)
+        spider.logger.info("[FRONTIER] worker %s", self.worker_id)
+
+    def close(self, reason):
+        if self.flusher is not None and self.flusher.running:
+            self.flusher.stop()
+        if self.wakeup is not None and self.wakeup.active():
+            self.wakeup.cancel()
+        if self.conn is None:
+            return
+        self._flush()
+        # requêtes prises mais non traitées : rendues aux autres workers ;
+        # l'essai n'est rendu qu'aux requêtes jamais envoyées
+        unsent = (self.leased | {request.meta[FP_META] for request in self.local}) - self.sent
+        if unsent:
+            with self.conn.cursor() as cur:
+                cur.execute(
+                    "UPDATE crawl_frontier SET state = 'queued', leased_by = NULL, lease_until = NULL,"
+                    " attempts = GREATEST(attempts - 1, 0)"
+                    " WHERE fingerprint = ANY(%s) AND leased_by = %s",
+                    ([psycopg2.Binary(fp) for fp in unsent], self.worker_id),
+                )
+            self.conn.commit()
+        unfinished = self.sent & self.leased
+        if unfinished:
+            self._release(unfinished)
+        if unsent or unfinished:
+            self.stats.inc_value("frontier/released", len(unsent) + len(unfinished))
+        self.conn.close()
+        self.conn = None
+
+    def response_received(self, response, request, spider):
+        fp = request.meta.get(FP_META)
+        if fp is not None and fp in self.leased:
+            self.leased.discard(fp)
+            self.sent.discard(fp)
+            self.done.append(fp)
+
+    # ------------------------------------------------------------------
+    # Interface Scheduler
+    # ------------------------------------------------------------------
+    def enqueue_request(self, request):
+        fp = request.meta.get(FP_META)
+        if fp is not None and fp in self.leased:
+            # nouvel essai local (RetryMiddleware…) d'une requête déjà sous bail
+            self.local.append(request)
+            return True
+        fp = self.crawler.request_fingerprinter.fingerprint(request)
+        request.meta[FP_META] = fp
+        self.to_enqueue[fp] = (request, urlparse_cached(request).hostname or "")
+        if len(self.to_enqueue) >= self.insert_batch:
+            self._insert()
+        return True
+
+    def next_request(self):
+        if not self.local:
+            if self.to_enqueue:
+                self._insert()
+            if time.monotonic() >= self.next_lease_at:
+                self._lease()
+        if not self.local:
+            return None
+        self.stats.inc_value("frontier/dequeued")
+        request = self.local.popleft()
+        self.sent.add(request.meta[FP_META])
+        return request
+
+    def has_pending_requests(self):
+        if self.local or self.to_enqueue:
+            return True
+        now = time.monotonic()
+        if now - self.pending_checked_at >= 1.0:
+            self._flush_done()
+            self._release_lost()
+            with self.conn.cursor() as cur:
+                # les baux des autres workers comptent : ils peuvent encore
+                # produire des pages
+                cur.execute(
+                    "SELECT EXISTS (SELECT 1 FROM crawl_frontier"
+                    " WHERE spider = %s AND state IN ('queued', 'leased'))",
+                    (self.spider.name,),
+                )
+                self.pending_in_db = cur.fetchone()[0]
+            self.conn.commit()
+            self.pending_checked_at = now
+        return self.pending_in_db
+
+    def __len__(self):
+        return len(self.local) + len(self.to_enqueue)
+
+    # ------------------------------------------------------------------
+    # Accès base
+    # ------------------------------------------------------------------
+    def _insert(self):
+        batch, self.to_enqueue = self.to_enqueue, {}
+        rows = [
+            (psycopg2.Binary(fp), self.spider.name, domain, request.priority,
+             psycopg2.Binary(pickle.dumps(request.to_dict(spider=self.spider), protocol=4)))
+            for fp, (request, domain) in batch.items()
+        ]
+        new_domains = {domain for _, domain in batch.values()} - self.known_domains
+        with self.conn.cursor() as cur:
+            if new_domains:
+                execute_values(cur, "INSERT INTO crawl_domains (domain) VALUES %s ON CONFLICT DO NOTHING",
+                               [(domain,) for domain in new_domains])
+                self.known_domains |= new_domains
+            inserted = execute_values(
+                cur,
+                "INSERT INTO crawl_frontier (fingerprint, spider, domain, priority, request) VALUES %s"
+                " ON CONFLICT (fingerprint) DO UPDATE SET"
+                "   state = 'queued', attempts = 0, priority = EXCLUDED.priority,"
+                "   request = EXCLUDED.request, leased_by = NULL, lease_until = NULL, done_at = NULL"
+                " WHERE crawl_frontier.state IN ('done', 'failed')"
+                f"  AND crawl_frontier.done_at < now() - interval '{int(self.revisit_after)} seconds'"
+                " RETURNING 1",
+                rows, fetch=True,
+            )
+        self.conn.commit()
+        self.stats.inc_value("frontier/enqueued", len(inserted))
+        self.stats.inc_value("frontier/duplicate", len(rows) - len(inserted))
+        self.pending_in_db = self.pending_in_db or bool(inserted)
+        self.next_lease_at = 0.0
+
+    def _lease(self):
+        self._reclaim()
+        with self.conn.cursor() as cur:
+            # un domaine prêt (délai de politesse écoulé), non verrouillé par un autre worker
+            cur.execute(
+                "SELECT d.domain, EXTRACT(EPOCH FROM d.next_fetch_at - now()) FROM crawl_domains d"
+                " WHERE EXISTS ("
+                "   SELECT 1 FROM crawl_frontier f"
+                "   WHERE f.spider = %s AND f.domain = d.domain AND f.state = 'queued')"
+                " ORDER BY d.next_fetch_at LIMIT 1 FOR UPDATE SKIP LOCKED",
+                (self.spider.name,),
+            )
+            row = cur.fetchone()
+            if row is None or row[1] > 0:
+                # rien de prêt : nouvel essai quand le domaine le plus proche se libère
+                self.conn.commit()
+                wait = 0.5 if row is None else min(float(row[1]), 0.5)
+                self.next_lease_at = time.monotonic() + wait
+                self._wake_engine(wait)
+                return
+            domain = row[0]
+            cur.execute(
+                "UPDATE crawl_frontier f SET state = 'leased', leased_by = %(worker)s,"
+                "   lease_until = now() + %(lease)s * interval '1 second', attempts = f.attempts + 1"
+                " FROM (SELECT fingerprint FROM crawl_frontier"
+                "       WHERE spider = %(spider)s AND domain = %(domain)s AND state = 'queued'"
+                "       ORDER BY priority DESC, created_at LIMIT %(limit)s FOR UPDATE SKIP LOCKED) picked"
+                " WHERE f.fingerprint = picked.fingerprint"
+                " RETURNING f.fingerprint, f.request",
+                {"worker": self.worker_id, "lease": self.lease_seconds, "spider": self.spider.name,
+                 "domain": domain, "limit": self.lease_batch},
+            )
+            leased = cur.fetchall()
+            # le domaine est réservé le temps de ces requêtes, pour tous les workers
+            cur.execute(
+                "UPDATE crawl_domains SET next_fetch_at = now() + %s * interval '1 second' WHERE domain = %s",
+                (len(leased) * self.domain_delay, domain),
+            )
+        self.conn.commit()
+        for fp, data in leased:
+            fp = bytes(fp)
+            request = request_from_dict(pickle.loads(bytes(data)), spider=self.spider)
+            request.meta[FP_META] = fp
+            self.leased.add(fp)
+            self.local.append(request)
+        self.stats.inc_value("frontier/leased", len(leased))
+
+    def _wake_engine(self, delay):
+        """Sans cela le moteur ne redemande une requête qu'au prochain battement (5 s)."""
+        if self.wakeup is not None and self.wakeup.active():
+            return
+        from twisted.internet import reactor  # réacteur déjà installé par Scrapy
+
+        slot = getattr(self.crawler.engine, "_slot", None)
+        if slot is not None:
+            self.wakeup = reactor.callLater(delay, slot.nextcall.schedule)
+
+    def _reclaim(self):
+        """Baux expirés (worker arrêté ou bloqué) : remis en file, ou « failed »."""
+        now = time.monotonic()
+        if now < self.next_reclaim_at:
+            return
+        self.next_reclaim_at = now + max(self.lease_seconds / 4, 5)
+        with self.conn.cursor() as cur:
+            cur.execute(
+                f"UPDATE crawl_frontier SET {_RELEASE} WHERE state = 'leased' AND lease_until < now()",
+                {"max": self.max_attempts},
+            )
+            reclaimed = cur.rowcount
+        self.conn.commit()
+        if reclaimed:
+            self.stats.inc_value("frontier/reclaimed", reclaimed)
+            self.spider.logger.info("[FRONTIER] %d bail(s) expiré(s) repris", reclaimed)
+
+    def _flush_done(self):
+        if not self.done:
+            return
+        done, self.done = self.done, []
+        with self.conn.cursor() as cur:
+            cur.execute(
+                "UPDATE crawl_frontier SET state = 'done', done_at = now(), leased_by = NULL, lease_until = NULL"
+                " WHERE fingerprint = ANY(%s) AND leased_by = %s",
+                ([psycopg2.Binary(fp) for fp in done], self.worker_id),
+            )
+        self.conn.commit()
+        self.stats.inc_value("frontier/done", len(done))
+
+    def _release_lost(self):
+        """
+        Requêtes envoyées sorties du moteur sans réponse ni nouvel essai en
+        file (erreur de téléchargement définitive, IgnoreRequest) : le bail
+        est rendu tout de suite plutôt qu'à son expiration.
+        """
+        slot = getattr(self.crawler.engine, "_slot", None)
+        if not self.sent or slot is None:
+            return
+        # une nouvelle tentative (RetryMiddleware, redirection) est mise en
+        # file avant que l'essai précédent ne quitte le moteur
+        active = {request.meta.get(FP_META) for request in slot.inprogress}
+        active.update(request.meta[FP_META] for request in self.local)
+        lost = self.sent - active
+        if lost:
+            self._release(lost)
+            self.stats.inc_value("frontier/lost", len(lost))
+
+    def _release(self, fps):
+        self.leased -= fps
+        self.sent -= fps
+        with self.conn.cursor() as cur:
+            cur.execute(
+                f"UPDATE crawl_frontier SET {_RELEASE}"
+                " WHERE fingerprint = ANY(%(fps)s) AND leased_by = %(worker)s",
+                {"max": self.max_attempts, "worker": self.worker_id,
+                 "fps": [psycopg2.Binary(fp) for fp in fps]},
+            )
+        self.conn.commit()
+
+    def _flush(self):
+        if self.to_enqueue:
+            self._insert()
+        self._flush_done()
+        self._release_lost()
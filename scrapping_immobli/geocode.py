@@ -0,0 +1,236 @@
+"""
+Géocodage hors ligne des annonces, sans service externe.
+
+Seul coinafrique donne ``latitude`` / ``longitude`` ; pour les autres sites
+les coordonnées viennent d'un gazetteer local des quartiers et communes du
+Sénégal (``data/gazetteer.csv`` : centroïdes approximatifs, à compléter) :
+
+- ``adresse``, ``city`` et ``region`` sont normalisés (minuscules, sans
+  accents, chiffres romains -> arabes) puis parcourus dans un trie de mots :
+  le nom le plus précis trouvé l'emporte (quartier > commune > région),
+  puis le plus long (« Grand Yoff » plutôt que « Yoff ») ;
+- à défaut, repli approché (difflib) sur les n-grammes de 1 à 3 mots,
+  limité aux noms de même initiale ;
+- chaque chaîne résolue est mémorisée : LRU en mémoire, puis cache SQLite
+  persistant (``.scrapy/geocode_cache.sqlite``), invalidé quand le
+  gazetteer change.
+"""
+import csv
+import difflib
+import hashlib
+import os
+import re
+import sqlite3
+import unicodedata
+from collections import defaultdict, namedtuple
+from functools import lru_cache
+from pathlib import Path
+
+from scrapy import signals
+from scrapy.utils.project import data_path
+
+GAZETTEER_PATH = Path(__file__).parent / "data" / "gazetteer.csv"
+LEVELS = ("quartier", "commune", "region")  # du plus précis au moins précis
+GEOCODED_FIELDS = ("adresse", "city", "region")
+
+_TOKENS = re.compile(r"[a-z0-9]+")
+_ROMAN = {"i": "1", "ii": "2", "iii": "3", "iv": "4", "v": "5", "vi": "6"}
+_STOPWORDS = {"rue", "avenue", "av", "bd", "boulevard", "route", "villa", "lot", "n", "no", "senegal"}
+
+Place = namedtuple("Place", "name level region latitude longitude")
+
+
+def tokens(text):
+    if not text:
+        return []
+    text = str(text).lower().replace("œ", "oe").replace("'", " ")
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return [_ROMAN.get(tok, tok) for tok in _TOKENS.findall(text) if tok not in _STOPWORDS]
+
+
+def _rank(match):
+    place, length, position = match
+    return (LEVELS.index(place.level), -length, position)
+
+
+class Gazetteer:
+    """Trie de mots sur les noms et alias ; feuille = Place."""
+
+    def __init__(self, places, version=""):
+        self.version = version
+        self.trie = {}
+        self.places = {}
+        self.by_initial = defaultdict(list)
+        for names, place in places:
+            for name in names:
+                key = " ".join(tokens(name))
+                if not key:
+                    continue
+                current = self.places.get(key)
+                if current is not None and LEVELS.index(current.level) <= LEVELS.index(place.level):
+                    continue
+                self.places[key] = place
+                node = self.trie
+                for token in key.split():
+                    node = node.setdefault(token, {})
+                node[None] = place
+        for key in self.places:
+            self.by_initial[key[0]].append(key)
+
+    @classmethod
+    def load(cls, path=GAZETTEER_PATH):
+        with open(path, encoding="utf-8") as f:
+            content = f.read()
+        places = []
+        for row in csv.DictReader(content.splitlines()):
+            place = Place(row["name"], row["level"], row["region"],
+                          float(row["latitude"]), float(row["longitude"]))
+            aliases = [alias for alias in (row.get("aliases") or "").split("|") if alias]
+            places.append(([row["name"]] + aliases, place))
+        return cls(places, version=hashlib.sha1(content.encode()).hexdigest()[:12])
+
+    def match(self, toks):
+        """Meilleure correspondance exacte dans la suite de mots, ou None."""
+        found = []
+        for start in range(len(toks)):
+            node, longest = self.trie, None
+            for end in range(start, len(toks)):
+                node = node.get(toks[end])
+                if node is None:
+                    break
+                if None in node:
+                    longest = (node[None], end - start + 1, start)
+            if longest is not None:
+                found.append(longest)
+        return min(found, key=_rank)[0] if found else None
+
+    def fuzzy(self, toks, cutoff=0.85):
+        """Repli approché (fautes de frappe, tirets, lettres manquantes)."""
+        found = []
+        for size in (3, 2, 1):
+            for start in range(len(toks) - size + 1):
+                gram = " ".join(toks[start:start + size])
+                if len(gram) < 4:
+                    continue
+                close = difflib.get_close_matches(gram, self.by_initial.get(gram[0], ()), n=1, cutoff=cutoff)
+                if close:
+                    found.append((self.places[close[0]], size, start))
+        return min(found, key=_rank)[0] if found else None
+
+
+class Geocoder:
+    """Résolution chaîne -> Place avec LRU et cache SQLite (les échecs aussi)."""
+
+    _shared = {}
+
+    def __init__(self, gazetteer, cache_path=None, lru_size=10_000, cutoff=0.85, commit_every=200):
+        self.gazetteer = gazetteer
+        self.cache_path = cache_path
+        self.cutoff = cutoff
+        self.commit_every = commit_every
+        self.conn = None
+        self.pending = {}
+        self.users = 0
+        self.resolve = lru_cache(maxsize=lru_size)(self._resolve)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """Une instance par cache et par processus (cf. SeenIndex.from_crawler)."""
+        settings = crawler.settings
+        cache_path = data_path(settings.get("GEOCODER_CACHE_PATH", "geocode_cache.sqlite"))
+        geocoder = cls._shared.get(cache_path)
+        if geocoder is None:
+            gazetteer = Gazetteer.load(settings.get("GEOCODER_GAZETTEER") or GAZETTEER_PATH)
+            geocoder = cls._shared[cache_path] = cls(
+                gazetteer,
+                cache_path,
+                lru_size=settings.getint("GEOCODER_LRU_SIZE", 10_000),
+                cutoff=settings.getfloat("GEOCODER_FUZZY_CUTOFF", 0.85),
+            )
+        crawler.signals.connect(geocoder.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(geocoder.spider_closed, signal=signals.spider_closed)
+        return geocoder
+
+    # ------------------------------------------------------------------
+    # Cycle de vie
+    # ------------------------------------------------------------------
+    def open(self):
+        if self.conn is not None or self.cache_path is None:
+            return
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.cache_path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS geocode (key TEXT PRIMARY KEY, version TEXT, name TEXT)")
+        # gazetteer modifié : les résolutions précédentes ne valent plus
+        self.conn.execute("DELETE FROM geocode WHERE version <> ?", (self.gazetteer.version,))
+        self.conn.commit()
+
+    def close(self):
+        if self.conn is None:
+            return
+        self.sync()
+        self.conn.close()
+        self.conn = None
+
+    def spider_opened(self, spider):
+        self.users += 1
+        self.open()
+
+    def spider_closed(self, spider):
+        info = self.resolve.cache_info()
+        spider.logger.info("[GEOCODE] LRU : %d succès, %d défauts", info.hits, info.misses)
+        self.users -= 1
+        if self.users > 0:
+            self.sync()
+            return
+        self._shared.pop(self.cache_path, None)
+        self.close()
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+    def geocode(self, item):
+        """Place la plus précise parmi ``adresse``, ``city``, ``region`` (None si aucune)."""
+        best = None
+        for field in GEOCODED_FIELDS:
+            place = self.resolve(item.get(field))
+            if place is not None and (best is None or LEVELS.index(place.level) < LEVELS.index(best.level)):
+                best = place
+        return best
+
+    def sync(self):
+        if not self.pending or self.conn is None:
+            return
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO geocode (key, version, name) VALUES (?, ?, ?)",
+            [(key, self.gazetteer.version, name) for key, name in self.pending.items()],
+        )
+        self.conn.commit()
+        self.pending = {}
+
+    # ------------------------------------------------------------------
+    # Interne
+    # ------------------------------------------------------------------
+    def _resolve(self, text):
+        toks = tokens(text)
+        if not toks:
+            return None
+        key = " ".join(toks)
+        found, name = self._cached(key)
+        if found:
+            return self.gazetteer.places.get(name) if name else None
+
+        place = self.gazetteer.match(toks) or self.gazetteer.fuzzy(toks, self.cutoff)
+        # nom -> clé du gazetteer (stable même si les coordonnées changent)
+        self.pending[key] = None if place is None else " ".join(tokens(place.name))
+        if len(self.pending) >= self.commit_every:
+            self.sync()
+        return place
+
+    def _cached(self, key):
+        if key in self.pending:
+            return True, self.pending[key]
+        if self.conn is None:
+            return False, None
+        row = self.conn.execute("SELECT name FROM geocode WHERE key = ?", (key,)).fetchone()
+        return (True, row[0]) if row else (False, None)
@@ -0,0 +1,176 @@
+"""
+Historique des prix : table d'observations en ajout seul.
+
+- ``listing_observations`` : une ligne par changement de prix ou de statut
+  d'une annonce (et à sa première apparition), partitionnée par mois sur
+  ``scraped_at`` ; une partition ancienne se détache, s'archive ou se
+  supprime d'un bloc (``scrapy history``), sans DELETE ni VACUUM ;
+- ``listing_state`` : dernier état connu de chaque annonce (une ligne par
+  annonce), tenu à jour à chaque lot ; c'est lui qui permet de ne garder
+  que les changements ; il compte aussi passages et changements, d'où la
+  date de prochaine visite (scrapping_immobli.freshness) ;
+- ``listing_current`` : vue compacte de l'état courant, avec le prix
+  précédent.
+
+La table ``listings`` (upsert sur l'URL) reste inchangée : elle donne la
+dernière fiche complète, l'historique donne la série de prix.
+"""
+from datetime import datetime
+
+from scrapping_immobli.db import BulkWriter
+
+HISTORY_DDL = """
+    CREATE TABLE IF NOT EXISTS listing_observations(
+        id VARCHAR(32) NOT NULL,
+        url TEXT NOT NULL,
+        source VARCHAR(50),
+        price INTEGER,
+        statut VARCHAR(50),
+        scraped_at TIMESTAMP NOT NULL
+    ) PARTITION BY RANGE (scraped_at);
+    CREATE INDEX IF NOT EXISTS listing_observations_id
+        ON listing_observations (id, scraped_at);
+    CREATE TABLE IF NOT EXISTS listing_state(
+        id VARCHAR(32) PRIMARY KEY,
+        url TEXT NOT NULL,
+        source VARCHAR(50),
+        price INTEGER,
+        statut VARCHAR(50),
+        first_seen TIMESTAMP NOT NULL,
+        last_seen TIMESTAMP NOT NULL,
+        changed_at TIMESTAMP NOT NULL
+    );
+    CREATE OR REPLACE VIEW listing_current AS
+        SELECT s.id, s.url, s.source, s.price, s.statut,
+               prev.price AS previous_price,
+               s.first_seen, s.changed_at, s.last_seen
+        FROM listing_state s
+        LEFT JOIN LATERAL (
+            SELECT o.price FROM listing_observations o
+            WHERE o.id = s.id AND o.scraped_at < s.changed_at
+            ORDER BY o.scraped_at DESC LIMIT 1
+        ) prev ON true;
+"""
+
+OBSERVATION_COLUMNS = ("id", "url", "source", "price", "statut", "scraped_at")
+
+
+# ----------------------------------------------------------------------
+# Partitions mensuelles
+# ----------------------------------------------------------------------
+def month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def next_month(month):
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"listing_observations_{month:%Y_%m}"
+
+
+def create_tables(conn):
+    """DDL sous verrou consultatif (plusieurs processus au démarrage)."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('listing_observations'))")
+        cur.execute(HISTORY_DDL)
+    conn.commit()
+
+
+def create_partitions(conn, months):
+    """Crée les partitions des mois donnés (idempotent)."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('listing_observations'))")
+        for month in sorted(set(months)):
+            cur.execute(
+                f"CREATE TABLE IF NOT EXISTS {partition_name(month)}"
+                " PARTITION OF listing_observations FOR VALUES FROM (%s) TO (%s)",
+                (month, next_month(month)),
+            )
+    conn.commit()
+
+
+def list_partitions(conn):
+    """[(mois, nom de partition, lignes estimées)] par mois croissant."""
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT c.relname, c.reltuples::bigint FROM pg_inherits i"
+            " JOIN pg_class c ON c.oid = i.inhrelid"
+            " WHERE i.inhparent = 'listing_observations'::regclass"
+            " ORDER BY c.relname"
+        )
+        rows = cur.fetchall()
+    conn.commit()
+    partitions = []
+    for name, estimate in rows:
+        try:
+            month = datetime.strptime(name[-7:], "%Y_%m")
+        except ValueError:
+            continue
+        partitions.append((month, name, max(estimate, 0)))
+    return partitions
+
+
+# ----------------------------------------------------------------------
+# Écriture des seuls changements
+# ----------------------------------------------------------------------
+class HistoryWriter(BulkWriter):
+    """
+    BulkWriter pour ``listing_observations`` : la fusion met à jour
+    ``listing_state`` et n'ajoute une observation que pour les annonces
+    nouvelles ou dont le prix / statut a changé. Les partitions des mois
+    rencontrés sont créées avant l'écriture du lot.
+    """
+
+    def __init__(self, pool, **kwargs):
+        super().__init__(pool, "listing_observations", OBSERVATION_COLUMNS,
+                         conflict_column="id", **kwargs)
+        self.partitions = set()
+
+    def _history_sql(self, source):
+        cols = self._column_list
+        return f"""
+            WITH batch AS (
+                SELECT DISTINCT ON (id) {cols} FROM {source}
+                ORDER BY id, scraped_at DESC
+            ), state AS (
+                INSERT INTO listing_state AS s
+                    (id, url, source, price, statut, first_seen, last_seen, changed_at)
+                SELECT id, url, source, price, statut, scraped_at, scraped_at, scraped_at FROM batch
+                ON CONFLICT (id) DO UPDATE SET
+                    url = EXCLUDED.url,
+                    price = EXCLUDED.price,
+                    statut = EXCLUDED.statut,
+                    last_seen = GREATEST(s.last_seen, EXCLUDED.last_seen),
+                    changed_at = CASE
+                        WHEN (s.price, s.statut) IS DISTINCT FROM (EXCLUDED.price, EXCLUDED.statut)
+                        THEN EXCLUDED.changed_at ELSE s.changed_at END,
+                    visits = s.visits + 1,
+                    changes = s.changes + CASE
+                        WHEN (s.price, s.statut) IS DISTINCT FROM (EXCLUDED.price, EXCLUDED.statut)
+                        THEN 1 ELSE 0 END,
+                    gone_at = NULL
+                RETURNING s.id, s.changed_at
+            )
+            -- changed_at = date du lot : annonce nouvelle, ou prix / statut modifié
+            INSERT INTO listing_observations ({cols})
+            SELECT {", ".join(f"b.{col}" for col in self.columns)}
+            FROM batch b JOIN state ON state.id = b.id
+            WHERE state.changed_at = b.scraped_at;
+        """
+
+    def _merge_sql(self):
+        return self._history_sql(self.staging)
+
+    def _upsert_sql(self):
+        placeholders = ", ".join(["%s"] * len(self.columns))
+        return self._history_sql(f"(VALUES ({placeholders})) AS v ({self._column_list})")
+
+    def _copy_and_merge(self, conn, rows):
+        at = self.columns.index("scraped_at")
+        months = {month_start(row[at]) for row in rows if row[at] is not None} - self.partitions
+        if months:
+            create_partitions(conn, months)
+            self.partitions |= months
+        super()._copy_and_merge(conn, rows)
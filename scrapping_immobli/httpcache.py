@@ -0,0 +1,169 @@
+"""
+Cache HTTP des pages détail, branché sur le HttpCacheMiddleware de Scrapy
+(HTTPCACHE_POLICY / HTTPCACHE_STORAGE).
+
+- ``DetailPagePolicy`` : seules les requêtes des callbacks HTTPCACHE_CALLBACKS
+  (fiches annonces) passent par le cache. Une réponse avec validateurs
+  (ETag / Last-Modified) est revalidée par requête conditionnelle
+  (If-None-Match / If-Modified-Since) ; sans validateurs, elle est
+  considérée fraîche pendant HTTPCACHE_FALLBACK_TTL secondes.
+- ``CompressedSqliteCacheStorage`` : corps compressés (zlib) dans un fichier
+  SQLite par spider, éviction par âge (HTTPCACHE_EXPIRATION_SECS) et par
+  taille totale (HTTPCACHE_MAX_SIZE_MB, les moins récemment lus d'abord).
+"""
+import logging
+import pickle
+import sqlite3
+import zlib
+from pathlib import Path
+from time import time
+
+from scrapy.extensions.httpcache import RFC2616Policy
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+
+logger = logging.getLogger(__name__)
+
+
+class DetailPagePolicy(RFC2616Policy):
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.callbacks = set(settings.getlist("HTTPCACHE_CALLBACKS", ["parse_detail"]))
+        self.fallback_ttl = settings.getint("HTTPCACHE_FALLBACK_TTL", 3 * 24 * 3600)
+        self.revalidate_after = settings.getint("HTTPCACHE_REVALIDATE_AFTER", 0)
+
+    @staticmethod
+    def _has_validators(response):
+        return b"ETag" in response.headers or b"Last-Modified" in response.headers
+
+    def should_cache_request(self, request):
+        callback = getattr(request.callback, "__name__", None)
+        if callback not in self.callbacks:
+            return False
+        return super().should_cache_request(request)
+
+    def should_cache_response(self, response, request):
+        if response.status == 200 and b"no-store" not in self._parse_cachecontrol(response):
+            # avec validateurs : revalidation ; sans : TTL de repli
+            return True
+        return super().should_cache_response(response, request)
+
+    def _compute_freshness_lifetime(self, response, request, now):
+        cc = self._parse_cachecontrol(response)
+        if b"max-age" in cc or b"Expires" in response.headers:
+            return super()._compute_freshness_lifetime(response, request, now)
+        if self._has_validators(response):
+            return self.revalidate_after
+        return self.fallback_ttl
+
+
+class CompressedSqliteCacheStorage:
+
+    def __init__(self, settings):
+        self.cachedir = data_path(settings["HTTPCACHE_DIR"], createdir=True)
+        self.expiration_secs = settings.getint("HTTPCACHE_EXPIRATION_SECS")
+        self.max_bytes = settings.getint("HTTPCACHE_MAX_SIZE_MB", 512) * 1024 * 1024
+        self.compresslevel = settings.getint("HTTPCACHE_COMPRESSLEVEL", 6)
+        self.commit_every = 50
+        self.db = None
+        self.total_bytes = 0
+        self.uncommitted = 0
+
+    def open_spider(self, spider):
+        dbpath = Path(self.cachedir, f"{spider.name}.sqlite")
+        self.db = sqlite3.connect(str(dbpath))
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS responses(
+                key BLOB PRIMARY KEY,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL,
+                data BLOB NOT NULL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed_at)")
+        self._fingerprinter = spider.crawler.request_fingerprinter
+        self._evict_expired()
+        self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self._evict_oversize()
+        self.db.commit()
+        logger.debug("Cache HTTP SQLite : %s (%.1f Mo)", dbpath, self.total_bytes / 1e6,
+                     extra={"spider": spider})
+
+    def close_spider(self, spider):
+        # open_spider a échoué (base illisible, disque plein…) : rien à fermer
+        if self.db is None:
+            return
+        self.db.commit()
+        self.db.close()
+        self.db = None
+
+    def retrieve_response(self, spider, request):
+        key = self._fingerprinter.fingerprint(request)
+        row = self.db.execute("SELECT stored_at, data FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        stored_at, blob = row
+        if 0 < self.expiration_secs < time() - stored_at:
+            return None
+        self.db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time(), key))
+        self._maybe_commit()
+
+        data = pickle.loads(zlib.decompress(blob))
+        headers = Headers(data["headers"])
+        respcls = responsetypes.from_args(headers=headers, url=data["url"], body=data["body"])
+        request.meta["cache_timestamp"] = stored_at
+        return respcls(url=data["url"], headers=headers, status=data["status"], body=data["body"])
+
+    def store_response(self, spider, request, response):
+        key = self._fingerprinter.fingerprint(request)
+        data = {
+            "url": response.url,
+            "status": response.status,
+            "headers": dict(response.headers),
+            "body": response.body,
+        }
+        blob = zlib.compress(pickle.dumps(data, protocol=4), self.compresslevel)
+        now = time()
+        old = self.db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        self.db.execute(
+            "INSERT OR REPLACE INTO responses (key, stored_at, accessed_at, size, data) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, now, now, len(blob), blob),
+        )
+        self.total_bytes += len(blob) - (old[0] if old else 0)
+        if self.total_bytes > self.max_bytes:
+            self._evict_oversize()
+        self._maybe_commit()
+
+    # ------------------------------------------------------------------
+    # Éviction
+    # ------------------------------------------------------------------
+    def _evict_expired(self):
+        if self.expiration_secs > 0:
+            self.db.execute("DELETE FROM responses WHERE stored_at < ?",
+                            (time() - self.expiration_secs,))
+
+    def _evict_oversize(self):
+        """Supprime les entrées les moins récemment lues jusqu'à 90 % du plafond."""
+        target = int(self.max_bytes * 0.9)
+        if self.total_bytes <= self.max_bytes:
+            return
+        rows = self.db.execute("SELECT key, size FROM responses ORDER BY accessed_at")
+        victims = []
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            victims.append((key,))
+            self.total_bytes -= size
+        self.db.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self.db.commit()
+
+    def _maybe_commit(self):
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_every:
+            self.db.commit()
+            self.uncommitted = 0
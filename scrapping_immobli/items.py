@@ -1,19 +1,10 @@
+import dataclasses
+from typing import Any
+
 import scrapy
 from itemloaders.processors import MapCompose, TakeFirst
-import re
-def _int(txt):
-    if not txt:
-        return None
-    # enlève espaces, CFA, « Prix sur demande », etc.
-    digits = re.sub(r"\D", "", str(txt))
-    return int(digits) if digits else None
-
-def _float(txt):
-    try:
-        return float(re.search(r"(\d+(?:\.\d+)?)", txt or "").group(1))
-    except (AttributeError, ValueError):
-        return None
-    
+
+from scrapping_immobli import normalize
 
 
 def first_two_words(text):
@@ -35,7 +26,7 @@ class PropertyItem(scrapy.Item):
     id           = scrapy.Field(output_processor=TakeFirst())
     url          = scrapy.Field(output_processor=TakeFirst())
     title        = scrapy.Field(output_processor=TakeFirst())
-    price        = scrapy.Field(input_processor=MapCompose(_int),
+    price        = scrapy.Field(input_processor=MapCompose(normalize.price),
                                 output_processor=TakeFirst())
     bedrooms     = scrapy.Field()
     bathrooms    = scrapy.Field()
@@ -58,18 +49,21 @@ class PropertyItem(scrapy.Item):
     statut = scrapy.Field()
     description = scrapy.Field()
     surface_area = scrapy.Field()
+    content_hash = scrapy.Field()  # empreinte de contenu (scrapping_immobli.fingerprint)
+    cluster_id = scrapy.Field()    # annonces quasi identiques (scrapping_immobli.neardup)
+    geo_level = scrapy.Field()     # gps / quartier / commune / region (scrapping_immobli.geocode)
 
 
 class ExpatDakarPropertyItem(scrapy.Item):
     id           = scrapy.Field(output_processor=TakeFirst())
     url          = scrapy.Field(output_processor=TakeFirst())
     title         = scrapy.Field()
-    price         = scrapy.Field(input_processor=MapCompose(_int),
+    price         = scrapy.Field(input_processor=MapCompose(normalize.price),
                                 output_processor=TakeFirst())
     surface_area  = scrapy.Field()
-    bedrooms      = scrapy.Field(input_processor=MapCompose(_int),
+    bedrooms      = scrapy.Field(input_processor=MapCompose(normalize.rooms),
                                 output_processor=TakeFirst())
-    bathrooms     = scrapy.Field(input_processor=MapCompose(_int),
+    bathrooms     = scrapy.Field(input_processor=MapCompose(normalize.rooms),
                                 output_processor=TakeFirst())
     city          = scrapy.Field(output_processor=TakeFirst())
     region        = scrapy.Field(output_processor=TakeFirst())
@@ -83,13 +77,18 @@ class ExpatDakarPropertyItem(scrapy.Item):
     member_since  = scrapy.Field(output_processor=TakeFirst())
     listing_id    = scrapy.Field(output_processor=TakeFirst())
     nb_annonces   = scrapy.Field(output_processor=TakeFirst())
+    content_hash  = scrapy.Field()  # empreinte de contenu (scrapping_immobli.fingerprint)
+    cluster_id    = scrapy.Field()  # annonces quasi identiques (scrapping_immobli.neardup)
+    latitude      = scrapy.Field(output_processor=TakeFirst())
+    longitude     = scrapy.Field(output_processor=TakeFirst())
+    geo_level     = scrapy.Field()  # gps / quartier / commune / region (scrapping_immobli.geocode)
 
 
 class LogerDakarPropertyItem(scrapy.Item):
     id            = scrapy.Field(output_processor=TakeFirst())
     url           = scrapy.Field(output_processor=TakeFirst())
     title         = scrapy.Field(output_processor=TakeFirst())
-    price         = scrapy.Field(input_processor=MapCompose(_int),
+    price         = scrapy.Field(input_processor=MapCompose(normalize.price),
                                 output_processor=TakeFirst())
     surface_area  = scrapy.Field(output_processor=TakeFirst())
     bedrooms      = scrapy.Field(output_processor=TakeFirst())
@@ -103,4 +102,94 @@ class LogerDakarPropertyItem(scrapy.Item):
     posted_time   = scrapy.Field(output_processor=TakeFirst())
     adresse       = scrapy.Field(output_processor=TakeFirst())
     property_type = scrapy.Field(output_processor=TakeFirst())
-    listing_id    = scrapy.Field(output_processor=TakeFirst())
\ No newline at end of file
+    listing_id    = scrapy.Field(output_processor=TakeFirst())
+    content_hash  = scrapy.Field()  # empreinte de contenu (scrapping_immobli.fingerprint)
+    cluster_id    = scrapy.Field()  # annonces quasi identiques (scrapping_immobli.neardup)
+    latitude      = scrapy.Field(output_processor=TakeFirst())
+    longitude     = scrapy.Field(output_processor=TakeFirst())
+    geo_level     = scrapy.Field()  # gps / quartier / commune / region (scrapping_immobli.geocode)
+
+
+# ----------------------------------------------------------------------
+# Items compacts (COMPACT_ITEMS)
+# ----------------------------------------------------------------------
+class ItemRecord:
+    """
+    Base des items compacts : mêmes champs et même accès que l'item Scrapy
+    (``item["prix"]``, ``get``, ``in``, ``dict(item)``), mais les valeurs
+    sont dans des ``__slots__`` et non dans un dict par item. Un champ non
+    renseigné est absent, comme pour ``scrapy.Item`` ; les exporters le
+    voient via ItemAdapter (dataclass).
+    """
+    __slots__ = ()
+    fields = {}
+
+    def __init__(self, values=None, **kwargs):
+        for key, value in dict(values or {}, **kwargs).items():
+            self[key] = value
+
+    def __getitem__(self, key):
+        if key not in self.fields:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key not in self.fields:
+            raise KeyError(f"{type(self).__name__} does not support field: {key}")
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        try:
+            delattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.fields else default
+
+    def __contains__(self, key):
+        return key in self.fields and hasattr(self, key)
+
+    def keys(self):
+        return [key for key in self.fields if hasattr(self, key)]
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self.items())!r})"
+
+    def __reduce__(self):
+        return type(self), (dict(self.items()),)
+
+
+def record_class(item_class):
+    """Classe d'item compact (dataclass à slots) ayant les champs de ``item_class``."""
+    record = _records.get(item_class)
+    if record is None:
+        name = item_class.__name__.replace("Item", "Record")
+        record = dataclasses.make_dataclass(
+            name,
+            [(key, Any, dataclasses.field(metadata=dict(meta)))
+             for key, meta in item_class.fields.items()],
+            bases=(ItemRecord,),
+            namespace={"fields": item_class.fields},
+            init=False, repr=False, eq=False, slots=True,
+        )
+        record.__module__ = __name__
+        _records[item_class] = record
+    return record
+
+
+_records = {}
+PropertyRecord = record_class(PropertyItem)
+ExpatDakarPropertyRecord = record_class(ExpatDakarPropertyItem)
@@ -0,0 +1,113 @@
+"""
+Table unique des annonces, tous sites confondus.
+
+- ``listings`` : partitionnée par liste sur ``source`` (une partition par
+  site, ``listings_<source>``, plus ``listings_default`` pour un spider
+  encore inconnu) ; les colonnes communes sont typées, les champs propres à
+  un site (``nb_annonces``, ``member_since``, ``listing_id``…) vont dans
+  ``extras`` (JSONB) ;
+- index B-tree sur les filtres courants (ville + prix, type + statut + prix,
+  prix, cluster) et BRIN sur ``scraped_at`` ; une requête sur un site ne lit
+  que sa partition, une requête sur tous les sites n'a plus besoin d'un
+  ``UNION ALL`` de trois parcours complets ;
+- le schéma est créé une fois par ``scrapy migrate``
+  (scrapping_immobli.migrations), plus à l'ouverture de chaque spider.
+"""
+import json
+import re
+
+from scrapping_immobli.db import BulkWriter
+
+LISTINGS_TABLE = "listings"
+LISTING_SOURCES = ("coinafrique_html", "expat_dakar", "loger_dakar")
+
+LISTING_COLUMNS = (
+    "id", "source", "url", "title", "price", "surface_area", "bedrooms", "bathrooms",
+    "city", "region", "adresse", "description", "property_type", "statut", "posted_time",
+    "latitude", "longitude", "geo_level", "cluster_id", "content_hash", "scraped_at",
+    "extras",
+)
+# l'empreinte a changé : toute la fiche est réécrite (clé de conflit exclue)
+UPDATE_COLUMNS = tuple(col for col in LISTING_COLUMNS if col not in ("id", "source", "url"))
+
+LISTINGS_DDL = """
+    CREATE TABLE IF NOT EXISTS listings(
+        id VARCHAR(32) NOT NULL,
+        source VARCHAR(50) NOT NULL,
+        url TEXT NOT NULL,
+        title TEXT,
+        price INTEGER,
+        surface_area REAL,
+        bedrooms INTEGER,
+        bathrooms INTEGER,
+        city VARCHAR(100),
+        region VARCHAR(100),
+        adresse VARCHAR(100),
+        description TEXT,
+        property_type VARCHAR(100),
+        statut VARCHAR(50),
+        posted_time VARCHAR(100),
+        latitude REAL,
+        longitude REAL,
+        geo_level VARCHAR(10),
+        cluster_id VARCHAR(32),
+        content_hash BIGINT,
+        scraped_at TIMESTAMP,
+        extras JSONB NOT NULL DEFAULT '{}',
+        PRIMARY KEY (source, id),
+        UNIQUE (source, url)
+    ) PARTITION BY LIST (source);
+    CREATE TABLE IF NOT EXISTS listings_default PARTITION OF listings DEFAULT;
+    CREATE INDEX IF NOT EXISTS listings_city_price ON listings (city, price);
+    CREATE INDEX IF NOT EXISTS listings_type_statut_price ON listings (property_type, statut, price);
+    CREATE INDEX IF NOT EXISTS listings_price ON listings (price);
+    CREATE INDEX IF NOT EXISTS listings_cluster ON listings (cluster_id);
+    CREATE INDEX IF NOT EXISTS listings_scraped_at ON listings USING BRIN (scraped_at);
+"""
+
+_UNSAFE = re.compile(r"[^a-z0-9_]")
+
+
+def partition_name(source):
+    return f"listings_{_UNSAFE.sub('_', source.lower())}"
+
+
+def partition_sql(source):
+    """Partition d'un site ; à ajouter par une nouvelle migration."""
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(source)}"
+        f" PARTITION OF listings FOR VALUES IN ('{source}');"
+    )
+
+
+def listing_tables(sources=LISTING_SOURCES):
+    """[(partition, colonnes)] : une « table » par site (export Parquet)."""
+    names = [partition_name(source) for source in sources] + ["listings_default"]
+    return [(name, LISTING_COLUMNS) for name in names]
+
+
+def extras_of(row, extra_columns):
+    """Champs propres au site, en texte JSON (valeurs nulles omises)."""
+    extras = {col: row.get(col) for col in extra_columns if row.get(col) is not None}
+    return json.dumps(extras, ensure_ascii=False, default=str)
+
+
+class ListingWriter(BulkWriter):
+    """
+    BulkWriter pour ``listings`` : les champs de l'item hors
+    LISTING_COLUMNS sont regroupés dans ``extras``. Conflit sur
+    (source, url), comme l'ancien ``UNIQUE (url)`` de chaque table de site.
+    """
+
+    def __init__(self, pool, source, item_columns, **kwargs):
+        super().__init__(pool, LISTINGS_TABLE, LISTING_COLUMNS,
+                         conflict_column=("source", "url"),
+                         update_columns=UPDATE_COLUMNS, **kwargs)
+        self.source = source
+        self.extra_columns = tuple(col for col in item_columns if col not in LISTING_COLUMNS)
+
+    def add(self, row):
+        row = dict(row)
+        row["source"] = row.get("source") or self.source
+        row["extras"] = extras_of(row, self.extra_columns)
+        return super().add(row)
@@ -0,0 +1,85 @@
+"""
+Mémoire du processus pendant un long crawl (stats ``memory/*``).
+
+Toutes les MEMORY_STATS_INTERVAL secondes, et à la fermeture du spider :
+
+- ``memory/rss_bytes`` / ``memory/rss_max_bytes`` : RSS courant et maximal ;
+- ``memory/seen_urls``, ``memory/seen_bytes``, ``memory/seen_bytes_per_url`` :
+  URL déjà traitées par DuplicatesPipeline (seen.DigestSet) ;
+- ``memory/items_in_flight`` (et ``_max``) : items sortis des callbacks et
+  pas encore sortis des pipelines (contre-pression PostgreSQL comprise) ;
+- ``memory/responses_in_flight`` / ``memory/responses_in_flight_bytes`` :
+  réponses gardées par le scraper tant que leurs items sont en cours.
+
+Une RSS qui monte alors que ces compteurs restent stables pointe vers une
+fuite ailleurs (caches, index en mémoire).
+"""
+import os
+import resource
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes():
+    """RSS courant (Linux), sinon RSS maximal du processus."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return max_rss_bytes()
+
+
+def max_rss_bytes():
+    # ru_maxrss : kio sous Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MemoryStatsExtension:
+    def __init__(self, crawler, interval):
+        self.crawler = crawler
+        self.interval = interval
+        self.timer = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        interval = crawler.settings.getfloat("MEMORY_STATS_INTERVAL", 60.0)
+        if interval <= 0:
+            raise NotConfigured
+        ext = cls(crawler, interval)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        self.timer = task.LoopingCall(self.update)
+        self.timer.start(self.interval, now=False)
+
+    def spider_closed(self, spider):
+        if self.timer is not None and self.timer.running:
+            self.timer.stop()
+        self.update()
+
+    def update(self):
+        stats = self.crawler.stats
+        rss = rss_bytes()
+        stats.set_value("memory/rss_bytes", rss)
+        stats.max_value("memory/rss_max_bytes", max(rss, max_rss_bytes()))
+
+        seen = getattr(self.crawler, "_seen_digests", None)
+        if seen is not None:
+            stats.set_value("memory/seen_urls", len(seen))
+            stats.set_value("memory/seen_bytes", seen.nbytes)
+            if len(seen):
+                stats.set_value("memory/seen_bytes_per_url", round(seen.nbytes / len(seen), 1))
+
+        engine = self.crawler.engine
+        slot = getattr(getattr(engine, "scraper", None), "slot", None)
+        if slot is not None:
+            stats.set_value("memory/items_in_flight", slot.itemproc_size)
+            stats.max_value("memory/items_in_flight_max", slot.itemproc_size)
+            stats.set_value("memory/responses_in_flight", len(slot.active) + len(slot.queue))
+            stats.set_value("memory/responses_in_flight_bytes", slot.active_size)
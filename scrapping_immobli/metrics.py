@@ -0,0 +1,276 @@
+"""
+Métriques du crawl : compteurs et histogrammes agrégés par processus.
+
+- exposées au format texte Prometheus sur ``http://127.0.0.1:<port>/metrics``
+  (METRICS_PORT, plage de ports comme TELNETCONSOLE_PORT) ;
+- écrites en JSON à la fermeture de chaque spider (``.scrapy/metrics.json``).
+
+Mesures :
+
+- ``download_latency_seconds{domain}`` : latence de téléchargement ;
+- ``parse_cpu_seconds{spider, callback}`` : temps CPU par appel de callback
+  (``parse``, ``parse_detail``) ;
+- ``item_pipeline_cpu_seconds{spider, pipeline}`` : temps CPU par item et
+  par pipeline ;
+- ``db_flush_seconds{table}`` / ``db_batch_rows{table}`` : durée et taille
+  des lots PostgreSQL (BulkWriter) ;
+- ``items_scraped_total{spider}``, ``items_dropped_total{spider, reason}``.
+
+Les composants de mesure sont ceux du benchmark (bench.instrument), dont
+la méthode ``record`` alimente ici les histogrammes.
+"""
+import json
+import os
+from bisect import bisect_left
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.pipelines import ItemPipelineManager
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.project import data_path
+from scrapy.utils.reactor import listen_tcp
+from twisted.web.resource import Resource
+from twisted.web.server import Site
+
+from scrapping_immobli.bench.instrument import CallbackTimingMiddleware, TimedItemPipelineManager
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CPU_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+ROWS_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000)
+
+METRICS = {
+    # nom : (type, bornes, aide)
+    "download_latency_seconds": ("histogram", LATENCY_BUCKETS, "Latence de téléchargement par domaine"),
+    "parse_cpu_seconds": ("histogram", CPU_BUCKETS, "Temps CPU par appel de callback"),
+    "item_pipeline_cpu_seconds": ("histogram", CPU_BUCKETS, "Temps CPU par item et par pipeline"),
+    "db_flush_seconds": ("histogram", LATENCY_BUCKETS, "Durée d'écriture d'un lot PostgreSQL"),
+    "db_batch_rows": ("histogram", ROWS_BUCKETS, "Lignes par lot PostgreSQL"),
+    "items_scraped_total": ("counter", None, "Items sortis des pipelines"),
+    "items_dropped_total": ("counter", None, "Items écartés, par raison"),
+}
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total, result = 0, []
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q):
+        """Borne supérieure du seuil contenant le quantile ``q`` (approché)."""
+        if not self.count:
+            return None
+        target = q * self.count
+        for bound, total in self.cumulative():
+            if total >= target:
+                return bound if bound != float("inf") else self.bounds[-1]
+        return self.bounds[-1]
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": {_format(bound): total for bound, total in self.cumulative()},
+        }
+
+
+def _format(bound):
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class MetricsRegistry:
+    """Compteurs et histogrammes étiquetés ; à utiliser depuis le thread du reactor."""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(METRICS[name][1])
+        histogram.observe(value)
+
+    def render(self):
+        """Format texte d'exposition Prometheus."""
+        lines = []
+        for name, (kind, _, help_text) in METRICS.items():
+            series = sorted(
+                (key[1], value) for key, value in
+                (self.counters if kind == "counter" else self.histograms).items()
+                if key[0] == name
+            )
+            if not series:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in series:
+                if kind == "counter":
+                    lines.append(f"{name}{_labels(labels)} {value}")
+                    continue
+                for bound, total in value.cumulative():
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', _format(bound)),))} {total}")
+                lines.append(f"{name}_sum{_labels(labels)} {value.sum}")
+                lines.append(f"{name}_count{_labels(labels)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self):
+        result = {}
+        for (name, labels), value in sorted(self.counters.items()):
+            result.setdefault(name, []).append({"labels": dict(labels), "value": value})
+        for (name, labels), histogram in sorted(self.histograms.items(), key=lambda kv: kv[0]):
+            result.setdefault(name, []).append({"labels": dict(labels), **histogram.to_dict()})
+        return result
+
+
+REGISTRY = MetricsRegistry()
+
+
+def registry_for(crawler):
+    """Registre du processus, ou None si METRICS_ENABLED est faux."""
+    return REGISTRY if crawler.settings.getbool("METRICS_ENABLED") else None
+
+
+# ----------------------------------------------------------------------
+# Composants Scrapy
+# ----------------------------------------------------------------------
+class _MetricsResource(Resource):
+    isLeaf = True
+
+    def __init__(self, registry):
+        super().__init__()
+        self.registry = registry
+
+    def render_GET(self, request):
+        request.setHeader(b"Content-Type", b"text/plain; version=0.0.4; charset=utf-8")
+        return self.registry.render().encode("utf-8")
+
+
+class MetricsExtension:
+    """
+    Latences de téléchargement, items écartés par raison ; serveur HTTP et
+    export JSON. Un seul serveur par processus (``scrapy crawlall``).
+    """
+
+    port = None
+    users = 0
+
+    def __init__(self, registry, portrange, host, json_path):
+        self.registry = registry
+        self.portrange = portrange
+        self.host = host
+        self.json_path = json_path
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        registry = registry_for(crawler)
+        if registry is None:
+            raise NotConfigured
+        settings = crawler.settings
+        ext = cls(
+            registry,
+            [int(port) for port in settings.getlist("METRICS_PORT")],
+            settings.get("METRICS_HOST", "127.0.0.1"),
+            data_path(settings["METRICS_JSON_PATH"]) if settings.get("METRICS_JSON_PATH") else None,
+        )
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        crawler.signals.connect(ext.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(ext.item_dropped, signal=signals.item_dropped)
+        return ext
+
+    def spider_opened(self, spider):
+        cls = type(self)
+        cls.users += 1
+        if cls.port is None and self.portrange:
+            cls.port = listen_tcp(self.portrange, self.host, Site(_MetricsResource(self.registry)))
+            address = cls.port.getHost()
+            spider.logger.info("[METRICS] http://%s:%d/metrics", address.host, address.port)
+
+    def spider_closed(self, spider):
+        cls = type(self)
+        if self.json_path:
+            os.makedirs(os.path.dirname(self.json_path) or ".", exist_ok=True)
+            with open(self.json_path, "w", encoding="utf-8") as f:
+                json.dump(self.registry.to_dict(), f, indent=2, ensure_ascii=False)
+        cls.users -= 1
+        if cls.users == 0 and cls.port is not None:
+            port, cls.port = cls.port, None
+            return port.stopListening()
+
+    def response_received(self, response, request, spider):
+        latency = request.meta.get("download_latency")
+        if latency is not None:
+            self.registry.observe("download_latency_seconds", latency,
+                                  domain=urlparse_cached(response).hostname or "")
+
+    def item_scraped(self, item, response, spider):
+        self.registry.inc("items_scraped_total", spider=spider.name)
+
+    def item_dropped(self, item, response, exception, spider):
+        # « URL déjà traitée : https://… » -> « URL déjà traitée »
+        reason = str(exception).split(":")[0].strip() or type(exception).__name__
+        self.registry.inc("items_dropped_total", spider=spider.name, reason=reason)
+
+
+class CallbackMetricsMiddleware(CallbackTimingMiddleware):
+    """Temps CPU par appel de callback -> ``parse_cpu_seconds``."""
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        registry = registry_for(crawler)
+        if registry is None:
+            raise NotConfigured
+        return cls(registry)
+
+    def record(self, spider, stage, seconds):
+        self.registry.observe("parse_cpu_seconds", seconds, spider=spider.name, callback=stage)
+
+
+class MetricsItemPipelineManager(TimedItemPipelineManager):
+    """ITEM_PROCESSOR : temps CPU de chaque pipeline -> ``item_pipeline_cpu_seconds``."""
+
+    def _add_middleware(self, pipe):
+        if self.crawler is not None and registry_for(self.crawler) is None:
+            ItemPipelineManager._add_middleware(self, pipe)
+            return
+        super()._add_middleware(pipe)
+
+    def record(self, spider, stage, seconds):
+        REGISTRY.observe("item_pipeline_cpu_seconds", seconds, spider=spider.name, pipeline=stage)
@@ -1,5 +1,12 @@
 import random
+from scrapy import Request, signals
+from scrapy.downloadermiddlewares.httpcache import HttpCacheMiddleware
 from scrapy.downloadermiddlewares.useragent import UserAgentMiddleware
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.utils.project import data_path
+
+from scrapping_immobli.seen import SeenIndex
+from scrapping_immobli.throttle import AIMDController, DomainState, ThrottleStateStore, retry_after
 
 class RotateUserAgentMiddleware(UserAgentMiddleware):
     def __init__(self, user_agent_list):
@@ -13,4 +20,187 @@ class RotateUserAgentMiddleware(UserAgentMiddleware):
     def process_request(self, request, spider):
         ua = random.choice(self.user_agent_list)
         request.headers[b"User-Agent"] = ua.encode()
-        return None
\ No newline at end of file
+        return None
+
+
+class DetailHttpCacheMiddleware(HttpCacheMiddleware):
+    """
+    Cache HTTP des fiches (cf. scrapping_immobli.httpcache), placé juste
+    après la rotation d'User-Agent. En fin de crawl, les proportions de
+    hits, de revalidations (304) et de miss sont ajoutées aux stats.
+    """
+
+    def spider_closed(self, spider):
+        super().spider_closed(spider)
+        counts = {
+            "hit": self.stats.get_value("httpcache/hit", 0),
+            "revalidate": self.stats.get_value("httpcache/revalidate", 0),
+            "miss": self.stats.get_value("httpcache/miss", 0)
+                    + self.stats.get_value("httpcache/invalidate", 0),
+        }
+        total = sum(counts.values())
+        if not total:
+            return
+        for key, count in counts.items():
+            self.stats.set_value(f"httpcache/{key}_ratio", round(count / total, 3))
+
+class SeenUrlsMiddleware:
+    """
+    Middleware spider : les requêtes vers des fiches déjà connues (index
+    persistant SeenIndex) sont écartées avant le téléchargement, ou rétrogradées
+    en fin de file selon SEEN_FILTER_MODE (« skip » ou « deprioritize »).
+    Une requête portant ``meta["dont_skip_seen"]`` passe toujours.
+    """
+
+    def __init__(self, index, mode, callbacks, priority_step, stats):
+        self.index = index
+        self.mode = mode
+        self.callbacks = set(callbacks)
+        self.priority_step = priority_step
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        mode = settings.get("SEEN_FILTER_MODE", "skip")
+        if not settings.getbool("SEEN_INDEX_ENABLED") or mode not in ("skip", "deprioritize"):
+            raise NotConfigured
+        return cls(
+            SeenIndex.from_crawler(crawler),
+            mode,
+            settings.getlist("SEEN_FILTER_CALLBACKS", ["parse_detail"]),
+            settings.getint("SEEN_FILTER_PRIORITY_STEP", 100),
+            crawler.stats,
+        )
+
+    def _filter(self, obj):
+        """Renvoie la requête (éventuellement rétrogradée) ou None si écartée."""
+        if not isinstance(obj, Request):
+            return obj
+        callback = getattr(obj.callback, "__name__", None)
+        if callback not in self.callbacks or obj.meta.get("dont_skip_seen"):
+            return obj
+        if obj.url not in self.index:
+            return obj
+        if self.mode == "skip":
+            self.stats.inc_value("seen/skipped")
+            return None
+        self.stats.inc_value("seen/deprioritized")
+        return obj.replace(priority=obj.priority - self.priority_step)
+
+    def process_spider_output(self, response, result, spider):
+        for obj in result:
+            obj = self._filter(obj)
+            if obj is not None:
+                yield obj
+
+    async def process_spider_output_async(self, response, result, spider):
+        async for obj in result:
+            obj = self._filter(obj)
+            if obj is not None:
+                yield obj
+
+
+class AdaptiveThrottleMiddleware:
+    """
+    Concurrence et délai ajustés en continu, domaine par domaine (AIMD, cf.
+    scrapping_immobli.throttle), à partir de la latence mesurée, des 429/5xx
+    et des timeouts. Placé près du downloader pour voir les réponses avant
+    RetryMiddleware. Les limites apprises sont rechargées au crawl suivant.
+    """
+
+    THROTTLED = (429, 503)
+
+    def __init__(self, crawler, controller, store):
+        self.crawler = crawler
+        self.controller = controller
+        self.store = store
+        self.stats = crawler.stats
+        self.states = {}
+        self.touched = set()  # domaines contactés par ce crawl : seuls réécrits
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("ADAPTIVE_THROTTLE_ENABLED"):
+            raise NotConfigured
+        controller = AIMDController(
+            min_concurrency=settings.getint("ADAPTIVE_THROTTLE_MIN_CONCURRENCY", 1),
+            max_concurrency=settings.getint("ADAPTIVE_THROTTLE_MAX_CONCURRENCY",
+                                            settings.getint("CONCURRENT_REQUESTS")),
+            min_delay=settings.getfloat("ADAPTIVE_THROTTLE_MIN_DELAY", 0.0),
+            max_delay=settings.getfloat("ADAPTIVE_THROTTLE_MAX_DELAY", 60.0),
+            target_latency=settings.getfloat("ADAPTIVE_THROTTLE_TARGET_LATENCY", 2.0),
+            decrease_factor=settings.getfloat("ADAPTIVE_THROTTLE_DECREASE_FACTOR", 0.5),
+        )
+        store = ThrottleStateStore(data_path(settings.get("ADAPTIVE_THROTTLE_STATE", "throttle.json")))
+        mw = cls(crawler, controller, store)
+        crawler.signals.connect(mw.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(mw.spider_closed, signal=signals.spider_closed)
+        return mw
+
+    def spider_opened(self, spider):
+        self.states = self.store.load()
+        # les nouveaux slots démarrent directement aux limites apprises
+        per_slot = self.crawler.engine.downloader.per_slot_settings
+        for key, state in self.states.items():
+            per_slot.setdefault(key, {}).update(concurrency=state.slot_concurrency, delay=state.delay)
+        if self.states:
+            spider.logger.info("[THROTTLE] limites reprises pour %d domaine(s)", len(self.states))
+
+    def spider_closed(self, spider):
+        self.store.save({key: self.states[key] for key in self.touched})
+        for key, state in self.states.items():
+            self._publish(key, state)
+
+    def _slot(self, request):
+        key = request.meta.get("download_slot")
+        if key is None:
+            return None, None
+        return key, self.crawler.engine.downloader.slots.get(key)
+
+    def _state(self, key, slot):
+        self.touched.add(key)
+        state = self.states.get(key)
+        if state is None:
+            state = self.states[key] = DomainState(slot.concurrency, slot.delay)
+        return state
+
+    def _apply(self, key, slot, state, decision):
+        if decision is None:
+            return
+        slot.concurrency = state.slot_concurrency
+        slot.delay = state.delay
+        self.stats.inc_value(f"throttle/{key}/{decision}")
+        self._publish(key, state)
+
+    def _publish(self, key, state):
+        self.stats.set_value(f"throttle/{key}/concurrency", state.slot_concurrency)
+        self.stats.set_value(f"throttle/{key}/delay", round(state.delay, 3))
+        if state.latency is not None:
+            self.stats.set_value(f"throttle/{key}/latency_ms", round(state.latency * 1000))
+
+    def process_response(self, request, response, spider):
+        key, slot = self._slot(request)
+        if slot is None:
+            return response
+        state = self._state(key, slot)
+        if response.status in self.THROTTLED:
+            decision = self.controller.on_throttled(state, retry_after(response))
+            spider.logger.info("[THROTTLE] %s : %d, concurrence %d, délai %.2fs",
+                               key, response.status, state.slot_concurrency, state.delay)
+        elif response.status >= 500:
+            decision = self.controller.on_error(state)
+        else:
+            decision = self.controller.on_success(state, request.meta.get("download_latency"))
+        self._apply(key, slot, state, decision)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        if isinstance(exception, IgnoreRequest):
+            return None
+        key, slot = self._slot(request)
+        if slot is not None:
+            state = self._state(key, slot)
+            self._apply(key, slot, state, self.controller.on_error(state))
+        return None
@@ -0,0 +1,188 @@
+"""
+Migrations versionnées du schéma PostgreSQL (``scrapy migrate``).
+
+Chaque migration a un numéro ; celles déjà passées sont notées dans
+``schema_migrations``. Le DDL ne tourne donc qu'une fois par base, et non
+plus à chaque ``open_spider`` : à l'ouverture, les pipelines ne font que
+comparer les versions (une requête), et appliquent les migrations en
+attente si DB_AUTO_MIGRATE est vrai.
+
+Une migration = une transaction, sous verrou consultatif : deux processus
+qui démarrent ensemble ne l'appliquent pas deux fois, et une migration qui
+échoue ne laisse rien à moitié fait.
+
+Pour faire évoluer le schéma, ajouter une entrée à la fin de MIGRATIONS ;
+ne jamais modifier une migration déjà publiée.
+"""
+from scrapping_immobli.aggregates import AGGREGATES_DDL
+from scrapping_immobli.freshness import FRESHNESS_DDL
+from scrapping_immobli.history import HISTORY_DDL
+from scrapping_immobli.listings import (
+    LISTING_COLUMNS, LISTING_SOURCES, LISTINGS_DDL, partition_name, partition_sql,
+)
+from scrapping_immobli.search import SEARCH_DDL
+
+MIGRATIONS_DDL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations(
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT now()
+    );
+"""
+
+# anciennes tables par site -> (source, champs propres au site et leur type)
+LEGACY_TABLES = (
+    ("properties", "coinafrique_html", {"nb_annonces": "INTEGER"}),
+    ("expat_dakar_properties", "expat_dakar", {"member_since": "VARCHAR(50)"}),
+    ("loger_dakar_properties", "loger_dakar", {"listing_id": "VARCHAR(50)"}),
+)
+
+
+# ----------------------------------------------------------------------
+# Étapes
+# ----------------------------------------------------------------------
+def _columns(cur, table):
+    cur.execute(
+        "SELECT column_name FROM information_schema.columns"
+        " WHERE table_schema = current_schema() AND table_name = %s",
+        (table,),
+    )
+    return {row[0] for row in cur.fetchall()}
+
+
+def _is_table(cur, name):
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (name,))
+    row = cur.fetchone()
+    return row is not None and row[0] in ("r", "p")
+
+
+def create_listings(cur, log):
+    """
+    Crée ``listings`` et ses partitions, y déplace les lignes des anciennes
+    tables par site, puis remplace chacune par une vue du même nom (mêmes
+    colonnes) : requêtes et tableaux de bord existants continuent de marcher.
+    Une table dont toutes les lignes n'ont pas pu être déplacées (id ou url
+    vide, doublon de (source, url) ou de (source, id)) est gardée sous le nom
+    ``<table>_legacy`` plutôt que supprimée.
+    """
+    cur.execute(LISTINGS_DDL)
+    for source in LISTING_SOURCES:
+        cur.execute(partition_sql(source))
+
+    shared = [col for col in LISTING_COLUMNS if col not in ("source", "extras")]
+    for table, source, extra_types in LEGACY_TABLES:
+        if _is_table(cur, table):
+            present = _columns(cur, table)
+            # colonnes ajoutées après coup (ALTER TABLE) : absentes des vieilles bases
+            select = [col if col in present else f"NULL AS {col}" for col in shared]
+            extras = ", ".join(f"'{col}', {col}" for col in extra_types if col in present)
+            cur.execute(f"""
+                INSERT INTO listings ({", ".join(shared)}, source, extras)
+                SELECT {", ".join(select)}, %s,
+                       jsonb_strip_nulls(jsonb_build_object({extras}))
+                FROM {table}
+                WHERE id IS NOT NULL AND url IS NOT NULL
+                ON CONFLICT DO NOTHING
+            """, (source,))
+            moved = cur.rowcount
+            cur.execute(f"SELECT COUNT(*) FROM {table}")
+            total = cur.fetchone()[0]
+            log(f"{table} -> {partition_name(source)} : {moved} / {total} lignes")
+            if moved == total:
+                cur.execute(f"DROP TABLE {table}")
+            else:
+                cur.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+                log(f"{table} : {total - moved} lignes non déplacées, table gardée"
+                    f" sous le nom {table}_legacy")
+        casts = "".join(
+            f", (extras->>'{col}')::{type_} AS {col}" for col, type_ in extra_types.items()
+        )
+        cur.execute(
+            f"CREATE OR REPLACE VIEW {table} AS"
+            f" SELECT {', '.join(col for col in LISTING_COLUMNS if col != 'extras')}{casts}"
+            f" FROM {partition_name(source)}"
+        )
+
+
+MIGRATIONS = (
+    # (version, nom, DDL ou fonction (curseur, log))
+    (1, "table listings partitionnée par source", create_listings),
+    (2, "historique des prix", HISTORY_DDL),
+    (3, "agrégats de marché", AGGREGATES_DDL),
+    (4, "recherche plein texte", SEARCH_DDL),
+    (5, "revisite selon la fraîcheur", FRESHNESS_DDL),
+)
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+# ----------------------------------------------------------------------
+# Application
+# ----------------------------------------------------------------------
+def applied_versions(conn):
+    """{version: (nom, date)} des migrations déjà passées."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('schema_migrations')")
+        if cur.fetchone()[0] is None:
+            conn.commit()
+            return {}
+        cur.execute("SELECT version, name, applied_at FROM schema_migrations")
+        rows = cur.fetchall()
+    conn.commit()
+    return {version: (name, applied_at) for version, name, applied_at in rows}
+
+
+def pending(conn):
+    """[(version, nom)] des migrations à appliquer, dans l'ordre."""
+    applied = applied_versions(conn)
+    return [(version, name) for version, name, _ in MIGRATIONS if version not in applied]
+
+
+def migrate(conn, target=None, log=print):
+    """
+    Applique les migrations en attente (jusqu'à ``target`` inclus) ;
+    retourne les versions appliquées.
+    """
+    done = []
+    for version, name, step in MIGRATIONS:
+        if target is not None and version > target:
+            break
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_xact_lock(hashtext('schema_migrations'))")
+                cur.execute(MIGRATIONS_DDL)
+                # relu sous verrou : un autre processus a pu passer avant
+                cur.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (version,))
+                if cur.fetchone() is not None:
+                    conn.commit()
+                    continue
+                log(f"migration {version} : {name}")
+                if callable(step):
+                    step(cur, log)
+                else:
+                    cur.execute(step)
+                cur.execute(
+                    "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                    (version, name),
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        done.append(version)
+    return done
+
+
+def ensure_schema(conn, auto_migrate=True, log=print):
+    """
+    À l'ouverture d'un pipeline : rien si le schéma est à jour, sinon
+    migration (DB_AUTO_MIGRATE) ou erreur explicite.
+    """
+    todo = pending(conn)
+    if not todo:
+        return []
+    if not auto_migrate:
+        versions = ", ".join(str(version) for version, _ in todo)
+        raise RuntimeError(
+            f"schéma PostgreSQL en retard (migrations {versions}) : lancer « scrapy migrate »"
+        )
+    return migrate(conn, log=log)
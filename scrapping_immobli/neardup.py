@@ -0,0 +1,299 @@
+"""
+Annonces quasi identiques, d'un site à l'autre (et d'un agent à l'autre).
+
+Un même bien publié sur coinafrique, expat-dakar et loger-dakar a trois
+URL, donc trois ``id`` : NearDuplicateIndex leur donne un même
+``cluster_id``.
+
+- texte : shingles de 3 mots du titre et de la description, résumés par
+  une signature MinHash (NEAR_DUP_PERMUTATIONS valeurs) ;
+- LSH : la signature est découpée en NEAR_DUP_BANDS bandes ; deux annonces
+  partageant une bande deviennent candidates ;
+- blocage : la clé de bande inclut la tranche de prix (tranches
+  logarithmiques de NEAR_DUP_TOLERANCE, tranches voisines interrogées) ;
+  surface, chambres et ville filtrent ensuite les candidates ;
+- une candidate retenue (similarité estimée >= NEAR_DUP_THRESHOLD) donne
+  son ``cluster_id`` ; sinon l'annonce ouvre son propre cluster (= son id).
+
+Chaque nouvelle annonce n'est comparée qu'aux candidates de ses bandes,
+lues dans un index SQLite persistant (``.scrapy/near_duplicates.sqlite``),
+jamais à toutes les autres : le coût reste constant quand l'index grossit.
+"""
+import hashlib
+import math
+import os
+import random
+import re
+import sqlite3
+import unicodedata
+import zlib
+from array import array
+
+from scrapy import signals
+from scrapy.utils.project import data_path
+
+from scrapping_immobli.fingerprint import id_key
+
+_WORDS = re.compile(r"[a-z0-9]+")
+_MERSENNE = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+# ----------------------------------------------------------------------
+# Texte -> shingles -> signature MinHash
+# ----------------------------------------------------------------------
+def words(text):
+    if not text:
+        return []
+    text = unicodedata.normalize("NFKD", str(text).lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return [word for word in _WORDS.findall(text) if len(word) > 1]
+
+
+def shingles(item, size=3):
+    """Ensemble des shingles (crc32 de ``size`` mots consécutifs) titre + description."""
+    tokens = words(item.get("title")) + words(item.get("description"))
+    if len(tokens) < size:
+        return {zlib.crc32(token.encode()) for token in tokens}
+    return {
+        zlib.crc32(" ".join(tokens[i:i + size]).encode())
+        for i in range(len(tokens) - size + 1)
+    }
+
+
+class MinHasher:
+    """Permutations universelles (a*x + b) mod p, graine fixe : signatures stables entre runs."""
+
+    def __init__(self, permutations=64, seed=1):
+        rng = random.Random(seed)
+        self.params = [(rng.randrange(1, _MERSENNE), rng.randrange(0, _MERSENNE))
+                       for _ in range(permutations)]
+
+    def signature(self, hashes):
+        return array("I", [
+            min(((a * x + b) % _MERSENNE) & _MAX_HASH for x in hashes)
+            for a, b in self.params
+        ])
+
+
+def similarity(sig1, sig2):
+    """Jaccard estimé : part des positions égales."""
+    return sum(1 for x, y in zip(sig1, sig2) if x == y) / len(sig1)
+
+
+def _band_key(block, band, values):
+    h = hashlib.blake2b(digest_size=8)
+    h.update(f"{block}:{band}:".encode())
+    h.update(values.tobytes())
+    return int.from_bytes(h.digest(), "big", signed=True)
+
+
+def _close(a, b, tolerance):
+    if a is None or b is None:
+        return True
+    return abs(a - b) <= tolerance * max(abs(a), abs(b))
+
+
+# ----------------------------------------------------------------------
+# Index persistant
+# ----------------------------------------------------------------------
+class NearDuplicateIndex:
+    """
+    Signatures et bandes LSH en SQLite ; les ajouts sont mis en tampon et
+    écrits par lots de ``commit_every`` (et à la fermeture).
+    """
+
+    _shared = {}
+
+    def __init__(self, path, permutations=64, bands=16, threshold=0.6, tolerance=0.1,
+                 max_candidates=50, commit_every=500):
+        if permutations % bands:
+            raise ValueError("NEAR_DUP_PERMUTATIONS doit être un multiple de NEAR_DUP_BANDS")
+        self.path = path
+        self.hasher = MinHasher(permutations)
+        self.bands = bands
+        self.rows = permutations // bands
+        self.threshold = threshold
+        self.tolerance = tolerance
+        self.max_candidates = max_candidates
+        self.commit_every = commit_every
+        self.conn = None
+        self.pending_listings = {}
+        self.pending_bands = {}
+        self.users = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """Une instance par fichier et par processus (cf. SeenIndex.from_crawler)."""
+        settings = crawler.settings
+        path = data_path(settings.get("NEAR_DUP_PATH", "near_duplicates.sqlite"))
+        index = cls._shared.get(path)
+        if index is None:
+            index = cls._shared[path] = cls(
+                path,
+                permutations=settings.getint("NEAR_DUP_PERMUTATIONS", 64),
+                bands=settings.getint("NEAR_DUP_BANDS", 16),
+                threshold=settings.getfloat("NEAR_DUP_THRESHOLD", 0.6),
+                tolerance=settings.getfloat("NEAR_DUP_TOLERANCE", 0.1),
+                max_candidates=settings.getint("NEAR_DUP_MAX_CANDIDATES", 50),
+            )
+        crawler.signals.connect(index.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(index.spider_closed, signal=signals.spider_closed)
+        return index
+
+    # ------------------------------------------------------------------
+    # Cycle de vie
+    # ------------------------------------------------------------------
+    def open(self):
+        if self.conn is not None:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript("""
+            -- listing : 8 premiers octets de l'id (fingerprint.id_key)
+            CREATE TABLE IF NOT EXISTS listings (
+                listing INTEGER PRIMARY KEY, cluster_id TEXT NOT NULL, signature BLOB,
+                price INTEGER, surface REAL, bedrooms INTEGER, city TEXT
+            );
+            CREATE TABLE IF NOT EXISTS bands (
+                key INTEGER NOT NULL, listing INTEGER NOT NULL,
+                PRIMARY KEY (key, listing)
+            ) WITHOUT ROWID;
+        """)
+
+    def close(self):
+        if self.conn is None:
+            return
+        self.sync()
+        self.conn.close()
+        self.conn = None
+
+    def spider_opened(self, spider):
+        self.users += 1
+        if self.conn is None:
+            self.open()
+            spider.logger.info("[NEARDUP] index ouvert : %d annonces", len(self))
+
+    def spider_closed(self, spider):
+        self.users -= 1
+        if self.users > 0:
+            self.sync()
+            return
+        self._shared.pop(self.path, None)
+        self.close()
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM listings").fetchone()[0] + len(self.pending_listings)
+
+    def assign(self, item):
+        """
+        ``cluster_id`` de l'item, et s'il rejoint un cluster existant.
+        Une annonce déjà indexée garde son cluster.
+        """
+        listing_id = item["id"]
+        listing = id_key(listing_id)
+        known = self._listing(listing)
+        if known is not None:
+            return known[0], False
+
+        hashes = shingles(item)
+        city = " ".join(words(item.get("city"))) or None
+        attrs = (item.get("price"), item.get("surface_area"), item.get("bedrooms"), city)
+        if not hashes:
+            self._store(listing, listing_id, None, attrs, ())
+            return listing_id, False
+
+        signature = self.hasher.signature(hashes)
+        bucket = self._price_bucket(attrs[0])
+        best, best_score = None, self.threshold
+        for candidate in self._candidates(signature, bucket):
+            row = self._listing(candidate)
+            if row is None or row[1] is None or not self._compatible(attrs, row[2:]):
+                continue
+            score = similarity(signature, array("I", row[1]))
+            if score >= best_score:
+                best, best_score = row[0], score
+
+        keys = self._band_keys(signature, bucket)
+        cluster_id = best or listing_id
+        self._store(listing, cluster_id, signature.tobytes(), attrs, keys)
+        return cluster_id, best is not None
+
+    def sync(self):
+        if not self.pending_listings:
+            return
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(listing,) + row for listing, row in self.pending_listings.items()],
+        )
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO bands (key, listing) VALUES (?, ?)",
+            [(key, listing) for key, listings in self.pending_bands.items() for listing in listings],
+        )
+        self.conn.commit()
+        self.pending_listings = {}
+        self.pending_bands = {}
+
+    # ------------------------------------------------------------------
+    # Interne
+    # ------------------------------------------------------------------
+    def _price_bucket(self, price):
+        if not price or price <= 0:
+            return None
+        return int(math.log(price) / math.log1p(self.tolerance))
+
+    def _band_keys(self, signature, bucket):
+        return [
+            _band_key(bucket, band, signature[band * self.rows:(band + 1) * self.rows])
+            for band in range(self.bands)
+        ]
+
+    def _candidates(self, signature, bucket):
+        # tranche de prix voisine : un écart de prix à cheval sur deux tranches
+        buckets = [bucket] if bucket is None else [bucket - 1, bucket, bucket + 1]
+        keys = [key for b in buckets for key in self._band_keys(signature, b)]
+        found = []
+        for key in keys:
+            found.extend(self.pending_bands.get(key, ()))
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            found.extend(listing for (listing,) in self.conn.execute(
+                f"SELECT listing FROM bands WHERE key IN ({', '.join('?' * len(chunk))})"
+                f" LIMIT {self.max_candidates * self.bands}",
+                chunk,
+            ))
+        seen = set()
+        return [x for x in found if not (x in seen or seen.add(x))][:self.max_candidates]
+
+    def _compatible(self, attrs, other):
+        price, surface, bedrooms, city = attrs
+        other_price, other_surface, other_bedrooms, other_city = other
+        if not _close(price, other_price, self.tolerance):
+            return False
+        if not _close(surface, other_surface, self.tolerance):
+            return False
+        if bedrooms is not None and other_bedrooms is not None and bedrooms != other_bedrooms:
+            return False
+        if city and other_city and not (set(city.split()) & set(other_city.split())):
+            return False
+        return True
+
+    def _listing(self, listing):
+        """(cluster_id, signature, price, surface, bedrooms, city) ou None."""
+        row = self.pending_listings.get(listing)
+        if row is not None:
+            return row
+        return self.conn.execute(
+            "SELECT cluster_id, signature, price, surface, bedrooms, city FROM listings WHERE listing = ?",
+            (listing,),
+        ).fetchone()
+
+    def _store(self, listing, cluster_id, signature, attrs, keys):
+        self.pending_listings[listing] = (cluster_id, signature) + attrs
+        for key in keys:
+            self.pending_bands.setdefault(key, []).append(listing)
+        if len(self.pending_listings) >= self.commit_every:
+            self.sync()
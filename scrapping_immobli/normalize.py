@@ -0,0 +1,206 @@
+"""
+Normalisation des valeurs extraites (prix, surfaces, pièces, textes).
+
+Un seul endroit pour les règles de nettoyage : les schémas d'extraction des
+spiders appellent ces fonctions au moment de l'extraction, et chaque champ
+n'est donc normalisé qu'une fois par item (les pipelines ne repassent pas
+dessus).
+
+Exemples ::
+
+    price("45 000 000 FCFA")     -> 45000000
+    price("25 M")                -> 25000000
+    price("85m2")                -> None   (surface, pas un prix)
+    price("Prix sur demande")    -> None
+    rooms("3 Ch")                -> 3
+    surface("1 200 m²")          -> 1200.0
+    surface("0,5 ha")            -> 5000.0
+
+Pour les reprises (backfill, re-traitement d'un export), ``normalize_rows``
+et ``normalize_frame`` traitent des milliers de lignes colonne par colonne :
+chaque valeur distincte n'est convertie qu'une fois.
+"""
+import re
+from functools import lru_cache
+
+# espaces (\s couvre les insécables U+00A0 et U+202F), points et virgules
+# utilisés comme séparateurs de milliers : « 1 200 000 », « 45.000.000 »
+_THOUSANDS = re.compile(r"(?<=\d)[\s.,](?=\d{3}(?!\d))")
+_SPACES = re.compile(r"\s+")
+_NO_PRICE = re.compile(r"sur\s+demande|à\s+débattre|nous\s+consulter", re.IGNORECASE)
+# « m2 » / « m² » avant « m » : une surface (« 85m2 ») n'est pas un prix de 85 M
+_PRICE = re.compile(
+    r"(\d+(?:[.,]\d+)?)(?:\s*(m2|m²|milliards?|mds?|millions?|mio|m|k)(?![a-z²\d]))?",
+    re.IGNORECASE,
+)
+_PRICE_UNITS = {
+    "milliard": 1_000_000_000, "milliards": 1_000_000_000, "md": 1_000_000_000, "mds": 1_000_000_000,
+    "million": 1_000_000, "millions": 1_000_000, "mio": 1_000_000, "m": 1_000_000,
+    "k": 1_000,
+    "m2": None, "m²": None,
+}
+_SURFACE = re.compile(r"(\d+(?:[.,]\d+)?)(?:\s*(ha|hectares?|ares?|a)(?![a-z]))?", re.IGNORECASE)
+_SURFACE_UNITS = {"ha": 10_000, "hectare": 10_000, "hectares": 10_000, "a": 100, "are": 100, "ares": 100}
+_INTEGER = re.compile(r"\d+")
+
+CACHE_SIZE = 65536
+
+
+def _prepare(text):
+    return _THOUSANDS.sub("", text)
+
+
+def _decimal(digits):
+    return float(digits.replace(",", "."))
+
+
+# ----------------------------------------------------------------------
+# Conversions unitaires (texte -> valeur), mises en cache
+# ----------------------------------------------------------------------
+@lru_cache(maxsize=CACHE_SIZE)
+def _price(text):
+    if _NO_PRICE.search(text):
+        return None
+    for match in _PRICE.finditer(_prepare(text)):
+        value = _decimal(match.group(1))
+        unit = match.group(2)
+        if unit:
+            factor = _PRICE_UNITS[unit.lower()]
+            if factor is None:  # surface : le prix est plus loin, ou absent
+                continue
+            value *= factor
+        return int(round(value)) or None
+    return None
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _surface(text):
+    match = _SURFACE.search(_prepare(text))
+    if not match:
+        return None
+    value = _decimal(match.group(1))
+    unit = match.group(2)
+    if unit:
+        value *= _SURFACE_UNITS[unit.lower()]
+    return value
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _integer(text):
+    match = _INTEGER.search(_prepare(text))
+    return int(match.group(0)) if match else None
+
+
+def _scalar(value):
+    """Premier élément d'une liste (sorties d'ItemLoader), sinon la valeur."""
+    if isinstance(value, (list, tuple)):
+        return value[0] if value else None
+    return value
+
+
+def price(value):
+    """Prix en FCFA (int) ; None pour « Prix sur demande » ou sans chiffre."""
+    value = _scalar(value)
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value) or None
+    return _price(str(value))
+
+
+def surface(value):
+    """Surface en m² (float) ; « ha » et « a » sont convertis."""
+    value = _scalar(value)
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    return _surface(str(value))
+
+
+def integer(value):
+    """Premier entier d'un texte (« 3 Ch » -> 3, « 188 annonces » -> 188)."""
+    value = _scalar(value)
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    return _integer(str(value))
+
+
+rooms = integer
+
+
+def text(value):
+    """Texte sur une ligne, espaces normalisés ; None si vide."""
+    value = _scalar(value)
+    if value is None:
+        return None
+    value = _SPACES.sub(" ", str(value)).strip()
+    return value or None
+
+
+# ----------------------------------------------------------------------
+# Traitement par lots
+# ----------------------------------------------------------------------
+FIELDS = {
+    "price": price,
+    "surface_area": surface,
+    "bedrooms": rooms,
+    "bathrooms": rooms,
+    "nb_annonces": integer,
+    "title": text,
+    "city": text,
+    "region": text,
+    "adresse": text,
+    "posted_time": text,
+    "property_type": text,
+    "statut": text,
+    "member_since": text,
+    "listing_id": text,
+}
+
+
+def normalize_column(values, func):
+    """Liste des valeurs converties ; chaque valeur distincte n'est convertie qu'une fois."""
+    converted = {}
+    out = []
+    for value in values:
+        key = tuple(value) if isinstance(value, list) else value
+        try:
+            result = converted[key]
+        except KeyError:
+            result = converted[key] = func(value)
+        except TypeError:  # valeur non hachable
+            result = func(value)
+        out.append(result)
+    return out
+
+
+def normalize_rows(rows, fields=None):
+    """
+    Normalise en place une liste de dicts (ou d'items), colonne par colonne.
+    ``fields`` : {colonne: fonction}, par défaut ``FIELDS``.
+    """
+    rows = list(rows)
+    for name, func in (fields or FIELDS).items():
+        present = [row for row in rows if name in row]
+        if not present:
+            continue
+        for row, value in zip(present, normalize_column([row[name] for row in present], func)):
+            row[name] = value
+    return rows
+
+
+def normalize_frame(frame, fields=None):
+    """
+    Variante pandas (optionnelle) : convertit les valeurs distinctes de chaque
+    colonne puis applique la table de correspondance avec ``Series.map``.
+    """
+    for name, func in (fields or FIELDS).items():
+        if name not in frame.columns:
+            continue
+        column = frame[name]
+        mapping = {value: func(value) for value in column.dropna().unique()}
+        frame[name] = column.map(mapping).astype(object).where(column.notna(), None)
+    return frame
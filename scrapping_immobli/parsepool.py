@@ -0,0 +1,154 @@
+"""
+Parsing des fiches annonces dans un pool de processus (opt-in).
+
+Par défaut, ``parse_detail`` construit l'arbre lxml et évalue le schéma
+d'extraction dans le thread du reactor : sur un gros crawl, un seul cœur
+sature pendant que les téléchargements attendent. Avec
+``PARSE_POOL_ENABLED = True`` :
+
+- le corps de la fiche (octets) et son encodage partent vers un
+  ``ProcessPoolExecutor`` de PARSE_POOL_WORKERS processus ;
+- le processus charge la classe du spider (une fois), appelle
+  ``detail_schema.extract_html`` et renvoie de simples dicts ;
+- le spider complète l'item (url, source, meta du listing) dans le reactor,
+  comme en mode direct ; les pipelines ne voient aucune différence ;
+- au plus PARSE_POOL_MAX_IN_FLIGHT fiches sont en cours dans le pool ;
+  au-delà, le callback attend, le scraper garde la réponse et Scrapy cesse
+  d'alimenter le téléchargeur (contre-pression) ;
+- repli sur le parsing direct si le pool échoue (processus tué, délai
+  PARSE_POOL_TIMEOUT dépassé) ; un pool cassé n'est plus utilisé jusqu'à
+  la fin du crawl. Stats ``parsepool/parsed``, ``parsepool/fallback``.
+  Une fiche en retard est annulée si elle n'a pas encore démarré ; sinon
+  elle garde sa place dans la borne jusqu'à la fin de son calcul.
+
+Un seul pool par processus, partagé par les spiders (``scrapy crawlall``).
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from scrapy import signals
+from scrapy.utils.misc import load_object
+from twisted.internet import defer
+
+# côté processus du pool : classe de spider -> schéma compilé
+_schemas = {}
+
+
+def spider_path(spider):
+    cls = type(spider)
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+def extract_detail(path, body, encoding):
+    """Exécuté dans un processus du pool : (valeurs, champs requis manquants)."""
+    schema = _schemas.get(path)
+    if schema is None:
+        schema = _schemas[path] = load_object(path).detail_schema
+    return schema.extract_html(body, encoding)
+
+
+def default_workers():
+    # un cœur reste au reactor
+    return max((os.cpu_count() or 2) - 1, 1)
+
+
+def create_executor(workers):
+    # forkserver : les processus ne partent pas d'une copie du reactor en
+    # cours (threads d'écriture, connexions PostgreSQL)
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context(method))
+
+
+def _deferred_from_future(future):
+    from twisted.internet import reactor
+    # annulé (délai dépassé) : la fiche ne part pas si elle attend encore
+    d = defer.Deferred(lambda _: future.cancel())
+    future.add_done_callback(lambda f: reactor.callFromThread(_fire, d, f))
+    return d
+
+
+def _fire(d, future):
+    if d.called:  # délai dépassé entre-temps
+        return
+    if future.cancelled():
+        d.errback(defer.CancelledError())
+    elif future.exception() is not None:
+        d.errback(future.exception())
+    else:
+        d.callback(future.result())
+
+
+class ParsePool:
+    """Pool de processus et borne sur le nombre de fiches en cours."""
+
+    _shared = None
+
+    def __init__(self, workers, max_in_flight, timeout):
+        self.workers = workers
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.executor = create_executor(workers)
+        self.semaphore = defer.DeferredSemaphore(max_in_flight)
+        self.broken = False
+        self.users = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """Pool du processus (créé au premier spider, fermé au dernier)."""
+        pool = cls._shared
+        if pool is None:
+            settings = crawler.settings
+            workers = settings.getint("PARSE_POOL_WORKERS") or default_workers()
+            pool = cls._shared = cls(
+                workers,
+                settings.getint("PARSE_POOL_MAX_IN_FLIGHT") or 4 * workers,
+                settings.getfloat("PARSE_POOL_TIMEOUT", 30.0),
+            )
+        pool.users += 1
+        crawler.signals.connect(pool.spider_closed, signal=signals.spider_closed)
+        return pool
+
+    @property
+    def available(self):
+        return not self.broken
+
+    def extract(self, spider, body, encoding):
+        """Deferred -> (valeurs, manquants), calculés dans un processus du pool."""
+        d = self.semaphore.acquire()
+        d.addCallback(lambda _: self._submit(spider_path(spider), body, encoding))
+        return d
+
+    def _submit(self, path, body, encoding):
+        from twisted.internet import reactor
+        try:
+            future = self.executor.submit(extract_detail, path, body, encoding)
+        except (BrokenProcessPool, RuntimeError) as exc:
+            self.semaphore.release()
+            self.broken = True
+            return defer.fail(exc)
+        # la place se libère à la fin réelle du calcul, pas au délai dépassé :
+        # jamais plus de max_in_flight fiches dans le pool
+        future.add_done_callback(lambda _: reactor.callFromThread(self.semaphore.release))
+        d = _deferred_from_future(future)
+        if self.timeout:
+            d.addTimeout(self.timeout, reactor)
+        d.addErrback(self._check_broken)
+        return d
+
+    def _check_broken(self, failure):
+        if failure.check(BrokenProcessPool):
+            self.broken = True
+        return failure
+
+    def spider_closed(self, spider):
+        self.release()
+
+    def release(self):
+        self.users -= 1
+        if self.users > 0:
+            return
+        if type(self)._shared is self:
+            type(self)._shared = None
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,27 +1,23 @@
-import psycopg2
-import hashlib
-import re
 from datetime import datetime
-from scrapy.exceptions import DropItem
-
-
-
-def clean_list(value):
-    if isinstance(value, list):
-        return str(value[0]).strip() if value else None
-    return str(value).strip() if value else None
-
-def clean_int(value):
-    try:
-        return int(re.sub(r'\D', '', str(value).strip()))
-    except (ValueError, AttributeError):
-        return None
-
-def clean_float(value):
-    try:
-        return float(re.search(r'(\d+(?:\.\d+)?)', str(value).replace('\u202f', '').replace(' ', '')).group(1))
-    except (ValueError, AttributeError):
-        return None
+from scrapy import signals
+from scrapy.exceptions import DropItem, NotConfigured
+from scrapy.utils.misc import load_object
+
+from scrapping_immobli.aggregates import AggregateWriter
+from scrapping_immobli.db import BulkWriter, ConnectionPool, db_route
+from scrapping_immobli.fingerprint import FingerprintMap, content_fingerprint, fingerprint_fields
+from scrapping_immobli.geocode import Geocoder
+from scrapping_immobli.history import HistoryWriter
+from scrapping_immobli.listings import LISTINGS_TABLE, ListingWriter, partition_name
+from scrapping_immobli.metrics import registry_for
+from scrapping_immobli.migrations import ensure_schema
+from scrapping_immobli.neardup import NearDuplicateIndex
+from scrapping_immobli.search import SEARCH_COLUMNS, SearchWriter
+from scrapping_immobli.seen import DigestSet, SeenIndex, url_digest
+
+# signal : annonces écrites en base par le pipeline du site (ou inchangées),
+# ``listings=[(id, price), ...]``
+listings_stored = object()
 
 
 class ValidationPipeline:
@@ -33,126 +29,119 @@ class ValidationPipeline:
 
 
 class DuplicatesPipeline:
-    def __init__(self):
-        self.urls_seen = set()
+    def __init__(self, seen_index=None):
+        # empreintes MD5 binaires (16 octets) dans une table compacte
+        self.urls_seen = DigestSet()
+        # index persistant : les annonces enregistrées ne seront plus
+        # téléchargées aux prochains crawls (cf. SeenUrlsMiddleware)
+        self.seen_index = seen_index
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("SEEN_INDEX_ENABLED"):
+            pipeline = cls()
+        else:
+            pipeline = cls(SeenIndex.from_crawler(crawler))
+            # une annonce écartée plus loin, ou refusée par la base, sera
+            # retéléchargée : l'index n'est tenu qu'une fois l'annonce enregistrée
+            if db_route(crawler) is None:
+                crawler.signals.connect(pipeline.item_scraped, signal=signals.item_scraped)
+            else:
+                crawler.signals.connect(pipeline.listings_stored, signal=listings_stored)
+        # lu par MemoryStatsExtension (stats memory/seen_*)
+        crawler._seen_digests = pipeline.urls_seen
+        return pipeline
 
     def process_item(self, item, spider):
-        url_hash = hashlib.md5(item["url"].encode()).hexdigest()
-        if url_hash in self.urls_seen:
+        digest = url_digest(item["url"])
+        if not self.urls_seen.add(digest):
             raise DropItem(f"URL déjà traitée : {item['url']}")
-        self.urls_seen.add(url_hash)
-        item["id"] = url_hash
+        item["id"] = digest.hex()
         return item
 
+    def item_scraped(self, item, response, spider):
+        self.seen_index.add_digest(bytes.fromhex(item["id"]), item.get("price"))
 
-class PostgreSQLPipeline:
-    def __init__(self, database, user, password, host, port):
-        self.db_params = dict(
-            database=database,
-            user=user,
-            password=password,
-            host=host,
-            port=port,
-        )
+    def listings_stored(self, listings):
+        for listing_id, price in listings:
+            self.seen_index.add_digest(bytes.fromhex(listing_id), price)
+
+
+class GeocodingPipeline:
+    """
+    Coordonnées des annonces qui n'en ont pas, depuis le gazetteer local
+    (scrapping_immobli.geocode) ; ``geo_level`` dit d'où elles viennent
+    (« gps » si le site les fournit, sinon quartier / commune / region).
+    """
+
+    def __init__(self, geocoder, stats=None):
+        self.geocoder = geocoder
+        self.stats = stats
 
     @classmethod
     def from_crawler(cls, crawler):
-        return cls(**crawler.settings["DATABASE"])
+        if not crawler.settings.getbool("GEOCODER_ENABLED"):
+            raise NotConfigured
+        return cls(Geocoder.from_crawler(crawler), crawler.stats)
 
-    def open_spider(self, spider):
-        self.conn = psycopg2.connect(**self.db_params)
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS properties(
-                    id VARCHAR(32) PRIMARY KEY,
-                    url TEXT UNIQUE,
-                    title TEXT,
-                    price INTEGER,
-                    surface_area REAL,
-                    bedrooms INTEGER,
-                    bathrooms INTEGER,
-                    city VARCHAR(100),
-                    description TEXT,
-                    source VARCHAR(50),
-                    latitude REAL,
-                    longitude REAL,
-                    scraped_at TIMESTAMP,
-                    statut VARCHAR(50),
-                    nb_annonces INTEGER,
-                    posted_time VARCHAR(100),
-                    adresse VARCHAR(100),
-                    property_type VARCHAR(100)
-                );
-            """)
-        self.conn.commit()
+    def process_item(self, item, spider):
+        if item.get("latitude") and item.get("longitude"):
+            level = "gps"
+        else:
+            place = self.geocoder.geocode(item)
+            level = place.level if place is not None else "miss"
+            if place is not None:
+                item["latitude"], item["longitude"] = place.latitude, place.longitude
+        item["geo_level"] = None if level == "miss" else level
+        if self.stats is not None:
+            self.stats.inc_value(f"geocode/{level}")
+        return item
 
-    def close_spider(self, spider):
-        if self.conn and not self.conn.closed:
-            try:
-                self.conn.close()
-                spider.logger.info("[POSTGRES] Connexion fermée proprement")
-            except Exception as exc:
-                spider.logger.warning("[POSTGRES] Erreur à la fermeture : %s", exc)
 
+class NearDuplicatePipeline:
+    """
+    ``cluster_id`` commun aux annonces quasi identiques, tous sites confondus
+    (MinHash/LSH, scrapping_immobli.neardup).
+    """
 
-    def process_item(self, item, spider):
-        spider.logger.info("[POSTGRES] INSERT %s", item["url"])
-
-        # Nettoyage
-        item["bedrooms"]     = clean_int(item.get("bedrooms"))
-        item["bathrooms"]    = clean_int(item.get("bathrooms"))
-        item["surface_area"] = clean_float(item.get("surface_area"))
-        item["posted_time"]  = clean_list(item.get("posted_time"))
-        item["adresse"]      = clean_list(item.get("adresse"))
-        item["property_type"]= clean_list(item.get("property_type"))
-        item["statut"]       = clean_list(item.get("statut"))
-        item["nb_annonces"]  = clean_list(item.get("nb_annonces"))
+    def __init__(self, index, stats=None):
+        self.index = index
+        self.stats = stats
 
-        try:
-            # Champs optionnels que le site peut ne pas avoir
-            optional_fields = [             
-                "status",            
-                "nb_annonces",
-            ]
-
-            for field in optional_fields:
-                value = item.get(field)
-                if isinstance(value, list):
-                    item[field] = value[0] 
-                
-            with self.conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO properties(
-                        id, url, title, price, city, description, source,
-                        latitude, longitude, scraped_at,
-                        bedrooms, bathrooms, surface_area,
-                        posted_time, adresse, property_type, statut, nb_annonces
-                    )
-                    VALUES (
-                        %(id)s, %(url)s, %(title)s, %(price)s,
-                        %(city)s, %(description)s, %(source)s,
-                        %(latitude)s, %(longitude)s, %(scraped_at)s,
-                        %(bedrooms)s, %(bathrooms)s, %(surface_area)s,
-                        %(posted_time)s, %(adresse)s, %(property_type)s,
-                        %(statut)s, %(nb_annonces)s
-                    )
-                    ON CONFLICT (url) DO UPDATE SET
-                        price = EXCLUDED.price,
-                        scraped_at = EXCLUDED.scraped_at;
-                """, dict(item))
-            self.conn.commit()
-            spider.logger.info("[POSTGRES] COMMIT %s", item["url"])
-        except Exception as exc:
-            self.conn.rollback()
-            spider.logger.error("[POSTGRES] ERREUR %s : %s", item["url"], exc)
-            raise
-        return item
-    
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("NEAR_DUP_ENABLED"):
+            raise NotConfigured
+        return cls(NearDuplicateIndex.from_crawler(crawler), crawler.stats)
 
+    def process_item(self, item, spider):
+        item["cluster_id"], matched = self.index.assign(item)
+        if self.stats is not None:
+            self.stats.inc_value("neardup/matched" if matched else "neardup/new_cluster")
+        return item
 
 
-class ExpatDakarPostgreSQLPipeline:
-    def __init__(self, database, user, password, host, port):
+class BulkPostgreSQLPipeline:
+    """
+    Base commune des pipelines PostgreSQL : vérification de la version du
+    schéma à l'ouverture (scrapping_immobli.migrations), puis écriture
+    groupée via BulkWriter (COPY + fusion ON CONFLICT) dans un pool de
+    threads, hors du reactor.
+
+    Avec ``fingerprint_column``, les empreintes de contenu de la table sont
+    préchargées à l'ouverture : un item identique à la ligne en base n'est
+    pas écrit du tout (stat ``postgres/<table>/writes_avoided``). Une
+    empreinte n'entre dans cette table qu'une fois sa ligne commitée.
+    """
+    table = None
+    columns = ()
+    log_tag = "POSTGRES"
+    fingerprint_column = "content_hash"
+
+    def __init__(self, database, user, password, host, port,
+                 batch_size=500, flush_interval=5.0, write_threads=2,
+                 max_pending_rows=5000, auto_migrate=True, stats=None, metrics=None,
+                 signals=None):
         self.db_params = dict(
             database=database,
             user=user,
@@ -160,159 +149,258 @@ class ExpatDakarPostgreSQLPipeline:
             host=host,
             port=port,
         )
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.write_threads = write_threads
+        self.max_pending_rows = max_pending_rows
+        self.auto_migrate = auto_migrate
+        self.stats = stats
+        self.metrics = metrics
+        self.signals = signals
+        self.pool = None
+        self.writer = None
+        self.fingerprints = None
+        self.fingerprint_fields = fingerprint_fields(self.columns)
+
+    @property
+    def fingerprint_table(self):
+        return self.table
+
+    @property
+    def update_columns(self):
+        # l'empreinte a changé : toute la fiche est réécrite
+        return tuple(col for col in self.columns if col not in ("id", "url"))
 
     @classmethod
     def from_crawler(cls, crawler):
-        return cls(**crawler.settings["DATABASE"])
+        settings = crawler.settings
+        return cls(
+            **settings.getdict("DATABASE"),
+            batch_size=settings.getint("DB_BATCH_SIZE", 500),
+            flush_interval=settings.getfloat("DB_FLUSH_INTERVAL", 5.0),
+            write_threads=settings.getint("DB_WRITE_THREADS", 2),
+            max_pending_rows=settings.getint("DB_MAX_PENDING_ROWS", 5000),
+            auto_migrate=settings.getbool("DB_AUTO_MIGRATE", True),
+            stats=crawler.stats,
+            metrics=registry_for(crawler),
+            signals=crawler.signals,
+        )
 
     def open_spider(self, spider):
-        self.conn = psycopg2.connect(**self.db_params)
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS expat_dakar_properties(
-                    id VARCHAR(32) PRIMARY KEY,
-                    url TEXT UNIQUE,
-                    title TEXT,
-                    price INTEGER,
-                    surface_area REAL,
-                    bedrooms INTEGER,
-                    bathrooms INTEGER,
-                    city VARCHAR(100),
-                    region VARCHAR(100),
-                    description TEXT,
-                    source VARCHAR(50),
-                    scraped_at TIMESTAMP,
-                    statut VARCHAR(50),
-                    posted_time VARCHAR(100),
-                    adresse VARCHAR(100),
-                    property_type VARCHAR(100),
-                    member_since VARCHAR(50)
-                );
-            """)
-        self.conn.commit()
+        self.pool = ConnectionPool.acquire(self.db_params, threads=self.write_threads)
+        with self.pool.connection() as conn:
+            ensure_schema(conn, self.auto_migrate,
+                          log=lambda msg: spider.logger.info("[%s] %s", self.log_tag, msg))
+            if self.fingerprint_column:
+                self.fingerprints = FingerprintMap.load(conn, self.fingerprint_table,
+                                                        self.fingerprint_column)
+        if self.fingerprints is not None:
+            spider.logger.info("[%s] %d empreintes préchargées (%d Ko)", self.log_tag,
+                               len(self.fingerprints), self.fingerprints.nbytes // 1024)
+        self.writer = self.create_writer(
+            batch_size=self.batch_size,
+            flush_interval=self.flush_interval,
+            max_pending_rows=self.max_pending_rows,
+            logger=spider.logger,
+            stats=self.stats,
+            metrics=self.metrics,
+            tag=self.log_tag,
+        )
+        self.writer.start()
 
-    def close_spider(self, spider):
-        if self.conn and not self.conn.closed:
-            try:
-                self.conn.close()
-                spider.logger.info("[POSTGRES-EXPAT] Connexion fermée proprement")
-            except Exception as exc:
-                spider.logger.warning("[POSTGRES-EXPAT] Erreur à la fermeture : %s", exc)
+    def create_writer(self, **kwargs):
+        return BulkWriter(self.pool, self.table, self.columns,
+                          update_columns=self.update_columns,
+                          unchanged_column=self.fingerprint_column,
+                          on_written=self._stored, **kwargs)
 
-    def process_item(self, item, spider):
-        spider.logger.info("[POSTGRES-EXPAT] INSERT %s", item["url"])
-
-        # Nettoyage
-        item["url"]          = clean_list(item.get("url"))
-        item["bedrooms"]      = clean_int(item.get("bedrooms"))
-        item["bathrooms"]     = clean_int(item.get("bathrooms"))
-        item["surface_area"]  = clean_float(item.get("surface_area"))
-        item["posted_time"]   = clean_list(item.get("posted_time"))
-        item["adresse"]       = clean_list(item.get("adresse"))
-        item["property_type"] = clean_list(item.get("property_type"))
-        item["statut"]        = clean_list(item.get("statut"))
-        item["member_since"]  = clean_list(item.get("member_since"))
+    def close_spider(self, spider):
+        if self.writer is None:
+            return None
+        d = self.writer.close()
+        d.addBoth(self._close_pool, spider)
+        return d
 
+    def _close_pool(self, result, spider):
         try:
-            with self.conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO expat_dakar_properties(
-                        id, url, title, price, city, region, description, source,
-                        scraped_at, bedrooms, bathrooms, surface_area,
-                        posted_time, adresse, property_type, statut, member_since
-                    )
-                    VALUES (
-                        %(id)s, %(url)s, %(title)s, %(price)s,
-                        %(city)s, %(region)s, %(description)s, %(source)s,
-                        %(scraped_at)s, %(bedrooms)s, %(bathrooms)s, %(surface_area)s,
-                        %(posted_time)s, %(adresse)s, %(property_type)s,
-                        %(statut)s, %(member_since)s
-                    )
-                    ON CONFLICT (url) DO UPDATE SET
-                        price = EXCLUDED.price,
-                        scraped_at = EXCLUDED.scraped_at;
-                """, dict(item))
-            self.conn.commit()
-            spider.logger.info("[POSTGRES-EXPAT] COMMIT %s", item["url"])
+            if self.pool.release():
+                spider.logger.info("[%s] Connexion fermée proprement", self.log_tag)
         except Exception as exc:
-            self.conn.rollback()
-            spider.logger.error("[POSTGRES-EXPAT] ERREUR %s : %s", item["url"], exc)
-            raise
+            spider.logger.warning("[%s] Erreur à la fermeture : %s", self.log_tag, exc)
+
+    def process_item(self, item, spider):
+        # valeurs déjà normalisées à l'extraction (scrapping_immobli.normalize)
+        if self.fingerprints is not None:
+            fingerprint = content_fingerprint(item, self.fingerprint_fields)
+            item[self.fingerprint_column] = fingerprint
+            if self.fingerprints.get(item["id"]) == fingerprint:
+                if self.stats is not None:
+                    self.stats.inc_value(f"postgres/{self.table}/writes_avoided")
+                self.item_unchanged(item)
+                return item
+        waiter = self.writer.add(item)
+        if waiter is not None:
+            # file d'écriture pleine : l'item attend que la base rattrape
+            waiter.addCallback(lambda _: item)
+            return waiter
         return item
-    
+
+    def item_unchanged(self, item):
+        """Item identique à la ligne en base : rien à écrire."""
+
+    def _stored(self, rows):
+        # empreinte retenue une fois la ligne commitée : une ligne refusée
+        # (lot perdu, repli ligne à ligne) sera réécrite au prochain passage
+        if self.fingerprints is None:
+            return
+        id_index = self.writer.columns.index("id")
+        fingerprint_index = self.writer.columns.index(self.fingerprint_column)
+        for row in rows:
+            self.fingerprints.set(row[id_index], row[fingerprint_index])
+
+
+class ListingsPipeline(BulkPostgreSQLPipeline):
+    """
+    Base des pipelines de site : table ``listings`` (scrapping_immobli.listings),
+    partition ``source``. ``columns`` sont les champs de l'item du site ; ceux
+    qui ne sont pas des colonnes de ``listings`` vont dans ``extras``. Les
+    empreintes ne sont préchargées que depuis la partition du site.
+    """
+    table = LISTINGS_TABLE
+    source = None
+
+    @property
+    def fingerprint_table(self):
+        return partition_name(self.source)
+
+    def create_writer(self, **kwargs):
+        return ListingWriter(self.pool, self.source, self.columns,
+                             unchanged_column=self.fingerprint_column,
+                             on_written=self._stored, **kwargs)
+
+    def item_unchanged(self, item):
+        self._announce([(item["id"], item.get("price"))])
+
+    def _stored(self, rows):
+        super()._stored(rows)
+        id_index = self.writer.columns.index("id")
+        price_index = self.writer.columns.index("price")
+        self._announce([(row[id_index], row[price_index]) for row in rows])
+
+    def _announce(self, listings):
+        # DuplicatesPipeline tient l'index des annonces vues (SEEN_INDEX_ENABLED)
+        if listings and self.signals is not None:
+            self.signals.send_catch_log(listings_stored, listings=listings)
+
+
+class PostgreSQLPipeline(ListingsPipeline):
+    source = "coinafrique_html"
+    columns = (
+        "id", "url", "title", "price", "city", "description", "source",
+        "latitude", "longitude", "scraped_at",
+        "bedrooms", "bathrooms", "surface_area",
+        "posted_time", "adresse", "property_type", "statut", "nb_annonces",
+        "content_hash", "cluster_id", "geo_level",
+    )
+    log_tag = "POSTGRES"
+
+
+class ExpatDakarPostgreSQLPipeline(ListingsPipeline):
+    source = "expat_dakar"
+    columns = (
+        "id", "url", "title", "price", "city", "region", "description", "source",
+        "scraped_at", "bedrooms", "bathrooms", "surface_area",
+        "posted_time", "adresse", "property_type", "statut", "member_since",
+        "content_hash", "cluster_id", "latitude", "longitude", "geo_level",
+    )
+    log_tag = "POSTGRES-EXPAT"
+
+
+class LogerDakarPostgreSQLPipeline(ListingsPipeline):
+    source = "loger_dakar"
+    columns = (
+        "id", "url", "title", "price", "city", "region", "description", "source",
+        "scraped_at", "bedrooms", "bathrooms", "surface_area",
+        "posted_time", "adresse", "property_type", "statut", "listing_id",
+        "content_hash", "cluster_id", "latitude", "longitude", "geo_level",
+    )
+    log_tag = "POSTGRES-LOGER"
+
+
+class PriceHistoryPipeline(BulkPostgreSQLPipeline):
+    """
+    Historique des prix (scrapping_immobli.history), pour tous les sites
+    écrits en base (DB_PIPELINE_ROUTES) :
+    une observation n'est ajoutée que si le prix ou le statut a changé.
+    """
+    table = "listing_observations"
+    log_tag = "HISTORY"
+    fingerprint_column = None  # chaque passage met à jour listing_state.last_seen
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        # spider sans route : pas de base, pas plus que pour le pipeline du site
+        if not crawler.settings.getbool("PRICE_HISTORY_ENABLED") or db_route(crawler) is None:
+            raise NotConfigured
+        return super().from_crawler(crawler)
+
+    def create_writer(self, **kwargs):
+        return HistoryWriter(self.pool, **kwargs)
 
 
-class LogerDakarPostgreSQLPipeline:
-    def __init__(self, database, user, password, host, port):
-        self.db_params = dict(database=database, user=user, password=password, host=host, port=port)
+class MarketAggregatesPipeline(BulkPostgreSQLPipeline):
+    """
+    Agrégats de marché (scrapping_immobli.aggregates), pour tous les sites
+    écrits en base (DB_PIPELINE_ROUTES) :
+    chaque annonce compte une fois par mois, agrégée à l'écriture.
+    """
+    table = "market_listings"
+    log_tag = "AGGREGATES"
+    fingerprint_column = None  # une annonce inchangée compte aussi pour le mois en cours
 
     @classmethod
     def from_crawler(cls, crawler):
-        return cls(**crawler.settings["DATABASE"])
+        # spider sans route : pas de base, pas plus que pour le pipeline du site
+        if not crawler.settings.getbool("MARKET_AGGREGATES_ENABLED") or db_route(crawler) is None:
+            raise NotConfigured
+        return super().from_crawler(crawler)
 
-    def open_spider(self, spider):
-        self.conn = psycopg2.connect(**self.db_params)
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS loger_dakar_properties(
-                    id VARCHAR(32) PRIMARY KEY,
-                    url TEXT UNIQUE,
-                    title TEXT,
-                    price INTEGER,
-                    surface_area REAL,
-                    bedrooms INTEGER,
-                    bathrooms INTEGER,
-                    city VARCHAR(100),
-                    region VARCHAR(100),
-                    description TEXT,
-                    source VARCHAR(50),
-                    scraped_at TIMESTAMP,
-                    statut VARCHAR(50),
-                    posted_time VARCHAR(100),
-                    adresse VARCHAR(100),
-                    property_type VARCHAR(100),
-                    listing_id VARCHAR(50)
-                );
-            """)
-        self.conn.commit()
+    def create_writer(self, **kwargs):
+        return AggregateWriter(self.pool, **kwargs)
 
-    def close_spider(self, spider):
-        if self.conn and not self.conn.closed:
-            self.conn.close()
 
-    def process_item(self, item, spider):
-        item["url"]          = clean_list(item.get("url"))
-        item["bedrooms"]     = clean_int(item.get("bedrooms"))
-        item["bathrooms"]    = clean_int(item.get("bathrooms"))
-        item["surface_area"] = clean_float(item.get("surface_area"))
-        item["posted_time"]  = clean_list(item.get("posted_time"))
-        item["adresse"]      = clean_list(item.get("adresse"))
-        item["property_type"]= clean_list(item.get("property_type"))
-        item["statut"]       = clean_list(item.get("statut"))
-        item["listing_id"]   = clean_list(item.get("listing_id"))
+class SearchIndexPipeline(BulkPostgreSQLPipeline):
+    """
+    Index plein texte ``listing_search`` (scrapping_immobli.search), pour
+    tous les sites écrits en base (DB_PIPELINE_ROUTES) ; une annonce d'empreinte inchangée n'est pas réanalysée.
+    """
+    table = "listing_search"
+    columns = SEARCH_COLUMNS
+    log_tag = "SEARCH"
+    fingerprint_column = None  # content_hash vient du pipeline du site
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        # spider sans route : pas de base, pas plus que pour le pipeline du site
+        if not crawler.settings.getbool("SEARCH_INDEX_ENABLED") or db_route(crawler) is None:
+            raise NotConfigured
+        return super().from_crawler(crawler)
+
+    def create_writer(self, **kwargs):
+        return SearchWriter(self.pool, **kwargs)
+
+
+class SitePostgreSQLPipeline:
+    """
+    Point d'entrée unique dans ITEM_PIPELINES : instancie le pipeline
+    PostgreSQL du site selon DB_PIPELINE_ROUTES (nom du spider -> classe).
+    Un spider sans route n'écrit pas en base (pipeline désactivé).
+    """
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        route = db_route(crawler)
+        if route is None:
+            raise NotConfigured
+        return load_object(route).from_crawler(crawler)
 
-        try:
-            with self.conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO loger_dakar_properties(
-                        id, url, title, price, city, region, description, source,
-                        scraped_at, bedrooms, bathrooms, surface_area,
-                        posted_time, adresse, property_type, statut, listing_id
-                    )
-                    VALUES (
-                        %(id)s, %(url)s, %(title)s, %(price)s,
-                        %(city)s, %(region)s, %(description)s, %(source)s,
-                        %(scraped_at)s, %(bedrooms)s, %(bathrooms)s, %(surface_area)s,
-                        %(posted_time)s, %(adresse)s, %(property_type)s,
-                        %(statut)s, %(listing_id)s
-                    )
-                    ON CONFLICT (url) DO UPDATE SET
-                        price = EXCLUDED.price,
-                        scraped_at = EXCLUDED.scraped_at;
-                """, dict(item))
-            self.conn.commit()
-        except Exception as exc:
-            self.conn.rollback()
-            spider.logger.error("[POSTGRES-LOGER] ERREUR %s : %s", item["url"], exc)
-            raise
-        return item
\ No newline at end of file
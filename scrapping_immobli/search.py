@@ -0,0 +1,249 @@
+"""
+Recherche plein texte dans les annonces des trois sites.
+
+- ``listing_search`` : une ligne par annonce (tous sites), avec un
+  ``tsvector`` pondéré — titre (A), description (B), ville et adresse (C) —
+  indexé en GIN ; tenue à jour par SearchIndexPipeline à chaque lot écrit,
+  seules les annonces nouvelles ou modifiées (``content_hash``) sont
+  réanalysées ;
+- configuration ``french`` (racinisation : « piscines » trouve
+  « piscine ») ; les accents sont retirés côté Python, à l'indexation comme
+  à la requête (« meuble » trouve « meublé ») : pas besoin de l'extension
+  ``unaccent`` ;
+- les niveaux « R+2 », « R + 3 » deviennent un seul mot (``r2``, ``r3``),
+  que le parser PostgreSQL couperait sinon en « r » et « +2 » ;
+- requêtes au format ``websearch_to_tsquery`` : ``piscine "vue mer" -terrain``,
+  ``villa or maison`` ; classement ``ts_rank_cd`` ; filtres prix, ville, type,
+  statut et source.
+"""
+import re
+import unicodedata
+
+from scrapping_immobli.db import BulkWriter, copy_rows
+
+TS_CONFIG = "french"
+
+SEARCH_DDL = """
+    CREATE TABLE IF NOT EXISTS listing_search(
+        id VARCHAR(32) PRIMARY KEY,
+        source VARCHAR(50),
+        url TEXT,
+        title TEXT,
+        price INTEGER,
+        surface_area REAL,
+        bedrooms INTEGER,
+        city VARCHAR(100),
+        city_key VARCHAR(100),
+        property_type VARCHAR(100),
+        statut VARCHAR(50),
+        content_hash BIGINT,
+        scraped_at TIMESTAMP,
+        document TSVECTOR NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS listing_search_document ON listing_search USING GIN (document);
+    CREATE INDEX IF NOT EXISTS listing_search_city ON listing_search (city_key text_pattern_ops, price);
+    CREATE INDEX IF NOT EXISTS listing_search_price ON listing_search (price);
+    CREATE INDEX IF NOT EXISTS listing_search_recent ON listing_search (scraped_at DESC NULLS LAST);
+"""
+
+# colonnes recopiées telles quelles ; le texte à analyser arrive à part
+STORED_COLUMNS = (
+    "id", "source", "url", "title", "price", "surface_area", "bedrooms",
+    "city", "city_key", "property_type", "statut", "content_hash", "scraped_at",
+)
+TEXT_COLUMNS = ("search_title", "search_body", "search_place")
+SEARCH_COLUMNS = STORED_COLUMNS + TEXT_COLUMNS
+
+_LEVELS = re.compile(r"\b([rR])\s*\+\s*(\d)\b")
+_WORDS = re.compile(r"[a-z0-9]+")
+
+
+def fold(text):
+    """Minuscules, sans accents, « R+2 » -> « r2 »."""
+    if not text:
+        return ""
+    text = _LEVELS.sub(r"\1\2", str(text)).lower().replace("œ", "oe")
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def city_key(city):
+    """« Sacré-Cœur, Dakar » -> « sacre coeur dakar » (filtre par préfixe)."""
+    return " ".join(_WORDS.findall(fold(city))) or None
+
+
+def search_row(item):
+    """Ligne de ``SEARCH_COLUMNS`` depuis un item ou une ligne de ``listings``."""
+    row = {col: item.get(col) for col in STORED_COLUMNS}
+    row["city_key"] = city_key(item.get("city"))
+    row["search_title"] = fold(item.get("title"))
+    row["search_body"] = fold(item.get("description"))
+    row["search_place"] = " ".join(
+        part for part in (fold(item.get("city")), fold(item.get("adresse"))) if part
+    )
+    return row
+
+
+def _document(prefix=""):
+    return (
+        f"setweight(to_tsvector('{TS_CONFIG}', {prefix}search_title), 'A')"
+        f" || setweight(to_tsvector('{TS_CONFIG}', {prefix}search_body), 'B')"
+        f" || setweight(to_tsvector('{TS_CONFIG}', {prefix}search_place), 'C')"
+    )
+
+
+def merge_sql(source):
+    """
+    Fusion des lignes de ``source`` (colonnes SEARCH_COLUMNS) : les
+    annonces dont ``content_hash`` est inchangé ne sont ni réanalysées ni
+    réécrites.
+    """
+    stored = ", ".join(STORED_COLUMNS)
+    updates = ", ".join(f"{col} = EXCLUDED.{col}" for col in STORED_COLUMNS[1:])
+    return f"""
+        INSERT INTO listing_search AS s ({stored}, document)
+        SELECT {", ".join(f"b.{col}" for col in STORED_COLUMNS)}, {_document("b.")}
+        FROM (
+            SELECT DISTINCT ON (id) * FROM {source} ORDER BY id, scraped_at DESC
+        ) b
+        WHERE b.content_hash IS NULL OR NOT EXISTS (
+            SELECT 1 FROM listing_search s2
+            WHERE s2.id = b.id AND s2.content_hash = b.content_hash
+        )
+        ON CONFLICT (id) DO UPDATE SET {updates}, document = EXCLUDED.document;
+    """
+
+
+def staging_sql(name):
+    return f"""
+        CREATE TEMP TABLE IF NOT EXISTS {name} ON COMMIT DELETE ROWS AS
+        SELECT {", ".join(STORED_COLUMNS)}, ''::text AS search_title,
+               ''::text AS search_body, ''::text AS search_place
+        FROM listing_search WITH NO DATA;
+    """
+
+
+def create_tables(conn):
+    with conn.cursor() as cur:
+        cur.execute(SEARCH_DDL)
+    conn.commit()
+
+
+# ----------------------------------------------------------------------
+# Requêtes
+# ----------------------------------------------------------------------
+def search(conn, text, city=None, property_type=None, statut=None, source=None,
+           min_price=None, max_price=None, limit=20, window=1000):
+    """
+    Annonces correspondant à ``text`` (syntaxe websearch), les plus
+    pertinentes d'abord : [(rang, id, source, titre, prix, ville, url)].
+
+    Seules les ``window`` correspondances les plus récentes sont classées :
+    un mot fréquent (« piscine ») ne fait pas calculer ts_rank_cd sur des
+    dizaines de milliers de lignes. PostgreSQL choisit le chemin : index GIN
+    pour un mot rare, parcours de ``listing_search_recent`` pour un mot
+    fréquent.
+    """
+    where = [f"document @@ websearch_to_tsquery('{TS_CONFIG}', %(q)s)"]
+    params = {"q": fold(text), "limit": limit, "window": window}
+    if city:
+        # « Fann » trouve « fann » et « fann dakar » (coinafrique), pas « fannhock »
+        where.append("(city_key = %(city)s OR city_key LIKE %(city_prefix)s)")
+        params["city"] = city_key(city)
+        params["city_prefix"] = f"{params['city']} %"
+    if property_type:
+        where.append("lower(property_type) = lower(%(type)s)")
+        params["type"] = property_type
+    if statut:
+        where.append("lower(statut) = lower(%(statut)s)")
+        params["statut"] = statut
+    if source:
+        where.append("source = %(source)s")
+        params["source"] = source
+    if min_price is not None:
+        where.append("price >= %(min_price)s")
+        params["min_price"] = min_price
+    if max_price is not None:
+        where.append("price <= %(max_price)s")
+        params["max_price"] = max_price
+
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT ts_rank_cd(document, websearch_to_tsquery('{TS_CONFIG}', %(q)s)) AS rank,
+                   id, source, title, price, city, url
+            FROM (
+                SELECT * FROM listing_search
+                WHERE {" AND ".join(where)}
+                ORDER BY scraped_at DESC NULLS LAST
+                LIMIT %(window)s
+            ) recent
+            ORDER BY rank DESC, scraped_at DESC NULLS LAST
+            LIMIT %(limit)s
+        """, params)
+        rows = cur.fetchall()
+    conn.commit()
+    return rows
+
+
+# ----------------------------------------------------------------------
+# Indexation
+# ----------------------------------------------------------------------
+class SearchWriter(BulkWriter):
+    """BulkWriter pour ``listing_search`` : les items sont repliés (fold) à l'ajout."""
+
+    def __init__(self, pool, **kwargs):
+        super().__init__(pool, "listing_search", SEARCH_COLUMNS, conflict_column="id", **kwargs)
+
+    def add(self, row):
+        return super().add(search_row(row))
+
+    def _staging_sql(self):
+        return staging_sql(self.staging)
+
+    def _merge_sql(self):
+        return merge_sql(self.staging)
+
+    def _upsert_sql(self):
+        placeholders = ", ".join(["%s"] * len(self.columns))
+        return merge_sql(f"(VALUES ({placeholders})) AS v ({self._column_list})")
+
+
+def reindex(conn, tables, chunk_rows=5000, log=print):
+    """
+    Indexe les tables d'annonces (curseur serveur, lots de ``chunk_rows``) ;
+    les annonces déjà indexées avec la même empreinte sont sautées.
+    """
+    staging = "_search_reindex"
+    with conn.cursor() as cur:
+        cur.execute(staging_sql(staging))
+    conn.commit()
+    total = 0
+    for table in tables:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass(%s)", (table,))
+            exists = cur.fetchone()[0] is not None
+        conn.commit()
+        if not exists:
+            continue
+        # WITH HOLD : le curseur de lecture survit au COMMIT de chaque lot
+        read = conn.cursor(name=f"reindex_{table}", withhold=True)
+        read.itersize = chunk_rows
+        read.execute(f"SELECT * FROM {table}")
+        count = 0
+        while True:
+            rows = read.fetchmany(chunk_rows)
+            if not rows:
+                break
+            columns = [desc[0] for desc in read.description]
+            batch = [search_row(dict(zip(columns, row))) for row in rows]
+            with conn.cursor() as cur:
+                copy_rows(cur, staging, SEARCH_COLUMNS,
+                          [tuple(row[col] for col in SEARCH_COLUMNS) for row in batch])
+                cur.execute(merge_sql(staging))
+            conn.commit()
+            count += len(rows)
+        read.close()
+        conn.commit()
+        total += count
+        log(f"{table} : {count} annonces parcourues")
+    return total
@@ -0,0 +1,283 @@
+"""
+Index persistant des annonces déjà vues, d'un crawl à l'autre.
+
+- un filtre de Bloom en mémoire répond « jamais vue » sans accès disque ;
+- un magasin exact SQLite (``.scrapy/seen_urls.sqlite``) tranche les
+  positifs du Bloom et survit entre deux runs ;
+- au démarrage, l'index peut être réchauffé depuis les colonnes ``id`` des
+  tables PostgreSQL (``id`` = MD5 de l'URL, comme dans DuplicatesPipeline) ;
+- le dernier prix connu de chaque annonce est gardé à côté de l'empreinte,
+  pour que le mode incrémental repère les prix modifiés sur les listings.
+"""
+import hashlib
+import math
+import os
+import sqlite3
+
+from scrapy import signals
+from scrapy.utils.project import data_path
+
+
+def url_digest(url):
+    """Empreinte binaire (16 octets) d'une URL : MD5, comme les ``id`` en base."""
+    return hashlib.md5(url.encode()).digest()
+
+
+class BloomFilter:
+    """Filtre de Bloom sur des empreintes MD5 (double hachage sur le digest)."""
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(capacity, 1)
+        self.size = int(-capacity * math.log(error_rate) / (math.log(2) ** 2)) or 8
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, digest):
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, digest):
+        for pos in self._positions(digest):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, digest):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(digest))
+
+
+class DigestSet:
+    """
+    Ensemble d'empreintes de 16 octets à adressage ouvert, rangées bout à
+    bout dans un ``bytearray`` (sondage linéaire, taux de remplissage
+    maximal 2/3) : 24 à 48 octets par entrée, contre ~115 pour un ``set``
+    de chaînes hexadécimales de 32 caractères.
+    """
+
+    SLOT = 16
+    EMPTY = bytes(SLOT)
+
+    def __init__(self, capacity=1024):
+        slots = 16
+        while slots * 2 < capacity * 3:
+            slots *= 2
+        self._allocate(slots)
+        self.count = 0
+        # l'empreinte nulle sert de case vide : gardée à part
+        self.has_empty = False
+
+    def _allocate(self, slots):
+        self.mask = slots - 1
+        self.table = bytearray(slots * self.SLOT)
+
+    def _slot(self, digest):
+        """Position (en octets) de ``digest``, ou de la case vide où l'insérer."""
+        table, mask, size = self.table, self.mask, self.SLOT
+        i = int.from_bytes(digest[:8], "little") & mask
+        while True:
+            start = i * size
+            current = table[start:start + size]
+            if current == digest or current == self.EMPTY:
+                return start, current == digest
+            i = (i + 1) & mask
+
+    def __contains__(self, digest):
+        if digest == self.EMPTY:
+            return self.has_empty
+        return self._slot(digest)[1]
+
+    def add(self, digest):
+        """Ajoute ``digest`` ; True s'il n'y était pas encore."""
+        if len(digest) != self.SLOT:
+            raise ValueError(f"empreinte de {len(digest)} octets, {self.SLOT} attendus")
+        if digest == self.EMPTY:
+            added, self.has_empty = not self.has_empty, True
+            return added
+        start, found = self._slot(digest)
+        if found:
+            return False
+        self.table[start:start + self.SLOT] = digest
+        self.count += 1
+        if self.count * 3 > (self.mask + 1) * 2:
+            self._grow()
+        return True
+
+    def _grow(self):
+        old, size = self.table, self.SLOT
+        self._allocate((self.mask + 1) * 2)
+        for start in range(0, len(old), size):
+            digest = bytes(old[start:start + size])
+            if digest != self.EMPTY:
+                slot, _ = self._slot(digest)
+                self.table[slot:slot + size] = digest
+
+    def __len__(self):
+        return self.count + self.has_empty
+
+    @property
+    def nbytes(self):
+        return len(self.table)
+
+
+class SeenIndex:
+    """
+    Ensemble persistant d'empreintes d'URL. Les ajouts sont mis en tampon et
+    écrits par lots de ``commit_every`` (et à la fermeture).
+    """
+
+    _shared = {}
+
+    def __init__(self, path, capacity=1_000_000, error_rate=0.001, commit_every=500):
+        self.path = path
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.commit_every = commit_every
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.conn = None
+        self.pending = {}
+        self.users = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """
+        Une seule instance par fichier et par processus, partagée par pipeline
+        et middleware de chaque crawler (plusieurs spiders dans le même
+        reactor, cf. ``scrapy crawlall``).
+        """
+        index = getattr(crawler, "_seen_index", None)
+        if index is not None:
+            return index
+        settings = crawler.settings
+        path = data_path(settings.get("SEEN_INDEX_PATH", "seen_urls.sqlite"))
+        index = cls._shared.get(path)
+        if index is None:
+            index = cls._shared[path] = cls(
+                path,
+                capacity=settings.getint("SEEN_INDEX_CAPACITY", 1_000_000),
+                error_rate=settings.getfloat("SEEN_INDEX_ERROR_RATE", 0.001),
+            )
+            index.warm_tables = settings.getlist("SEEN_INDEX_WARM_TABLES")
+            index.db_params = settings.getdict("DATABASE")
+        crawler.signals.connect(index.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(index.spider_closed, signal=signals.spider_closed)
+        crawler._seen_index = index
+        return index
+
+    # ------------------------------------------------------------------
+    # Cycle de vie
+    # ------------------------------------------------------------------
+    def open(self):
+        if self.conn is not None:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS seen (digest BLOB PRIMARY KEY, price INTEGER)")
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(seen)")}
+        if "price" not in columns:
+            self.conn.execute("ALTER TABLE seen ADD COLUMN price INTEGER")
+        for (digest,) in self.conn.execute("SELECT digest FROM seen"):
+            self.bloom.add(digest)
+
+    def close(self):
+        if self.conn is None:
+            return
+        self.sync()
+        self.conn.close()
+        self.conn = None
+
+    def spider_opened(self, spider):
+        self.users += 1
+        if self.conn is not None:
+            return
+        self.open()
+        if getattr(self, "warm_tables", None):
+            count = self.warm_from_db(self.db_params, self.warm_tables, spider.logger)
+            spider.logger.info("[SEEN] %d annonces connues chargées depuis PostgreSQL", count)
+        spider.logger.info("[SEEN] index ouvert : %d annonces connues", len(self))
+
+    def spider_closed(self, spider):
+        self.users -= 1
+        if self.users > 0:
+            self.sync()
+            return
+        self._shared.pop(self.path, None)
+        self.close()
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+    def __contains__(self, url):
+        return self.contains_digest(url_digest(url))
+
+    def contains_digest(self, digest):
+        if digest not in self.bloom:
+            return False
+        if digest in self.pending:
+            return True
+        row = self.conn.execute("SELECT 1 FROM seen WHERE digest = ?", (digest,)).fetchone()
+        return row is not None
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM seen").fetchone()[0] + len(self.pending)
+
+    def price_of(self, url):
+        """Dernier prix enregistré pour l'URL (None si inconnue ou sans prix)."""
+        digest = url_digest(url)
+        if digest not in self.bloom:
+            return None
+        if digest in self.pending:
+            return self.pending[digest]
+        row = self.conn.execute("SELECT price FROM seen WHERE digest = ?", (digest,)).fetchone()
+        return row[0] if row else None
+
+    def add(self, url, price=None):
+        self.add_digest(url_digest(url), price)
+
+    def add_digest(self, digest, price=None):
+        self.bloom.add(digest)
+        self.pending[digest] = price
+        if len(self.pending) >= self.commit_every:
+            self.sync()
+
+    def sync(self):
+        if not self.pending:
+            return
+        self.conn.executemany(
+            """
+            INSERT INTO seen (digest, price) VALUES (?, ?)
+            ON CONFLICT (digest) DO UPDATE SET price = COALESCE(excluded.price, seen.price)
+            """,
+            list(self.pending.items()),
+        )
+        self.conn.commit()
+        self.pending = {}
+
+    def warm_from_db(self, db_params, tables, logger=None):
+        """Charge les ``id`` (MD5 hex des URL) des tables PostgreSQL existantes."""
+        import psycopg2
+
+        count = 0
+        try:
+            conn = psycopg2.connect(**db_params)
+        except psycopg2.Error as exc:
+            if logger is not None:
+                logger.warning("[SEEN] réchauffage impossible : %s", exc)
+            return 0
+        try:
+            for table in tables:
+                try:
+                    with conn.cursor(name=f"seen_{table}") as cur:
+                        cur.itersize = 10_000
+                        cur.execute(f"SELECT id, price FROM {table}")
+                        for hex_id, price in cur:
+                            self.add_digest(bytes.fromhex(hex_id), price)
+                            count += 1
+                    conn.commit()
+                except psycopg2.Error as exc:
+                    conn.rollback()
+                    if logger is not None:
+                        logger.debug("[SEEN] table %s ignorée : %s", table, exc)
+        finally:
+            conn.close()
+        self.sync()
+        return count
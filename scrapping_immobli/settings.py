@@ -5,13 +5,14 @@ BOT_NAME = "scrapping_immobli"
 
 SPIDER_MODULES = ["scrapping_immobli.spiders"]
 NEWSPIDER_MODULE = "scrapping_immobli.spiders"
+COMMANDS_MODULE = "scrapping_immobli.commands"
 
 ROBOTSTXT_OBEY = False
 CONCURRENT_REQUESTS = 16
-DOWNLOAD_DELAY = 1
-AUTOTHROTTLE_ENABLED = True
-AUTOTHROTTLE_TARGET_CONCURRENCY = 8
+DOWNLOAD_DELAY = 1                     # délai de départ d'un domaine encore inconnu
+AUTOTHROTTLE_ENABLED = False           # remplacé par AdaptiveThrottleMiddleware
 FEED_EXPORT_ENCODING = "utf-8"
+FEED_EXPORTERS = {"parquet": "scrapping_immobli.export.ParquetItemExporter"}  # pyarrow requis
 REQUEST_FINGERPRINTER_IMPLEMENTATION = "2.7"
 TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
 TELNETCONSOLE_ENABLED = False
@@ -24,13 +25,67 @@ USER_AGENT_LIST = [
 
 DOWNLOADER_MIDDLEWARES = {
     "scrapping_immobli.middlewares.RotateUserAgentMiddleware": 400,
+    "scrapping_immobli.middlewares.DetailHttpCacheMiddleware": 410,
+    "scrapy.downloadermiddlewares.httpcache.HttpCacheMiddleware": None,
+    "scrapping_immobli.middlewares.AdaptiveThrottleMiddleware": 900,
 }
 
+# --- Concurrence / délai adaptatifs par domaine (AIMD) ---
+ADAPTIVE_THROTTLE_ENABLED = True
+ADAPTIVE_THROTTLE_STATE = "throttle.json"    # relatif à .scrapy/ ; limites apprises
+ADAPTIVE_THROTTLE_TARGET_LATENCY = 2.0       # s ; au-delà, la concurrence baisse
+ADAPTIVE_THROTTLE_MIN_CONCURRENCY = 1
+ADAPTIVE_THROTTLE_MAX_CONCURRENCY = 16
+ADAPTIVE_THROTTLE_MIN_DELAY = 0.25
+ADAPTIVE_THROTTLE_MAX_DELAY = 60.0
+ADAPTIVE_THROTTLE_DECREASE_FACTOR = 0.5      # sur 429 / 503 / 5xx / timeout
+
+# --- Cache HTTP des fiches (revalidation ETag / Last-Modified) ---
+HTTPCACHE_ENABLED = True
+HTTPCACHE_POLICY = "scrapping_immobli.httpcache.DetailPagePolicy"
+HTTPCACHE_STORAGE = "scrapping_immobli.httpcache.CompressedSqliteCacheStorage"
+HTTPCACHE_DIR = "httpcache"
+HTTPCACHE_CALLBACKS = ["parse_detail"]     # seules les fiches sont mises en cache
+HTTPCACHE_FALLBACK_TTL = 3 * 24 * 3600     # fraîcheur sans ETag/Last-Modified
+HTTPCACHE_REVALIDATE_AFTER = 0             # avec validateurs : requête conditionnelle à chaque crawl
+HTTPCACHE_EXPIRATION_SECS = 30 * 24 * 3600 # âge max. d'une entrée
+HTTPCACHE_MAX_SIZE_MB = 512
+# ces sites renvoient souvent « no-cache, private, max-age=0 » : ignoré
+HTTPCACHE_IGNORE_RESPONSE_CACHE_CONTROLS = ["no-cache", "private", "max-age", "must-revalidate"]
+
+SPIDER_MIDDLEWARES = {
+    "scrapping_immobli.freshness.FreshnessMiddleware": 550,
+    "scrapping_immobli.middlewares.SeenUrlsMiddleware": 600,
+    "scrapping_immobli.metrics.CallbackMetricsMiddleware": 950,
+}
+
+# --- Métriques (Prometheus + JSON, scrapping_immobli.metrics) ---
+EXTENSIONS = {
+    "scrapping_immobli.metrics.MetricsExtension": 500,
+    "scrapping_immobli.memory.MemoryStatsExtension": 510,
+}
+ITEM_PROCESSOR = "scrapping_immobli.metrics.MetricsItemPipelineManager"
+METRICS_ENABLED = True
+METRICS_PORT = [9410, 9430]           # http://127.0.0.1:<port>/metrics ; [] = pas de serveur
+METRICS_HOST = "127.0.0.1"
+METRICS_JSON_PATH = "metrics.json"    # relatif à .scrapy/, écrit en fin de crawl
+
 # --- pipelines ---
 ITEM_PIPELINES = {
     "scrapping_immobli.pipelines.ValidationPipeline": 100,
     "scrapping_immobli.pipelines.DuplicatesPipeline": 200,
-   # "scrapping_immobli.pipelines.PostgreSQLPipeline": 300,
+    "scrapping_immobli.pipelines.NearDuplicatePipeline": 300,
+    "scrapping_immobli.pipelines.GeocodingPipeline": 400,
+    "scrapping_immobli.pipelines.SitePostgreSQLPipeline": 900,
+    "scrapping_immobli.pipelines.PriceHistoryPipeline": 950,
+    "scrapping_immobli.pipelines.MarketAggregatesPipeline": 960,
+    "scrapping_immobli.pipelines.SearchIndexPipeline": 970,
+}
+# pipeline de chaque site, partition de listings (spider absent = pas d'écriture en base)
+DB_PIPELINE_ROUTES = {
+   # "coinafrique_html": "scrapping_immobli.pipelines.PostgreSQLPipeline",
+   # "expat_dakar": "scrapping_immobli.pipelines.ExpatDakarPostgreSQLPipeline",
+    "loger_dakar": "scrapping_immobli.pipelines.LogerDakarPostgreSQLPipeline",
 }
 
 
@@ -43,4 +98,93 @@ DATABASE = {
     "password": "Fatimata05?",      
     "host": "localhost",
     "port": 5432,
-}
\ No newline at end of file
+}
+# --- Écriture groupée (COPY + fusion ON CONFLICT) ---
+DB_BATCH_SIZE = 500        # lignes par lot
+DB_FLUSH_INTERVAL = 5.0    # secondes max. d'attente d'une ligne en tampon
+DB_WRITE_THREADS = 2       # lots écrits en parallèle hors reactor (0 = dans le reactor) ; pool partagé par processus
+DB_MAX_PENDING_ROWS = 5000 # au-delà, les items attendent la base (contre-pression)
+DB_AUTO_MIGRATE = True     # migrations en attente appliquées à l'ouverture (sinon : erreur, lancer scrapy migrate)
+
+# --- Annonces quasi identiques entre sites (MinHash/LSH, cluster_id) ---
+NEAR_DUP_ENABLED = True
+NEAR_DUP_PATH = "near_duplicates.sqlite"  # relatif à .scrapy/
+NEAR_DUP_PERMUTATIONS = 64                # taille de la signature MinHash
+NEAR_DUP_BANDS = 16                       # bandes LSH (seuil ~ (1/16)^(1/4) = 0.5)
+NEAR_DUP_THRESHOLD = 0.6                  # similarité de texte estimée minimale
+NEAR_DUP_TOLERANCE = 0.1                  # écart relatif de prix / surface toléré
+NEAR_DUP_MAX_CANDIDATES = 50              # candidates vérifiées par annonce
+
+# --- Géocodage hors ligne (gazetteer local, data/gazetteer.csv) ---
+GEOCODER_ENABLED = True
+GEOCODER_GAZETTEER = None                      # CSV de remplacement (même format)
+GEOCODER_CACHE_PATH = "geocode_cache.sqlite"   # relatif à .scrapy/
+GEOCODER_LRU_SIZE = 10_000
+GEOCODER_FUZZY_CUTOFF = 0.85                   # similarité minimale du repli approché
+
+# --- Historique des prix (listing_observations, partitions mensuelles) ---
+PRICE_HISTORY_ENABLED = True
+
+# --- Agrégats de marché (market_aggregates, vue market_stats) ---
+MARKET_AGGREGATES_ENABLED = True
+
+# --- Recherche plein texte (listing_search, scrapy search) ---
+SEARCH_INDEX_ENABLED = True
+SEARCH_RANK_WINDOW = 1000              # correspondances les plus récentes classées par pertinence
+
+# --- Export Parquet (scrapy export) ---
+EXPORT_DIR = "exports"                 # source=<source>/scraped_date=<jour>/*.parquet
+EXPORT_CHUNK_ROWS = 50000              # lignes par paquet du curseur serveur (= row group)
+EXPORT_LAG = 60                        # secondes laissées au prochain export (lots en cours)
+
+# --- Annonces déjà vues (index persistant entre crawls) ---
+SEEN_INDEX_ENABLED = True
+SEEN_INDEX_PATH = "seen_urls.sqlite"     # relatif à .scrapy/
+SEEN_INDEX_CAPACITY = 1_000_000          # dimensionnement du filtre de Bloom
+SEEN_INDEX_ERROR_RATE = 0.001
+SEEN_INDEX_WARM_TABLES = []              # ex. ["listings"]
+SEEN_FILTER_MODE = "skip"                # "skip", "deprioritize" ou "off"
+SEEN_FILTER_CALLBACKS = ["parse_detail"]
+
+# --- Mode incrémental (scrapy crawl <spider> -a incremental=1) ---
+INCREMENTAL_STOP_PAGES = 2   # pages de listing consécutives sans nouveauté avant arrêt
+
+# --- Parsing des fiches dans un pool de processus (scrapping_immobli.parsepool) ---
+PARSE_POOL_ENABLED = False   # opt-in ; sinon parse_detail tourne dans le reactor
+PARSE_POOL_WORKERS = 0       # 0 = nombre de cœurs - 1
+PARSE_POOL_MAX_IN_FLIGHT = 0 # fiches envoyées et pas encore revenues ; 0 = 4 x workers
+PARSE_POOL_TIMEOUT = 30.0    # s ; au-delà, la fiche est parsée dans le reactor
+
+# --- Crawl long : mémoire bornée ---
+COMPACT_ITEMS = True         # items à __slots__ (items.record_class) plutôt que scrapy.Item
+MEMORY_STATS_INTERVAL = 60.0 # s ; stats memory/* (RSS, URL vues, items en cours) ; 0 = désactivé
+
+# --- Pagination des listings ---
+PAGINATION_MODE = "fanout"   # "fanout" (pages page=N en parallèle) ou "serial" (lien « Suivant »)
+PAGINATION_WINDOW = 8        # pages de listing demandées d'avance au-delà de la dernière page non vide
+DETAIL_PRIORITY = 100        # page de listing N : priorité -N ; ses fiches : DETAIL_PRIORITY - N
+
+# --- Revisite selon la fraîcheur (scrapping_immobli.freshness, scrapy freshness) ---
+FRESHNESS_ENABLED = True
+FRESHNESS_BUDGET = 200                  # fiches revisitées au plus par site et par crawl ; 0 = aucune
+FRESHNESS_SITE_BUDGETS = {}             # ex. {"loger_dakar": 50}
+FRESHNESS_PRIORITY = -20                # après les fiches découvertes et les 10 premières pages de listing
+FRESHNESS_TARGET = 0.5                  # revisite quand P(changement depuis la dernière visite) atteint 50 %
+FRESHNESS_PRIOR_CHANGES = 1.0           # a priori d'une annonce neuve : 1 changement...
+FRESHNESS_PRIOR_DAYS = 2.0              # ... en 2 jours
+FRESHNESS_MIN_INTERVAL = 12 * 3600      # s ; jamais revisitée plus souvent
+FRESHNESS_MAX_INTERVAL = 30 * 24 * 3600 # s ; toujours revisitée au moins aussi souvent
+
+# --- Points de reprise (scrapping_immobli.checkpoint, scrapy resume) ---
+SCHEDULER = "scrapping_immobli.checkpoint.CheckpointScheduler"
+CHECKPOINT_DIR = "checkpoints"   # relatif à .scrapy/ ; un journal par spider
+CHECKPOINT_INTERVAL = 30.0       # s entre deux ajouts au journal ; 0 = pas de journal
+CHECKPOINT_RESUME = False        # True : reprendre le journal existant (scrapy resume)
+
+# --- Frontière PostgreSQL partagée (scrapy workers / SCHEDULER=...PostgresScheduler) ---
+FRONTIER_LEASE_SECONDS = 300      # bail d'une requête prise par un worker
+FRONTIER_LEASE_BATCH = 16         # requêtes d'un même domaine prises d'un coup
+FRONTIER_INSERT_BATCH = 100       # requêtes découvertes insérées par lot
+FRONTIER_DOMAIN_DELAY = 0.5       # s entre deux requêtes d'un domaine, tous workers confondus
+FRONTIER_MAX_ATTEMPTS = 3         # baux expirés avant abandon (« failed »)
+FRONTIER_REVISIT_AFTER = 12 * 3600  # une requête terminée peut être ré-enfilée après ce délai
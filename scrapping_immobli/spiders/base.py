@@ -0,0 +1,332 @@
+import hashlib
+
+import scrapy
+from scrapy.utils.defer import maybe_deferred_to_future
+
+from scrapping_immobli import normalize
+from scrapping_immobli.items import record_class
+from scrapping_immobli.parsepool import ParsePool
+from scrapping_immobli.seen import SeenIndex
+
+
+def _as_bool(value):
+    return str(value).strip().lower() in ("1", "true", "yes", "oui", "on")
+
+
+def _page_signature(urls):
+    """Empreinte (16 octets) des annonces d'une page de listing, None si vide."""
+    if not urls:
+        return None
+    return hashlib.md5("\n".join(sorted(urls)).encode()).digest()
+
+
+class ImmoSpider(scrapy.Spider):
+    """
+    Base commune des spiders d'annonces : parcours des pages de listing,
+    pagination et mode incrémental.
+
+    Chaque site fournit ``listing_cards(response)`` (vignettes -> lien, prix
+    affiché, meta) et ``next_page(response)`` (lien « Suivant » ou None), et
+    décrit sa fiche par ``item_class`` + ``detail_schema`` (schéma compilé,
+    cf. scrapping_immobli.extraction) ; ``complete_item`` ajoute les champs
+    qui ne viennent pas de la page.
+
+    Pagination (``PAGINATION_MODE`` ou ``-a pagination=serial|fanout``) :
+
+    - ``serial`` : on suit le lien « Suivant » page après page ;
+    - ``fanout`` : les URL ``page=N`` sont générées directement
+      (``page_url``) et demandées par fenêtres de ``PAGINATION_WINDOW``
+      pages en parallèle ; la fenêtre avance à chaque page non vide et
+      s'arrête à la première page vide (404, redirection, aucune vignette,
+      ou page identique à une page déjà vue).
+
+    Mode incrémental (``scrapy crawl <spider> -a incremental=1``) :
+
+    - une vignette déjà en base dont le prix affiché n'a pas changé ne
+      déclenche pas de téléchargement de la fiche ;
+    - après INCREMENTAL_STOP_PAGES pages de listing consécutives sans
+      aucune annonce nouvelle, la pagination s'arrête.
+
+    Avec PARSE_POOL_ENABLED, les fiches sont parsées dans un pool de
+    processus (scrapping_immobli.parsepool) ; ``complete_item`` reste
+    appelé dans le reactor.
+
+    Avec COMPACT_ITEMS, les fiches sortent en items compacts (``__slots__``,
+    cf. items.record_class) plutôt qu'en ``scrapy.Item``.
+
+    Reprise après crash (scrapping_immobli.checkpoint) : la position de la
+    pagination est journalisée (``checkpoint_state``) ; un spider repris
+    (``resumed``) ne relit pas ``start_urls``, sa file vient du journal.
+
+    Priorités : la page de listing N a la priorité -N, une fiche trouvée
+    sur cette page DETAIL_PRIORITY - N ; les fiches récentes partent donc
+    avant les pages profondes, et les items arrivent aux pipelines dès la
+    première page. Les fiches à revisiter (scrapping_immobli.freshness)
+    passent par ``recrawl_request``.
+    """
+
+    def __init__(self, *args, incremental=False, pagination=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.incremental = _as_bool(incremental)
+        self.stop_after = None     # réglages lus par from_crawler (settings.py)
+        self.seen_index = None
+        self.known_pages_in_row = 0
+        self.pagination = pagination
+        self.window = None
+        # état du fan-out
+        self.next_page_number = 1
+        self.highest_full_page = 0
+        self.last_new_page = 0
+        self.first_empty_page = None
+        self.page_signatures = {}
+        self.parse_pool = None
+        self.compact_items = False
+        self.resumed = False
+        self.detail_priority = None
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.stop_after = crawler.settings.getint("INCREMENTAL_STOP_PAGES", 2)
+        spider.window = max(crawler.settings.getint("PAGINATION_WINDOW", 8), 1)
+        if spider.pagination is None:
+            spider.pagination = crawler.settings.get("PAGINATION_MODE", "fanout")
+        if spider.pagination == "fanout" and spider.page_url_template is None:
+            spider.pagination = "serial"
+        if spider.incremental:
+            if not crawler.settings.getbool("SEEN_INDEX_ENABLED"):
+                spider.logger.warning("[INCR] SEEN_INDEX_ENABLED=False : mode incrémental désactivé")
+                spider.incremental = False
+            else:
+                spider.seen_index = SeenIndex.from_crawler(crawler)
+        spider.compact_items = crawler.settings.getbool("COMPACT_ITEMS")
+        spider.detail_priority = crawler.settings.getint("DETAIL_PRIORITY", 100)
+        if crawler.settings.getbool("PARSE_POOL_ENABLED"):
+            spider.parse_pool = ParsePool.from_crawler(crawler)
+        return spider
+
+    # ------------------------------------------------------------------
+    # À fournir par chaque site
+    # ------------------------------------------------------------------
+    item_class = None
+    detail_schema = None
+    page_url_template = None  # ex. ".../immobilier?page={page}" (None : pas de fan-out)
+    RECRAWL_META = ()         # colonnes de ``listings`` repassées en meta aux fiches revisitées
+
+    def listing_cards(self, response):
+        """Itère sur ``(href, prix_affiché, meta)`` pour chaque vignette."""
+        raise NotImplementedError
+
+    def next_page(self, response):
+        raise NotImplementedError
+
+    def page_url(self, page):
+        """URL de la page de listing numéro ``page`` (mode fan-out)."""
+        return self.page_url_template.format(page=page)
+
+    def complete_item(self, values, response):
+        """Champs fixes ou transmis par le listing (meta)."""
+        return values
+
+    # ------------------------------------------------------------------
+    # POINT D'ENTRÉE
+    # ------------------------------------------------------------------
+    async def start(self):
+        # Scrapy >= 2.13 ; les versions antérieures appellent start_requests()
+        for request in self.start_requests():
+            yield request
+
+    def start_requests(self):
+        if self.resumed:
+            return
+        if self.pagination != "fanout":
+            for url in self.start_urls:
+                yield scrapy.Request(url, dont_filter=True)
+            return
+        first_window = min(self.window, self.stop_after) if self.incremental else self.window
+        yield from self._page_requests(first_window)
+
+    def _page_requests(self, upto):
+        """Demande les pages ``next_page_number`` .. ``upto`` (bornées par la 1re page vide)."""
+        if self.first_empty_page is not None:
+            upto = min(upto, self.first_empty_page - 1)
+        while self.next_page_number <= upto:
+            page = self.next_page_number
+            self.next_page_number += 1
+            yield scrapy.Request(
+                self.page_url(page), callback=self.parse, priority=-page,
+                meta={
+                    "page": page,
+                    # une page au-delà de la dernière revient en 404 ou en
+                    # redirection vers la page 1 : la traiter comme vide
+                    "dont_redirect": True,
+                    "handle_httpstatus_list": [301, 302, 303, 307, 308, 404, 410],
+                },
+            )
+
+    # ------------------------------------------------------------------
+    # PARSING DU LISTING
+    # ------------------------------------------------------------------
+    def parse(self, response):
+        """
+        Extrait les liens vers les annonces puis pagine.
+        """
+        page = response.meta.get("page")
+        if page is not None and response.status != 200:
+            yield from self._fanout(response, page, None, 0)
+            return
+
+        seen_on_page = set()
+        new_on_page = 0
+        # page N (priorité -N) -> fiches DETAIL_PRIORITY - N
+        priority = self.detail_priority + response.request.priority
+        for href, price_text, meta in self.listing_cards(response):
+            url = response.urljoin(href)
+            if url in seen_on_page:
+                continue
+            seen_on_page.add(url)
+
+            if self.incremental:
+                decision = self._card_decision(url, price_text)
+                self.crawler.stats.inc_value(f"incremental/{decision}")
+                if decision == "unchanged":
+                    continue
+                if decision == "new":
+                    new_on_page += 1
+                else:
+                    # prix modifié : la fiche doit passer le filtre des annonces
+                    # vues, et ne pas être servie périmée par le cache HTTP
+                    meta = dict(meta or {}, dont_skip_seen=True)
+                    yield response.follow(url, callback=self.parse_detail, meta=meta,
+                                          priority=priority,
+                                          headers={"Cache-Control": "no-cache"})
+                    continue
+
+            yield response.follow(url, callback=self.parse_detail, meta=meta, priority=priority)
+
+        if page is not None:
+            yield from self._fanout(response, page, seen_on_page, new_on_page)
+            return
+
+        if self.incremental and seen_on_page:
+            if new_on_page:
+                self.known_pages_in_row = 0
+            else:
+                self.known_pages_in_row += 1
+            if self.known_pages_in_row >= self.stop_after:
+                self.logger.info("[INCR] %d pages sans nouveauté, arrêt à %s",
+                                 self.known_pages_in_row, response.url)
+                self.crawler.stats.set_value("incremental/stopped_at", response.url)
+                return
+
+        next_link = self.next_page(response)
+        if next_link:
+            self.logger.debug("Suivant : %s", next_link)
+            yield response.follow(next_link, callback=self.parse,
+                                  priority=response.request.priority - 1)
+
+    def _fanout(self, response, page, urls, new_on_page):
+        """Met à jour les bornes connues après la page ``page`` et étend la fenêtre."""
+        stats = self.crawler.stats
+        stats.inc_value("pagination/pages")
+        signature = _page_signature(urls)
+        duplicate_of = self.page_signatures.get(signature)
+        if not signature or (duplicate_of is not None and duplicate_of != page):
+            stats.inc_value("pagination/empty")
+            if self.first_empty_page is None or page < self.first_empty_page:
+                self.first_empty_page = page
+                stats.set_value("pagination/last_page", page - 1)
+                self.logger.info("[PAGES] page %d vide (%s) : dernière page = %d",
+                                 page, response.status, page - 1)
+            return
+        self.page_signatures[signature] = page
+        self.highest_full_page = max(self.highest_full_page, page)
+
+        frontier = self.highest_full_page + self.window
+        if self.incremental:
+            if new_on_page:
+                self.last_new_page = max(self.last_new_page, page)
+            # pas de fenêtre au-delà de stop_after pages sans nouveauté
+            frontier = min(frontier, self.last_new_page + self.stop_after)
+        yield from self._page_requests(frontier)
+
+    def _card_decision(self, url, price_text):
+        """« new », « price_changed » ou « unchanged » pour une vignette."""
+        if url not in self.seen_index:
+            return "new"
+        card_price = normalize.price(price_text)
+        stored_price = self.seen_index.price_of(url)
+        if card_price is not None and stored_price is not None and card_price != stored_price:
+            return "price_changed"
+        return "unchanged"
+
+    # ------------------------------------------------------------------
+    # PAGE DÉTAIL
+    # ------------------------------------------------------------------
+    def parse_detail(self, response):
+        if self.parse_pool is not None and self.parse_pool.available:
+            return self._parse_detail_pooled(response)
+        values, missing = self._extract_inline(response)
+        return [self._detail_item(values, missing, response)]
+
+    async def _parse_detail_pooled(self, response):
+        try:
+            values, missing = await maybe_deferred_to_future(
+                self.parse_pool.extract(self, response.body, response.encoding)
+            )
+            self.crawler.stats.inc_value("parsepool/parsed")
+        except Exception as exc:
+            first = not self.crawler.stats.get_value("parsepool/fallback")
+            getattr(self.logger, "warning" if first else "debug")(
+                "[PARSE] pool indisponible (%r), parsing direct de %s", exc, response.url)
+            self.crawler.stats.inc_value("parsepool/fallback")
+            values, missing = self._extract_inline(response)
+        # coroutine (et non générateur asynchrone) : Scrapy attend la liste,
+        # les middlewares la reçoivent comme celle du parsing direct
+        return [self._detail_item(values, missing, response)]
+
+    def _extract_inline(self, response):
+        # depuis les octets : l'arbre lxml est libéré aussitôt, au lieu de
+        # rester en cache sur la réponse (response.selector) tant que l'item
+        # traverse les pipelines
+        return self.detail_schema.extract_html(response.body, response.encoding)
+
+    def _detail_item(self, values, missing, response):
+        for name in missing:
+            self.logger.debug("[%s] manquant sur %s", name.upper(), response.url)
+            if getattr(self, "crawler", None) is not None:
+                self.crawler.stats.inc_value(f"extraction/missing/{name}")
+        values["url"] = response.url
+        values["source"] = self.name
+        self.complete_item(values, response)
+        if self.compact_items:
+            return record_class(self.item_class)(values)
+        return self.item_class(values)
+
+    # ------------------------------------------------------------------
+    # REVISITE
+    # ------------------------------------------------------------------
+    def recrawl_request(self, url, meta, priority):
+        """
+        Fiche à revisiter (file de scrapping_immobli.freshness) : elle passe
+        le filtre des annonces vues et n'est pas servie périmée par le cache.
+        """
+        meta = dict(meta, dont_skip_seen=True)
+        return scrapy.Request(url, callback=self.parse_detail, meta=meta, priority=priority,
+                              headers={"Cache-Control": "no-cache"})
+
+    # ------------------------------------------------------------------
+    # POINTS DE REPRISE
+    # ------------------------------------------------------------------
+    CHECKPOINT_FIELDS = ("next_page_number", "highest_full_page", "last_new_page",
+                         "first_empty_page", "known_pages_in_row")
+
+    def checkpoint_state(self):
+        # page_signatures n'est pas journalisé : après reprise, une page
+        # identique à une page d'avant le crash coûte au plus une fenêtre
+        return {name: getattr(self, name) for name in self.CHECKPOINT_FIELDS}
+
+    def restore_checkpoint(self, state):
+        for name in self.CHECKPOINT_FIELDS:
+            if name in state:
+                setattr(self, name, state[name])
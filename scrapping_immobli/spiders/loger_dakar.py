@@ -1,30 +1,38 @@
-import scrapy, re
-from scrapy.loader import ItemLoader
+from scrapping_immobli import normalize
+from scrapping_immobli.extraction import Field, Schema
 from scrapping_immobli.items import ExpatDakarPropertyItem
-from itemloaders.processors import MapCompose, TakeFirst
+from scrapping_immobli.spiders.base import ImmoSpider
 
 
-def extract_first_digit(text):
-    if not text:
-        return None
-    m = re.search(r'\d+', text.strip())
-    return int(m.group(0)) if m else None
+# ----------------------------------------------------------------------
+# Fiche annonce : schéma compilé une fois au chargement du module
+# ----------------------------------------------------------------------
+DETAIL_SCHEMA = Schema(
+    Field("price", css="span.g5ere__lpp-price::text", post=normalize.price, required=True),
+    Field("adresse", css="li.address span::text"),
+    Field("city", css="li.city a::text"),
+    Field("region", css="li.state a::text"),
+    Field("description", css="div.g5ere__property-block-description *::text"),
+    # Chiffres
+    Field("bedrooms", css="span.g5ere__property-bedrooms::text", post=normalize.rooms),
+    Field("bathrooms", css="span.g5ere__property-bathrooms::text", post=normalize.rooms),
+    Field("surface_area", css="span.g5ere__loop-property-size::text", post=normalize.surface),
+    # IDs & types
+    Field("listing_id", css="span.g5ere__property-identity::text"),
+    Field("posted_time", css="div.g5ere__property-date span::text"),
+    Field("property_type", css="span.g5ere__property-type a::text"),
+    Field("statut", css="span.g5ere__property-status a::text"),
+)
 
 
-class LogerDakarSpider(scrapy.Spider):
+class LogerDakarSpider(ImmoSpider):
     name = "loger_dakar"
     allowed_domains = ["www.loger-dakar.com"]
     start_urls = ["https://www.loger-dakar.com/Bien/"]
+    page_url_template = "https://www.loger-dakar.com/Bien/page/{page}/"
+    RECRAWL_META = ("title",)  # le titre vient du listing, pas de la fiche
 
     custom_settings = {
-        "ITEM_PIPELINES": {
-            "scrapping_immobli.pipelines.ValidationPipeline": 300,
-            "scrapping_immobli.pipelines.DuplicatesPipeline": 400,
-            "scrapping_immobli.pipelines.LogerDakarPostgreSQLPipeline": 900,
-        },
-        "DOWNLOAD_DELAY": 1,
-        "CONCURRENT_REQUESTS": 16,
-        "ROBOTSTXT_OBEY": False,
         "DEFAULT_REQUEST_HEADERS": {
             "User-Agent": (
                 "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
@@ -37,52 +45,31 @@ class LogerDakarSpider(scrapy.Spider):
     }
 
     # ------------------------------------------------------------------
-    # 1) LISTING : toutes les fiches + pagination
+    # 1) LISTING : toutes les fiches + pagination (parcours : ImmoSpider.parse)
     # ------------------------------------------------------------------
-    def parse(self, response):
+    def listing_cards(self, response):
         # ✅ Vignettes d’annonces (vignette = <article> complet)
         for article in response.css('article.g5ere__property-item'):
             href = article.css('a.g5core__entry-thumbnail::attr(href)').get()
             title = article.css('a.g5core__entry-thumbnail::attr(title)').get()
             if href:
-                yield response.follow(
-                    href,
-                    callback=self.parse_detail,
-                    meta={"title": title}
-                )
+                yield href, article.css("span.g5ere__lpp-price::text").get(), {"title": title}
 
+    def next_page(self, response):
         # ✅ Pagination : bouton « Suivant »
-        next_page = response.css('a.next::attr(href)').get()
-        if next_page:
-            yield response.follow(next_page, callback=self.parse)
+        return response.css('a.next::attr(href)').get()
+
+    def page_url(self, page):
+        # /Bien/page/1/ redirige vers /Bien/
+        return self.start_urls[0] if page == 1 else super().page_url(page)
 
     # ------------------------------------------------------------------
-    # 2) DETAIL
+    # 2) DETAIL : DETAIL_SCHEMA (extraction : ImmoSpider.parse_detail)
     # ------------------------------------------------------------------
-    def parse_detail(self, response):
-        loader = ItemLoader(item=ExpatDakarPropertyItem(), response=response)
-
-        loader.add_value("title", response.meta.get("title"))
-        loader.add_css("price", "span.g5ere__lpp-price::text")
-        loader.add_css("adresse", "li.address span::text", TakeFirst())
-        loader.add_css("city", "li.city a::text", TakeFirst())
-        loader.add_css("region", "li.state a::text", TakeFirst())
-        loader.add_css("description", "div.g5ere__property-block-description *::text")
-
-        # Chiffres
-        loader.add_css("bedrooms", "span.g5ere__property-bedrooms::text", MapCompose(str.strip, extract_first_digit), TakeFirst())
-        loader.add_css("bathrooms", "span.g5ere__property-bathrooms::text", MapCompose(str.strip, extract_first_digit), TakeFirst())
-        loader.add_css("surface_area", "span.g5ere__loop-property-size::text",
-                       MapCompose(lambda x: re.search(r'(\d+)', x).group(1) if x else None, float))
-
-        # IDs & types
-        loader.add_css("listing_id", "span.g5ere__property-identity::text")
-        loader.add_css("posted_time", "div.g5ere__property-date span::text")
-        loader.add_css("property_type", "span.g5ere__property-type a::text")
-        loader.add_css("statut", "span.g5ere__property-status a::text")
-
-        loader.add_value("url", response.url)
-        loader.add_value("source", self.name)
-        loader.add_value("member_since", None)  # pas dispo
+    item_class = ExpatDakarPropertyItem
+    detail_schema = DETAIL_SCHEMA
 
-        yield loader.load_item()
\ No newline at end of file
+    def complete_item(self, values, response):
+        values["title"] = response.meta.get("title")
+        values["member_since"] = None  # pas dispo
+        return values
@@ -0,0 +1,144 @@
+"""
+Concurrence et délai adaptatifs par domaine (AIMD).
+
+Chaque domaine (slot du downloader Scrapy) a sa propre limite :
+
+- réponse rapide (latence EWMA <= ADAPTIVE_THROTTLE_TARGET_LATENCY) :
+  augmentation additive, ~+1 requête simultanée par « aller-retour »
+  complet, et délai réduit de 10 % ;
+- réponse lente : concurrence réduite de 10 %, délai porté à
+  latence / concurrence ;
+- 429 / 503 : diminution multiplicative (x DECREASE_FACTOR) et délai
+  doublé, ou ``Retry-After`` s'il est plus long ;
+- autre 5xx, timeout, connexion refusée : diminution multiplicative.
+
+Les limites apprises sont enregistrées en fin de crawl dans
+``.scrapy/throttle.json`` : le crawl suivant repart du rythme atteint au
+lieu de remonter depuis CONCURRENT_REQUESTS_PER_DOMAIN / DOWNLOAD_DELAY.
+Chaque crawl n'y réécrit que les domaines qu'il a contactés (``scrapy
+crawlall``, ``scrapy workers`` : un spider ne remet pas à l'état de son
+démarrage les limites apprises entre-temps par un autre).
+"""
+import fcntl
+import json
+import os
+import time
+
+
+class DomainState:
+    __slots__ = ("concurrency", "delay", "latency", "updated_at")
+
+    def __init__(self, concurrency, delay, latency=None, updated_at=None):
+        self.concurrency = float(concurrency)
+        self.delay = float(delay)
+        self.latency = latency
+        self.updated_at = updated_at
+
+    @property
+    def slot_concurrency(self):
+        return max(int(self.concurrency), 1)
+
+    def to_dict(self):
+        return {
+            "concurrency": round(self.concurrency, 2),
+            "delay": round(self.delay, 3),
+            "latency": None if self.latency is None else round(self.latency, 3),
+            "updated_at": self.updated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["concurrency"], data["delay"], data.get("latency"), data.get("updated_at"))
+
+
+class AIMDController:
+    """Règles d'ajustement ; renvoie la décision prise (« increase », « decrease », « backoff »…)."""
+
+    def __init__(self, min_concurrency=1, max_concurrency=16, min_delay=0.0, max_delay=60.0,
+                 target_latency=2.0, decrease_factor=0.5, smoothing=0.3):
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.target_latency = target_latency
+        self.decrease_factor = decrease_factor
+        self.smoothing = smoothing
+
+    def _bound(self, state):
+        state.concurrency = min(max(state.concurrency, self.min_concurrency), self.max_concurrency)
+        state.delay = min(max(state.delay, self.min_delay), self.max_delay)
+        state.updated_at = time.time()
+
+    def on_success(self, state, latency):
+        if latency is None:
+            return None
+        if state.latency is None:
+            state.latency = latency
+        else:
+            state.latency += self.smoothing * (latency - state.latency)
+
+        if state.latency <= self.target_latency:
+            state.concurrency += 1.0 / state.concurrency
+            state.delay *= 0.9
+            decision = "increase"
+        else:
+            state.concurrency *= 0.9
+            state.delay = max(state.delay, state.latency / state.concurrency)
+            decision = "slow"
+        self._bound(state)
+        return decision
+
+    def on_throttled(self, state, retry_after=None):
+        state.concurrency *= self.decrease_factor
+        state.delay = max(state.delay * 2 or 1.0, retry_after or 0.0)
+        self._bound(state)
+        return "backoff"
+
+    def on_error(self, state):
+        state.concurrency *= self.decrease_factor
+        state.delay = state.delay * 1.5 or 0.5
+        self._bound(state)
+        return "decrease"
+
+
+class ThrottleStateStore:
+    """
+    Limites par domaine, en JSON. ``save`` relit le fichier et n'y remplace
+    que les domaines donnés, sous verrou (fcntl) et en écriture atomique.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        return {key: DomainState.from_dict(value) for key, value in self._read().items()}
+
+    def _read(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def save(self, states):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(f"{self.path}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            data = self._read()
+            data.update((key, state.to_dict()) for key, state in states.items())
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(dict(sorted(data.items())), f, indent=2)
+            os.replace(tmp, self.path)
+
+
+def retry_after(response):
+    """Valeur en secondes de l'en-tête Retry-After (les dates HTTP sont ignorées)."""
+    value = response.headers.get(b"Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value.decode("latin-1").strip()), 0.0)
+    except ValueError:
+        return None